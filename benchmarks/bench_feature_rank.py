@@ -0,0 +1,40 @@
+"""
+Benchmarks feature row lookup for select_feature.
+
+Compares get_feature_rank with the sorted fid list it replaced. The sorted
+list is only timed up to a few million features, where it already takes
+seconds per click.
+
+Usage:
+    python benchmarks/bench_feature_rank.py
+"""
+import random
+import timeit
+from tethysapp.hydroshare_data_viewer.features import get_feature_rank
+
+LAYER_COUNTS = (10, 10 ** 3, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 9, 10 ** 12)
+SORTED_LIST_LIMIT = 10 ** 6
+
+
+def sorted_list_rank(fid, layer_count):
+    fid_list = [str(i) for i in range(1, layer_count + 1)]
+    fid_list.sort()
+    return fid_list.index(fid)
+
+
+def main():
+    random.seed(0)
+    print(f"{'layer_count':>15}  {'get_feature_rank':>18}  {'sorted list':>14}")
+    for layer_count in LAYER_COUNTS:
+        fids = [str(random.randint(1, layer_count)) for _ in range(100)]
+        rank_time = timeit.timeit(lambda: [get_feature_rank(fid, layer_count) for fid in fids], number=10) / 1000
+        if layer_count <= SORTED_LIST_LIMIT:
+            list_time = timeit.timeit(lambda: sorted_list_rank(fids[0], layer_count), number=1)
+            list_result = f"{list_time * 1e3:11.3f} ms"
+        else:
+            list_result = f"{'-':>14}"
+        print(f"{layer_count:>15}  {rank_time * 1e6:15.3f} us  {list_result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Fixture documents for the benchmarks.
+
+The documents in fixtures/ have the shape of real HydroShare GeoServer and
+HydroServer responses. Large inputs are built by repeating their layers,
+fields, values, or features, so no large files need to be stored.
+"""
+import copy
+import json
+import os
+from datetime import datetime, timedelta
+from lxml import etree
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+WFS_NS = "{http://www.opengis.net/wfs}"
+WCS_NS = "{http://www.opengis.net/wcs/1.1.1}"
+XSD_NS = "{http://www.w3.org/2001/XMLSchema}"
+WATERML_NS = "{http://www.cuahsi.org/waterML/1.1/}"
+
+FIELD_TYPES = ("xsd:long", "xsd:string", "xsd:double", "xsd:int", "xsd:string")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_PATH, name), "rb") as fixture_file:
+        return fixture_file.read()
+
+
+def repeat_element(name, tag, count, update):
+    """
+    Repeats the first element with a tag count times in a fixture document.
+
+    update(element, i) is called on the i-th copy. A count of 0 removes the
+    element. Returns the document as bytes.
+    """
+
+    root = etree.fromstring(load_fixture(name))
+    element = next(root.iter(tag))
+    if count == 0:
+        element.getparent().remove(element)
+    last = element
+    for i in range(1, count):
+        element_copy = copy.deepcopy(element)
+        update(element_copy, i)
+        last.addnext(element_copy)
+        last = element_copy
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8")
+
+
+def wfs_capabilities(layer_count):
+    def update(feature_type, i):
+        feature_type.find(f"{WFS_NS}Name").text += f"_{i}"
+        feature_type.find(f"{WFS_NS}Title").text += f"_{i}"
+    return repeat_element("wfs_capabilities.xml", f"{WFS_NS}FeatureType", layer_count, update)
+
+
+def wcs_capabilities(layer_count):
+    def update(coverage_summary, i):
+        coverage_summary.find(f"{WCS_NS}Identifier").text += f"_{i}"
+    return repeat_element("wcs_capabilities.xml", f"{WCS_NS}CoverageSummary", layer_count, update)
+
+
+def describe_feature_type(field_count):
+    def update(element, i):
+        element.set("name", f"FIELD_{i}")
+        element.set("type", FIELD_TYPES[i % len(FIELD_TYPES)])
+    root = etree.fromstring(load_fixture("describe_feature_type.xml"))
+    sequence = next(root.iter(f"{XSD_NS}sequence"))
+    for element in list(sequence)[2:]:
+        sequence.remove(element)
+    template = sequence[1]
+    for i in range(1, field_count):
+        element_copy = copy.deepcopy(template)
+        update(element_copy, i)
+        sequence.append(element_copy)
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8")
+
+
+def waterml_values(value_count):
+    """
+    Builds a WaterML document with value_count 15 minute values.
+    """
+
+    content = load_fixture("waterml_values.xml").decode("utf-8")
+    start = content.index("<value ")
+    end = content.index("</value>", start) + len("</value>")
+    value = content[start:end]
+    first_time = datetime(2018, 1, 1)
+    values = "\n      ".join(
+        value.replace(
+            'dateTime="2018-01-01T00:00:00"',
+            f'dateTime="{(first_time + timedelta(minutes=15 * i)).isoformat()}"'
+        ).replace(">2.31<", f">{-9999 if i % 97 == 0 else round(2 + (i % 1000) / 100, 2)}<")
+        for i in range(value_count)
+    )
+    return (content[:start] + values + content[end:]).encode("utf-8")
+
+
+def wfs_features(feature_count, start=0):
+    """
+    Builds a WFS GetFeature GeoJSON page with feature_count features.
+    """
+
+    collection = json.loads(load_fixture("wfs_features.json"))
+    template = collection["features"][0]
+    features = []
+    for i in range(start, start + feature_count):
+        feature = copy.deepcopy(template)
+        feature["id"] = f"Logan_River_Watershed_Streams.{i + 1}"
+        feature["properties"]["OBJECTID"] = i + 1
+        feature["properties"]["LENGTHKM"] = round(0.1 + (i % 500) / 100, 3)
+        features.append(feature)
+    collection["features"] = features
+    collection["totalFeatures"] = collection["numberMatched"] = collection["numberReturned"] = feature_count
+    return json.dumps(collection).encode("utf-8")
@@ -0,0 +1,329 @@
+"""
+Load test for the app's ajax endpoints.
+
+Replays user sessions against a running Tethys Portal with a number of
+concurrent virtual users, then reports the p50, p95, and p99 latency,
+throughput, and error count of each endpoint. A session pages through the
+discover table, opens a resource, loads the attribute table and field
+statistics of its vector layers, clicks a feature, and plots a time series.
+Resources and time series sites are picked with a Zipf distribution, so a
+few popular ones are opened far more often than the rest.
+
+Run the portal with the app's upstream URL settings pointed at
+mock_upstream.py to control upstream latency and errors.
+
+Usage:
+    python benchmarks/mock_upstream.py --port 8001 --latency 80 --jitter 40
+    python benchmarks/load_test.py http://localhost:8000 --concurrency 20 --duration 60
+    python benchmarks/load_test.py http://localhost:8000 --concurrency 50 --save results.json
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from bisect import bisect
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from urllib.parse import urlencode
+import requests
+
+APP_PATH = "/apps/hydroshare-data-viewer"
+DISCOVER_PAGE_SIZE = 20
+TABLE_PAGE_SIZE = 10
+TILE_EXTENT = 20037508.342789244
+
+zipf_weights = {}
+
+
+class LoadTestResults:
+    """
+    Latencies and errors of the requests made by all virtual users.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds, error):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if error:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, duration):
+        summary = {}
+        with self.lock:
+            for endpoint, latencies in sorted(self.latencies.items()):
+                latencies = sorted(latencies)
+                summary[endpoint] = {
+                    "requests": len(latencies),
+                    "errors": self.errors.get(endpoint, 0),
+                    "throughput": len(latencies) / duration,
+                    "p50": get_percentile(latencies, 50),
+                    "p95": get_percentile(latencies, 95),
+                    "p99": get_percentile(latencies, 99),
+                    "max": latencies[-1]
+                }
+        return summary
+
+
+def get_percentile(sorted_values, percentile):
+    """
+    Gets a percentile of sorted values with the nearest rank method.
+    """
+
+    rank = max(1, -(-len(sorted_values) * percentile // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def get_zipf_index(count, exponent):
+    """
+    Picks an index from 0 to count - 1 with a Zipf distribution.
+    """
+
+    cum_weights = zipf_weights.get((count, exponent))
+    if cum_weights is None:
+        cum_weights = zipf_weights[(count, exponent)] = list(accumulate(1 / (i + 1) ** exponent for i in range(count)))
+    return bisect(cum_weights, random.random() * cum_weights[-1])
+
+
+class VirtualUser:
+    """
+    A user replaying sessions against the portal with its own HTTP session.
+    """
+
+    def __init__(self, options, results):
+        self.options = options
+        self.results = results
+        self.session = requests.Session()
+        self.session.headers["X-Requested-With"] = "XMLHttpRequest"
+        for cookie in options.cookie:
+            name, _, value = cookie.partition("=")
+            self.session.cookies.set(name, value)
+        self.csrf_token = None
+
+    def get_csrf_token(self):
+        if "csrftoken" not in self.session.cookies:
+            self.session.get(f"{self.options.portal_url}{APP_PATH}/", timeout=self.options.timeout)
+        return self.session.cookies.get("csrftoken", "")
+
+    def post(self, endpoint, data):
+        """
+        Posts to an ajax endpoint and records the request.
+
+        Returns the JSON response, or None if the request failed.
+        """
+
+        if self.csrf_token is None:
+            self.csrf_token = self.get_csrf_token()
+        url = f"{self.options.portal_url}{APP_PATH}/ajax/{endpoint}/"
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                url,
+                data=data,
+                headers={"X-CSRFToken": self.csrf_token, "Referer": url},
+                timeout=self.options.timeout
+            )
+            result = response.json() if response.ok else None
+        except (requests.RequestException, ValueError):
+            result = None
+        self.results.add(endpoint, time.perf_counter() - start, result is None or "error" in result)
+        if self.options.think_time:
+            time.sleep(random.expovariate(1000 / self.options.think_time))
+        return result
+
+    def run_session(self):
+        """
+        Replays one session of a user browsing a resource.
+        """
+
+        options = self.options
+        resource_index = get_zipf_index(options.resources, options.zipf_exponent)
+
+        # Discover
+        discover_table = self.post("update-discover-table", {
+            "draw": 1,
+            "searchValue": "",
+            "start": 0,
+            "length": DISCOVER_PAGE_SIZE
+        })
+        if resource_index >= DISCOVER_PAGE_SIZE:
+            discover_table = self.post("update-discover-table", {
+                "draw": 2,
+                "searchValue": "",
+                "start": resource_index // DISCOVER_PAGE_SIZE * DISCOVER_PAGE_SIZE,
+                "length": DISCOVER_PAGE_SIZE
+            })
+        if not discover_table or not discover_table["data"]:
+            return
+        rows = discover_table["data"]
+        resource_id = rows[resource_index % DISCOVER_PAGE_SIZE % len(rows)][2]
+
+        # Open Resource
+        resource = self.post("get-resource-metadata", {"resourceId": resource_id})
+        if not resource:
+            return
+
+        for layer in resource["layerList"]:
+            field_names = [i["fieldName"] for i in layer["layerFields"]]
+            if layer["layerType"] in ("point", "line", "polygon"):
+                self.browse_vector_layer(layer, field_names)
+            elif layer["layerType"] == "timeseries":
+                self.plot_timeseries(layer)
+
+    def browse_vector_layer(self, layer, field_names):
+        table_query = {
+            "layer_code": layer["layerCode"],
+            "layer_fields[]": field_names,
+            "layer_field_types[]": [i["fieldType"] for i in layer["layerFields"]],
+            "length": TABLE_PAGE_SIZE,
+            "search[value]": ""
+        }
+
+        # Attribute Table
+        self.post("update-attribute-table", dict(table_query, draw=1, start=0))
+        if random.random() < 0.5:
+            self.post("update-attribute-table", dict(table_query, draw=2, start=TABLE_PAGE_SIZE))
+        if random.random() < 0.3 and field_names:
+            self.post("update-attribute-table", dict(table_query, **{
+                "draw": 3,
+                "start": 0,
+                "search[value]": "Logan",
+                "order[0][column]": 2,
+                "order[0][dir]": "desc"
+            }))
+
+        # Symbology
+        self.post("get-layer-field-statistics", {"layer_code": layer["layerCode"]})
+
+        # Feature Click
+        self.post("select-feature", {
+            "feature_url": self.get_feature_info_url(layer["layerCode"]),
+            "field_list": json.dumps({"fields": layer["layerFields"]}),
+            "layer_code": layer["layerCode"]
+        })
+
+    def plot_timeseries(self, layer):
+        site_index = get_zipf_index(self.options.sites, self.options.zipf_exponent)
+        self.post("get-timeseries-data", {
+            "layer_code": layer["layerCode"],
+            "site_code": f"site-{site_index}",
+            "var_code": "WaterTemp_EXO",
+            "site_name": f"Site {site_index}",
+            "var_name": "Temperature",
+            "max_points": self.options.max_points
+        })
+
+    def get_feature_info_url(self, layer_code):
+        """
+        Gets the WMS GetFeatureInfo URL the map sends for a click at a random
+        point of a tile.
+        """
+
+        tile_extent = TILE_EXTENT / 2 ** 11
+        min_x, min_y = random.uniform(-TILE_EXTENT, TILE_EXTENT - tile_extent), random.uniform(-TILE_EXTENT, TILE_EXTENT - tile_extent)
+        params = {
+            "SERVICE": "WMS",
+            "VERSION": "1.3.0",
+            "REQUEST": "GetFeatureInfo",
+            "LAYERS": layer_code,
+            "QUERY_LAYERS": layer_code,
+            "INFO_FORMAT": "application/json",
+            "CRS": "EPSG:3857",
+            "BBOX": f"{min_x},{min_y},{min_x + tile_extent},{min_y + tile_extent}",
+            "WIDTH": 256,
+            "HEIGHT": 256,
+            "I": random.randrange(256),
+            "J": random.randrange(256)
+        }
+        return f"{self.options.geoserver_url}/wms?{urlencode(params)}"
+
+    def run(self, deadline, session_counter):
+        while time.monotonic() < deadline and session_counter.take():
+            self.run_session()
+
+
+class SessionCounter:
+    """
+    Hands out a limited number of sessions to the virtual users.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            if self.sessions is None:
+                return True
+            if self.sessions <= 0:
+                return False
+            self.sessions -= 1
+            return True
+
+
+def format_milliseconds(seconds):
+    return f"{seconds * 1000:.0f}"
+
+
+def print_summary(summary, duration, concurrency):
+    print(f"{concurrency} users, {duration:.1f} s")
+    print(f"{'endpoint':<28}{'requests':>10}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, stats in summary.items():
+        print(
+            f"{endpoint:<28}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput']:>8.1f}"
+            f"{format_milliseconds(stats['p50']):>9}{format_milliseconds(stats['p95']):>9}"
+            f"{format_milliseconds(stats['p99']):>9}{format_milliseconds(stats['max']):>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the app's ajax endpoints.")
+    parser.add_argument("portal_url", help="base URL of the Tethys Portal, e.g. http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=10, help="number of virtual users (default 10)")
+    parser.add_argument("--duration", type=float, default=60, help="test duration in seconds (default 60)")
+    parser.add_argument("--sessions", type=int, help="stop after this many sessions")
+    parser.add_argument("--think-time", type=float, default=0, help="mean pause between requests in milliseconds")
+    parser.add_argument("--resources", type=int, default=1000, help="number of resources to pick from (default 1000)")
+    parser.add_argument("--sites", type=int, default=100, help="number of time series sites to pick from (default 100)")
+    parser.add_argument("--zipf-exponent", type=float, default=1.0, help="popularity skew of resources and sites (default 1.0)")
+    parser.add_argument("--max-points", type=int, default=2000, help="points per time series plot (default 2000)")
+    parser.add_argument("--geoserver-url", default="http://127.0.0.1:8001/geoserver",
+                        help="GeoServer URL used in feature click requests (default http://127.0.0.1:8001/geoserver)")
+    parser.add_argument("--cookie", action="append", default=[], metavar="NAME=VALUE",
+                        help="cookie sent with every request, e.g. a sessionid if the portal requires login")
+    parser.add_argument("--timeout", type=float, default=120, help="request timeout in seconds (default 120)")
+    parser.add_argument("--seed", type=int, help="random seed")
+    parser.add_argument("--save", help="save the results as a JSON file")
+    options = parser.parse_args()
+    options.portal_url = options.portal_url.rstrip("/")
+
+    if options.seed is not None:
+        random.seed(options.seed)
+
+    results = LoadTestResults()
+    session_counter = SessionCounter(options.sessions)
+    users = [VirtualUser(options, results) for _ in range(options.concurrency)]
+    start = time.monotonic()
+    deadline = start + options.duration
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        for future in [executor.submit(user.run, deadline, session_counter) for user in users]:
+            future.result()
+    duration = time.monotonic() - start
+
+    summary = results.summary(duration)
+    print_summary(summary, duration, options.concurrency)
+    if options.save:
+        with open(options.save, "w") as results_file:
+            json.dump({
+                "concurrency": options.concurrency,
+                "duration": duration,
+                "endpoints": summary
+            }, results_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Stand-in HydroShare, GeoServer, and HydroServer services for load tests.
+
+Serves the upstream requests made by the app from the fixture documents:
+the HydroShare resource list and system metadata, GeoServer WFS, WCS, WMS,
+and REST requests, and HydroServer WOF values. Every resource has the same
+vector, raster, and time series layers. Responses are delayed by a fixed
+latency plus an exponentially distributed jitter, so a few responses are
+much slower than the rest, and a share of responses can be replaced by
+errors.
+
+Point the app's HydroShare URL setting at http://HOST:PORT, its GeoServer
+URL at http://HOST:PORT/geoserver, and its HydroServer URL at
+http://HOST:PORT/wds.
+
+Usage:
+    python benchmarks/mock_upstream.py --port 8001
+    python benchmarks/mock_upstream.py --latency 80 --jitter 40 --error-rate 0.01
+    python benchmarks/mock_upstream.py --endpoint-latency geoserver.wfs_getcapabilities=2000
+"""
+import argparse
+import functools
+import hashlib
+import json
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+import fixtures
+from tethysapp.hydroshare_data_viewer.metrics import get_endpoint_name
+
+TEMPLATE_NAMESPACE = "HS-2b5a4bc1ab694a4f9a4c1a5b1b3c8e7d"
+
+# 1x1 transparent PNG
+PNG_TILE = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+
+sysmeta_pattern = re.compile(r"^/hsapi/resource/([0-9a-f]+)/sysmeta/?$")
+resource_list_pattern = re.compile(r"^/hsapi/resource/?$")
+rest_layer_pattern = re.compile(r"^/geoserver/rest/layers/(.+)\.json$")
+rest_styles_pattern = re.compile(r"^/geoserver/rest/styles(?:/([^/.]+)(?:\.sld)?|\.json)?$")
+values_pattern = re.compile(r"^/wds/wof/([^/]+)/(.+)/values/?$")
+
+
+def get_resource_id(index):
+    return hashlib.md5(f"resource-{index}".encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def get_resource_index(resource_count):
+    return {get_resource_id(i): i for i in range(resource_count)}
+
+
+def get_date_last_updated(index):
+    return (datetime(2019, 6, 12) + timedelta(minutes=index)).isoformat() + "Z"
+
+
+def set_namespace(content, namespace):
+    return content.replace(TEMPLATE_NAMESPACE.encode(), namespace.encode())
+
+
+@functools.lru_cache(maxsize=1024)
+def wfs_capabilities(namespace, layer_count):
+    return set_namespace(fixtures.wfs_capabilities(layer_count), namespace)
+
+
+@functools.lru_cache(maxsize=1024)
+def wcs_capabilities(namespace, layer_count):
+    return set_namespace(fixtures.wcs_capabilities(layer_count), namespace)
+
+
+@functools.lru_cache(maxsize=1)
+def describe_feature_type():
+    return fixtures.load_fixture("describe_feature_type.xml")
+
+
+@functools.lru_cache(maxsize=1)
+def describe_coverage():
+    return fixtures.load_fixture("describe_coverage.xml")
+
+
+@functools.lru_cache(maxsize=256)
+def wfs_features(feature_count, start):
+    return fixtures.wfs_features(feature_count, start)
+
+
+@functools.lru_cache(maxsize=16)
+def waterml_values(value_count):
+    return fixtures.waterml_values(value_count)
+
+
+@functools.lru_cache(maxsize=16)
+def ascii_grid(width, height):
+    """
+    Builds an ESRI ASCII grid of a sloping surface with a no data border.
+    """
+
+    lines = [
+        f"NCOLS {width}",
+        f"NROWS {height}",
+        "XLLCORNER 430365.0",
+        "YLLCORNER 4604355.0",
+        "CELLSIZE 30.0",
+        "NODATA_VALUE -9999"
+    ]
+    for row in range(height):
+        lines.append(" ".join(
+            "-9999" if row in (0, height - 1) or column in (0, width - 1) else str(1300 + row + column)
+            for column in range(width)
+        ))
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+class MockUpstreamHandler(BaseHTTPRequestHandler):
+    """
+    Handles requests to the stand-in upstream services.
+
+    The server's options are read from self.server.options.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        content_length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(content_length).decode("utf-8") if content_length else ""
+        self.handle_request(dict(parse_qsl(body)) if "urlencoded" in self.headers.get("Content-Type", "") else {})
+
+    def do_DELETE(self):
+        self.handle_request()
+
+    def handle_request(self, form=None):
+        options = self.server.options
+        url_parts = urlsplit(self.path)
+        query = {key.lower(): value for key, value in parse_qsl(url_parts.query)}
+        query.update({key.lower(): value for key, value in (form or {}).items()})
+
+        endpoint = get_endpoint_name(self.path, form)
+        delay = options.endpoint_latency.get(endpoint, options.latency) / 1000
+        if options.jitter:
+            delay += random.expovariate(1000 / options.jitter)
+        time.sleep(delay)
+
+        if random.random() < options.error_rate:
+            self.send_body(options.error_status, b"Injected error", "text/plain")
+            return
+
+        try:
+            status, body, content_type = self.get_response(url_parts.path, query)
+        except (KeyError, ValueError) as e:
+            status, body, content_type = 400, f"Bad request: {e}".encode(), "text/plain"
+        self.send_body(status, body, content_type)
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def get_response(self, path, query):
+        """
+        Gets the status, body, and content type of a response.
+        """
+
+        options = self.server.options
+
+        if resource_list_pattern.match(path):
+            return self.get_resource_list(query)
+
+        match = sysmeta_pattern.match(path)
+        if match:
+            if match.group(1) not in get_resource_index(options.resources):
+                return 404, b'{"detail": "Not found."}', "application/json"
+            return 200, json.dumps(self.get_sysmeta(match.group(1))).encode(), "application/json"
+
+        match = rest_layer_pattern.match(path)
+        if match:
+            layer = {"layer": {"name": match.group(1), "defaultStyle": {"name": "line"}}}
+            return 200, json.dumps(layer).encode(), "application/json"
+
+        match = rest_styles_pattern.match(path)
+        if match:
+            return self.get_styles_response(match.group(1), query)
+
+        match = values_pattern.match(path)
+        if match:
+            value_count = 0 if query.get("start_date") else options.values
+            return 200, waterml_values(value_count), "text/xml"
+
+        service_path = path.rstrip("/").rsplit("/", 1)[-1]
+        request_name = query.get("request", "").lower()
+        if service_path == "wfs":
+            return self.get_wfs_response(request_name, query)
+        if service_path == "wcs":
+            return self.get_wcs_response(request_name, query)
+        if service_path == "wms":
+            if request_name == "getfeatureinfo":
+                feature_index = int(hashlib.md5(self.path.encode()).hexdigest(), 16) % options.features
+                return 200, wfs_features(1, feature_index), "application/json"
+            return 200, PNG_TILE, "image/png"
+
+        return 404, b"Not found", "text/plain"
+
+    def get_styles_response(self, style_name, query):
+        """
+        Registers, lists, and deletes styles like the GeoServer REST API.
+        """
+
+        styles = self.server.styles
+        if self.command == "POST":
+            styles.add(query["name"])
+            return 201, b"", "text/plain"
+        if self.command == "DELETE":
+            styles.discard(style_name)
+            return 200, b"", "text/plain"
+        if style_name is None:
+            style_list = {"styles": {"style": [{"name": name} for name in sorted(styles)]} if styles else ""}
+            return 200, json.dumps(style_list).encode(), "application/json"
+        return (200 if style_name in styles else 404), b"", "application/vnd.ogc.sld+xml"
+
+    def get_resource_list(self, query):
+        options = self.server.options
+        count = int(query.get("count", 100))
+        page = int(query.get("page", 1))
+        resource_count = options.resources // 10 if query.get("full_text_search") else options.resources
+        results = [{
+            "resource_type": "CompositeResource",
+            "resource_title": f"Load test resource {i}",
+            "resource_id": get_resource_id(i),
+            "date_last_updated": get_date_last_updated(i)
+        } for i in range((page - 1) * count, min(page * count, resource_count))]
+        if not results and page > 1:
+            return 404, b'{"detail": "Invalid page."}', "application/json"
+        return 200, json.dumps({"count": resource_count, "results": results}).encode(), "application/json"
+
+    def get_sysmeta(self, resource_id):
+        index = get_resource_index(self.server.options.resources)[resource_id]
+        return {
+            "resource_id": resource_id,
+            "resource_title": f"Load test resource {index}",
+            "resource_type": "CompositeResource",
+            "resource_url": f"http://www.hydroshare.org/resource/{resource_id}/",
+            "abstract": "Stand-in resource for load tests.",
+            "creator": "HydroShare Data Viewer",
+            "date_created": "2019-06-12T21:41:07.810Z",
+            "date_last_updated": get_date_last_updated(index),
+            "public": True,
+            "discoverable": True,
+            "coverages": [{
+                "type": "box",
+                "value": {
+                    "northlimit": 42.10102081298828,
+                    "southlimit": 41.58816909790039,
+                    "eastlimit": -111.37847137451172,
+                    "westlimit": -111.85019226074219
+                }
+            }]
+        }
+
+    def get_wfs_response(self, request_name, query):
+        options = self.server.options
+        if request_name == "getcapabilities":
+            namespace = query["namespace"]
+            layer_count = options.timeseries_layers if namespace.startswith("TS-") else options.vector_layers
+            return 200, wfs_capabilities(namespace, layer_count), "text/xml"
+        if request_name == "describefeaturetype":
+            return 200, describe_feature_type(), "text/xml"
+        if request_name == "getfeature":
+            feature_count = options.features // 10 if query.get("cql_filter") else options.features
+            if query.get("resulttype") == "hits":
+                return 200, (
+                    '<?xml version="1.0" encoding="UTF-8"?><wfs:FeatureCollection '
+                    f'xmlns:wfs="http://www.opengis.net/wfs" numberOfFeatures="{feature_count}" '
+                    'timeStamp="2019-06-12T21:41:07.810Z"/>'
+                ).encode(), "text/xml"
+            start = int(query.get("startindex", 0))
+            count = int(query.get("count") or query.get("maxfeatures") or feature_count)
+            return 200, wfs_features(max(0, min(count, feature_count - start)), start), "application/json"
+        return 400, b"Unsupported WFS request", "text/plain"
+
+    def get_wcs_response(self, request_name, query):
+        if request_name == "getcapabilities":
+            return 200, wcs_capabilities(query["namespace"], self.server.options.raster_layers), "text/xml"
+        if request_name == "describecoverage":
+            return 200, describe_coverage(), "text/xml"
+        if request_name == "getcoverage":
+            return 200, ascii_grid(int(query["width"]), int(query["height"])), "text/plain"
+        return 400, b"Unsupported WCS request", "text/plain"
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+
+class MockUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, server_address, options):
+        self.options = options
+        self.styles = set()
+        super().__init__(server_address, MockUpstreamHandler)
+
+
+def parse_endpoint_latency(value):
+    endpoint, _, latency = value.partition("=")
+    return endpoint, float(latency)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Stand-in HydroShare, GeoServer, and HydroServer services.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=50, help="response latency in milliseconds (default 50)")
+    parser.add_argument("--jitter", type=float, default=20, help="mean extra latency in milliseconds (default 20)")
+    parser.add_argument("--endpoint-latency", type=parse_endpoint_latency, action="append", default=[],
+                        metavar="ENDPOINT=MS", help="latency of one endpoint, e.g. geoserver.wfs_getcapabilities=2000")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of responses replaced by errors")
+    parser.add_argument("--error-status", type=int, default=503, help="status of injected errors (default 503)")
+    parser.add_argument("--resources", type=int, default=1000, help="number of resources (default 1000)")
+    parser.add_argument("--vector-layers", type=int, default=3, help="vector layers per resource (default 3)")
+    parser.add_argument("--raster-layers", type=int, default=1, help="raster layers per resource (default 1)")
+    parser.add_argument("--timeseries-layers", type=int, default=1, help="time series layers per resource (default 1)")
+    parser.add_argument("--features", type=int, default=20000, help="features per vector layer (default 20000)")
+    parser.add_argument("--values", type=int, default=50000, help="values per time series (default 50000)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    return parser
+
+
+def main():
+    options = get_parser().parse_args()
+    options.endpoint_latency = dict(options.endpoint_latency)
+    server = MockUpstreamServer((options.host, options.port), options)
+    base_url = f"http://{options.host}:{options.port}"
+    print(f"HydroShare URL:  {base_url}")
+    print(f"GeoServer URL:   {base_url}/geoserver")
+    print(f"HydroServer URL: {base_url}/wds")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
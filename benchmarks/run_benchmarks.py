@@ -0,0 +1,226 @@
+"""
+Benchmarks the parsing and transformation hot paths.
+
+Runs each case at several input sizes on fixture documents, without
+network access, and reports the time per call and the peak memory used by
+a single call. Results can be saved as a baseline and later runs compared
+against it; cases slower than the baseline by more than the threshold are
+reported as regressions and make the run exit with status 1.
+
+Peak memory is measured in a new interpreter for each case as the growth
+of its peak resident set size, so memory allocated by lxml and numpy is
+included. Where /proc is not available, only Python allocations are
+counted.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --filter waterml --repeat 3
+    python benchmarks/run_benchmarks.py --save benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import timeit
+import tracemalloc
+from io import BytesIO
+import fixtures
+from tethysapp.hydroshare_data_viewer.features import get_feature_rank, build_table_rows
+from tethysapp.hydroshare_data_viewer.ows import parse_wfs_capabilities, parse_wcs_capabilities, \
+    parse_feature_type_fields, get_layer_coverage
+from tethysapp.hydroshare_data_viewer.timeseries import parse_waterml
+
+
+def wfs_capabilities(size):
+    content = fixtures.wfs_capabilities(size)
+
+    def run():
+        return [get_layer_coverage("vector", layer_response) for layer_code, layer_response in parse_wfs_capabilities(content)]
+    return run
+
+
+def wcs_capabilities(size):
+    content = fixtures.wcs_capabilities(size)
+
+    def run():
+        return [get_layer_coverage("raster", layer_response) for layer_code, layer_response in parse_wcs_capabilities(content)]
+    return run
+
+
+def describe_feature_type(size):
+    content = fixtures.describe_feature_type(size)
+
+    def run():
+        return parse_feature_type_fields(content)
+    return run
+
+
+def waterml(size):
+    content = fixtures.waterml_values(size)
+
+    def run():
+        return parse_waterml(BytesIO(content))
+    return run
+
+
+def attribute_table_rows(size):
+    content = fixtures.wfs_features(size, start=1000)
+    field_names = ["OBJECTID", "GNIS_NAME", "LENGTHKM", "REACHCODE", "FTYPE", "StreamOrde", "Shape_Leng"]
+
+    def run():
+        return build_table_rows(json.loads(content)["features"], 1000, field_names)
+    return run
+
+
+def feature_rank(size):
+    random.seed(0)
+    fids = [str(random.randint(1, size)) for _ in range(1000)]
+
+    def run():
+        return [get_feature_rank(fid, size) for fid in fids]
+    return run
+
+
+CASES = (
+    ("wfs_capabilities", wfs_capabilities, (10, 100, 1000, 10000)),
+    ("wcs_capabilities", wcs_capabilities, (10, 100, 1000, 10000)),
+    ("describe_feature_type", describe_feature_type, (10, 100, 1000)),
+    ("waterml", waterml, (1000, 100000, 1000000)),
+    ("attribute_table_rows", attribute_table_rows, (10, 100, 1000, 10000)),
+    ("feature_rank", feature_rank, (10 ** 3, 10 ** 6, 10 ** 12))
+)
+
+
+def get_memory_status():
+    """
+    Gets the current and peak resident set size of this process in bytes.
+    """
+
+    status = {}
+    with open("/proc/self/status") as status_file:
+        for line in status_file:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "VmHWM"):
+                status[name] = int(value.split()[0]) * 1024
+    return status["VmRSS"], status["VmHWM"]
+
+
+def run_memory_case(case_name, size):
+    """
+    Runs a case once and prints the peak memory in bytes used by the call.
+    """
+
+    run = dict((name, case) for name, case, sizes in CASES)[case_name](size)
+    if os.path.exists("/proc/self/status"):
+        start_rss = get_memory_status()[0]
+        run()
+        peak = get_memory_status()[1] - start_rss
+    else:
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(max(peak, 0))
+
+
+def measure_peak_memory(case_name, size):
+    """
+    Gets the peak memory in bytes used by a single call.
+
+    The call runs in a new interpreter, so memory freed by earlier cases
+    cannot be reused and hide the allocations.
+    """
+
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--memory", case_name, str(size)],
+        stdout=subprocess.PIPE,
+        check=True
+    ).stdout
+    return int(output)
+
+
+def measure_time(run, repeat):
+    """
+    Gets the best time in seconds per call over several timing runs.
+    """
+
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def format_bytes(value):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(value) < 1024 or unit == "GiB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def format_seconds(value):
+    if value < 1e-3:
+        return f"{value * 1e6:.1f} us"
+    if value < 1:
+        return f"{value * 1e3:.2f} ms"
+    return f"{value:.3f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the parsing and transformation hot paths.")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timing runs per case (default 5)")
+    parser.add_argument("--save", help="save the results as a baseline JSON file")
+    parser.add_argument("--compare", help="compare the results with a baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression (default 1.25)")
+    parser.add_argument("--memory", nargs=2, metavar=("CASE", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.memory:
+        run_memory_case(args.memory[0], int(args.memory[1]))
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+
+    results = {}
+    regressions = []
+    print(f"{'case':<36}{'time':>12}{'peak memory':>14}{'vs baseline':>14}")
+    for case_name, case, sizes in CASES:
+        if args.filter not in case_name:
+            continue
+        for size in sizes:
+            result_name = f"{case_name}[{size}]"
+            run = case(size)
+            seconds = measure_time(run, args.repeat)
+            peak_bytes = measure_peak_memory(case_name, size)
+            results[result_name] = {"seconds": seconds, "peak_bytes": peak_bytes}
+
+            comparison = ""
+            if result_name in baseline:
+                ratio = seconds / baseline[result_name]["seconds"]
+                comparison = f"{ratio:.2f}x"
+                if ratio > args.threshold:
+                    comparison += " !"
+                    regressions.append(result_name)
+            print(f"{result_name:<36}{format_seconds(seconds):>12}{format_bytes(peak_bytes):>14}{comparison:>14}")
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results
+            }, baseline_file, indent=2, sort_keys=True)
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.threshold}x: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
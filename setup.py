@@ -10,7 +10,7 @@ app_class = 'hydroshare_data_viewer.app:HydroshareDataViewer'
 app_package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tethysapp', app_package)
 
 # -- Python Dependencies -- #
-dependencies = []
+dependencies = ['numpy']
 
 setup(
     name=release_package,
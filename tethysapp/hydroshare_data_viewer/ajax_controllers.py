@@ -1,15 +1,23 @@
-import requests
 import json
 import time
-from django.http import JsonResponse
-from lxml import etree
+from django.http import HttpResponse, JsonResponse
 from .app import HydroshareDataViewer as app
-from .utilities import get_layers, get_field_stats
+from . import upstream
+from .metrics import timed_view
+from .features import get_feature_rank, build_cql_filter, build_sort_by, get_table_query, build_table_params, \
+    build_table_rows
+from .timeseries import select_window, downsample_timeseries, align_timeseries, get_columnar_data, get_json_values, \
+    encode_timeseries_binary
+from .utilities import get_resource_list, get_resource_layers, get_field_stats, get_layer_field_stats, \
+    get_feature_count, get_timeseries, get_timeseries_list, set_resource_version, get_layer_style, \
+    get_field_classes, classification_methods, get_resource_summary, record_resource_view, \
+    save_workspace_snapshot, restore_workspace_snapshot, hydroshare_url
 
 geoserver_url = app.get_custom_setting("geoserver_url")
 hydroserver_url = app.get_custom_setting("hydroserver_url")
 
 
+@timed_view
 def update_discover_table(request):
     """
     Loads data for Datatables.
@@ -43,28 +51,7 @@ def update_discover_table(request):
     #   GETS FILTERED DATA   #
     # ---------------------- #
 
-    hydroshare_url = app.get_custom_setting("hydroshare_url")
-    search_param = f"&full_text_search={search_value}" if search_value else ""
-
-    page, r = divmod(start, length)
-
-    request_url_upper = f"{hydroshare_url}/hsapi/resource?page={page+1}&count={length}{search_param}"
-    request_url_lower = f"{hydroshare_url}/hsapi/resource?page={page+2}&count={length}{search_param}"
-    response_upper = requests.get(request_url_upper)
-    response_lower = requests.get(request_url_lower)
-    results_upper = json.loads(response_upper.content)
-    results_lower = json.loads(response_lower.content)
-
-    try:
-        records = results_upper.get("count")
-        data_upper = [[i["resource_type"], i["resource_title"], i["resource_id"]] for i in results_upper["results"]][r:]
-    except:
-        records = "0"
-        data_upper = []
-    try:
-        data_lower = [[i["resource_type"], i["resource_title"], i["resource_id"]] for i in results_lower["results"]][:-int(length - r)]
-    except:
-        data_lower = []
+    records, data = get_resource_list(search_value, start, length)
 
     # -------------------- #
     #   RETURNS RESPONSE   #
@@ -73,11 +60,12 @@ def update_discover_table(request):
     return_obj["draw"] = [int(draw)]
     return_obj["recordsTotal"] = records
     return_obj["recordsFiltered"] = records
-    return_obj["data"] = data_upper + data_lower
+    return_obj["data"] = data
 
     return JsonResponse(return_obj)
 
 
+@timed_view
 def get_resource_metadata(request):
     """
     Gets resource metadata and aggregations.
@@ -107,64 +95,31 @@ def get_resource_metadata(request):
     #   GETS RESOURCE METADATA   #
     # -------------------------- #
 
-    hydroshare_url = app.get_custom_setting("hydroshare_url")
-    geoserver_url = app.get_custom_setting("geoserver_url")
-    hydroserver_url = app.get_custom_setting("hydroserver_url")
-
     request_url = f"{hydroshare_url}/hsapi/resource/{resource_id}/sysmeta/"
-    response = json.loads(requests.get(request_url).content)
-
-    if response["public"] is True:
-        sharing_status = "Public"
-    elif response["discoverable"] is True:
-        sharing_status = "Discoverable"
-    else:
-        sharing_status = "Private"
-
-    bounding_box = None
-    coverages = [coverage for coverage in response["coverages"] if coverage["type"] in ("point", "box")]
-    for coverage in response["coverages"]:
-        if coverage["type"] == "point":
-            bounding_box = {
-                "min_x": coverage["value"]["east"],
-                "min_y": coverage["value"]["north"],
-                "max_x": coverage["value"]["east"],
-                "max_y": coverage["value"]["north"]
-            }
-        elif coverage["type"] == "box":
-            bounding_box = {
-                "min_x": coverage["value"]["westlimit"],
-                "min_y": coverage["value"]["southlimit"],
-                "max_x": coverage["value"]["eastlimit"],
-                "max_y": coverage["value"]["northlimit"],
-            }
-
-    layer_list = get_layers(resource_id)
+    response = json.loads(upstream.get(request_url).content)
+    set_resource_version(resource_id, response["date_last_updated"])
+    record_resource_view(resource_id)
+    layer_list, layer_errors = get_resource_layers(resource_id, response["date_last_updated"])
 
     # -------------------- #
     #   RETURNS RESPONSE   #
     # -------------------- #
 
-    return_obj["resourceTitle"] = response["resource_title"]
-    return_obj["resourceAbstract"] = response["abstract"]
-    return_obj["creator"] = response["creator"]
-    return_obj["dateCreated"] = response["date_created"]
-    return_obj["lastUpdated"] = response["date_last_updated"]
-    return_obj["resourceId"] = resource_id
-    return_obj["resourceLink"] = response["resource_url"]
-    return_obj["sharingStatus"] = sharing_status
-    return_obj["resourceType"] = response["resource_type"]
+    return_obj.update(get_resource_summary(resource_id, response))
     return_obj["layerList"] = layer_list
-    return_obj["boundingBox"] = bounding_box
+    return_obj["layerErrors"] = layer_errors
 
     return JsonResponse(return_obj)
 
 
+@timed_view
 def get_field_statistics(request):
     """
     Gets field statistics.
 
-    This function gets statistics metadata for a layer field.
+    This function gets statistics metadata for a layer field. Fields
+    without numeric statistics, such as categorical fields, get null
+    statistics.
     """
 
     return_obj = {}
@@ -198,21 +153,170 @@ def get_field_statistics(request):
     #   RETURNS RESPONSE   #
     # -------------------- #
 
-    return_obj["min"] = field_statistics["min"]
-    return_obj["max"] = field_statistics["max"]
+    return_obj["min"] = field_statistics["min"] if field_statistics is not None else None
+    return_obj["max"] = field_statistics["max"] if field_statistics is not None else None
+    return_obj["field_stats"] = field_statistics
     return_obj["layer_code"] = layer_code
     return_obj["field_name"] = field_name
 
     return JsonResponse(return_obj)
 
 
+@timed_view
+def get_layer_field_statistics(request):
+    """
+    Gets statistics for all numeric fields of a layer.
+
+    This function gets min, max, count, null count, and mean for every
+    numeric field of a vector layer in a single request.
+    """
+
+    return_obj = {}
+
+    # -------------------- #
+    #   VERIFIES REQUEST   #
+    # -------------------- #
+
+    if not (request.is_ajax() and request.method == "POST"):
+        return_obj["error"] = "Unable to establish a secure connection."
+
+        return JsonResponse(return_obj)
+
+    # -------------------------- #
+    #   GETS DATA FROM REQUEST   #
+    # -------------------------- #
+
+    layer_code = request.POST.get('layer_code')
+
+    # ------------------------- #
+    #   GETS FIELD STATISTICS   #
+    # ------------------------- #
+
+    field_statistics = get_layer_field_stats(layer_code)
+
+    # -------------------- #
+    #   RETURNS RESPONSE   #
+    # -------------------- #
+
+    return_obj["layer_code"] = layer_code
+    return_obj["field_stats"] = field_statistics
+
+    return JsonResponse(return_obj)
+
+
+@timed_view
+def get_field_classification(request):
+    """
+    Gets classes for a layer field.
+
+    Returns class breaks for numeric fields using equal interval, quantile,
+    or natural breaks (Jenks) classification, or the distinct values of a
+    categorical field with their counts.
+    """
+
+    return_obj = {}
+
+    # -------------------- #
+    #   VERIFIES REQUEST   #
+    # -------------------- #
+
+    if not (request.is_ajax() and request.method == "POST"):
+        return_obj["error"] = "Unable to establish a secure connection."
+
+        return JsonResponse(return_obj)
+
+    # -------------------------- #
+    #   GETS DATA FROM REQUEST   #
+    # -------------------------- #
+
+    layer_code = request.POST.get("layer_code")
+    field_name = request.POST.get("field_name")
+    field_type = request.POST.get("field_type")
+    method = request.POST.get("method", "equal_interval")
+    class_count = int(request.POST.get("class_count", 5))
+
+    if method not in classification_methods or not 1 <= class_count <= 32:
+        return_obj["error"] = "Invalid classification."
+
+        return JsonResponse(return_obj)
+
+    # ---------------------- #
+    #   GETS FIELD CLASSES   #
+    # ---------------------- #
+
+    field_classes = get_field_classes(layer_code, field_name, field_type, method, class_count)
+
+    # -------------------- #
+    #   RETURNS RESPONSE   #
+    # -------------------- #
+
+    return_obj["layer_code"] = layer_code
+    return_obj["field_name"] = field_name
+    return_obj["field_classes"] = field_classes
+
+    return JsonResponse(return_obj)
+
+
+@timed_view
+def update_layer_style(request):
+    """
+    Gets WMS styles for a layer's symbology.
+
+    Returns the registered GeoServer style for the layer and for its
+    selected feature overlay, or their SLD documents if styles can not be
+    registered with GeoServer.
+    """
+
+    return_obj = {}
+
+    # -------------------- #
+    #   VERIFIES REQUEST   #
+    # -------------------- #
+
+    if not (request.is_ajax() and request.method == "POST"):
+        return_obj["error"] = "Unable to establish a secure connection."
+
+        return JsonResponse(return_obj)
+
+    # -------------------------- #
+    #   GETS DATA FROM REQUEST   #
+    # -------------------------- #
+
+    layer_code = request.POST.get("layer_code")
+    layer_type = request.POST.get("layer_type")
+    layer_symbology = json.loads(request.POST.get("layer_symbology"))
+    field_stats = json.loads(request.POST.get("field_stats", "null"))
+
+    # --------------------- #
+    #   GETS LAYER STYLES   #
+    # --------------------- #
+
+    layer_style = get_layer_style(layer_code, layer_type, layer_symbology, field_stats)
+    if layer_type != "raster":
+        highlight_style = get_layer_style(layer_code, layer_type, layer_symbology, field_stats, highlight=True)
+    else:
+        highlight_style = None
+
+    # -------------------- #
+    #   RETURNS RESPONSE   #
+    # -------------------- #
+
+    return_obj["layer_code"] = layer_code
+    return_obj["layer_style"] = layer_style
+    return_obj["highlight_style"] = highlight_style
+
+    return JsonResponse(return_obj)
+
+
+@timed_view
 def update_attribute_table(request):
     """
     Loads data for Datatables.
 
     This function handles Datatables server-side processing. Returns filtered
     paged resource list results to the client to be displayed to the user in
-    the attribute table.
+    the attribute table. Sorting and searching are passed to GeoServer as WFS
+    sortBy and CQL_FILTER parameters, so only the requested page is read.
     """
 
     return_obj = {}
@@ -234,37 +338,23 @@ def update_attribute_table(request):
     length = int(request.POST.get('length'))
     start = int(request.POST.get('start'))
     layer_fields = request.POST.getlist('layer_fields[]')
+    layer_field_types = request.POST.getlist('layer_field_types[]') or ["categorical"] * len(layer_fields)
     layer_code = request.POST.get("layer_code")
+    search_value, column_search_values, sort_order = get_table_query(request.POST, len(layer_fields))
 
     # ------------- #
     #   GETS DATA   #
     # ------------- #
 
-    request_url = f"{geoserver_url}/wfs/"
-    request_params = {
-        "service": "WFS",
-        "version": "1.1.0",
-        "request": "GetFeature",
-        "typeName": layer_code,
-        "resultType": "hits"
-    }
-    response = requests.get(request_url, params=request_params)
-    root = etree.fromstring(response.content)
-    layer_count = int(next(root.iter("{http://www.opengis.net/wfs}FeatureCollection")).get("numberOfFeatures"))
+    cql_filter = build_cql_filter(list(zip(layer_fields, layer_field_types)), search_value, column_search_values)
+    sort_by = build_sort_by(layer_fields, sort_order)
+    layer_count = get_feature_count(layer_code)
+    filtered_count = get_feature_count(layer_code, cql_filter) if cql_filter is not None else layer_count
 
     request_url = f"{geoserver_url}/wfs/"
-    request_params = {
-        "service": "WFS",
-        "version": "1.3.0",
-        "request": "GetFeature",
-        "typeName": layer_code,
-        "propertyName": ",".join(layer_fields),
-        "outputFormat": "application/json",
-        "startIndex": start,
-        "count": length
-    }
-    response = requests.get(request_url, params=request_params)
-    data = [[field["id"]] + [i + start + 1] + list(field["properties"].values()) for i, field in enumerate(json.loads(response.content)["features"])]
+    request_params = build_table_params(layer_code, layer_fields, start, length, cql_filter, sort_by)
+    response = upstream.get(request_url, params=request_params)
+    data = build_table_rows(json.loads(response.content)["features"], start, layer_fields)
 
     # -------------------- #
     #   RETURNS RESPONSE   #
@@ -272,12 +362,13 @@ def update_attribute_table(request):
 
     return_obj["draw"] = [int(draw)]
     return_obj["recordsTotal"] = layer_count
-    return_obj["recordsFiltered"] = layer_count
+    return_obj["recordsFiltered"] = filtered_count
     return_obj["data"] = data
 
     return JsonResponse(return_obj)
 
 
+@timed_view
 def select_feature(request):
     """
     AJAX Controller for getting selected feature.
@@ -307,23 +398,11 @@ def select_feature(request):
     # ------------------- #
 
     request_url = feature_url + "&propertyName" + ",".join(field_list)
-    response = json.loads(requests.get(request_url).content)
+    response = json.loads(upstream.get(request_url).content)
     if response["features"]:
-        request_url = f"{geoserver_url}/wfs/"
-        request_params = {
-            "service": "WFS",
-            "version": "1.1.0",
-            "request": "GetFeature",
-            "typeName": layer_code,
-            "resultType": "hits"
-        }
-        count_response = requests.get(request_url, params=request_params)
-        root = etree.fromstring(count_response.content)
-        layer_count = int(next(root.iter("{http://www.opengis.net/wfs}FeatureCollection")).get("numberOfFeatures"))
-        fid_list = [str(i) for i in list(range(1,layer_count + 1))]
-        fid_list.sort()
+        layer_count = get_feature_count(layer_code)
         fid = response["features"][0]["id"]
-        feature = fid_list.index(response["features"][0]["id"].split(".")[-1])
+        feature = get_feature_rank(fid.split(".")[-1], layer_count)
         row = list(response["features"][0]["properties"].values())
     else:
         fid = None
@@ -340,6 +419,7 @@ def select_feature(request):
     return JsonResponse(return_obj)
 
 
+@timed_view
 def get_timeseries_data(request):
     """
     AJAX Controller for getting time series data.
@@ -365,41 +445,213 @@ def get_timeseries_data(request):
     variable_code = request.POST.get("var_code")
     site_name = request.POST.get("site_name")
     variable_name = request.POST.get("var_name")
+    response_format = request.POST.get("format", "json")
+    max_points = int(request.POST.get("max_points", 0))
+    start_time = int(request.POST["start_time"]) if request.POST.get("start_time") else None
+    end_time = int(request.POST["end_time"]) if request.POST.get("end_time") else None
+    downsample_method = request.POST.get("downsample", "lttb")
 
     # ------------------------- #
     #   GETS TIME SERIES DATA   #
     # ------------------------- #
 
-    network_id = layer_code.split(":")[0].split("-")[1]
-    database_id = ":".join(layer_code.split(":")[1:])
-    request_url = f"{hydroserver_url}/wof/{network_id}/{database_id}/values/"
-    params = {
-        "site_code": site_code,
-        "variable_code": variable_code
-    }
-    response = requests.get(request_url, params=params)
-    waterml = etree.fromstring(response.content)
-    no_data_value = waterml.find("{http://www.cuahsi.org/waterML/1.1/}timeSeries").find("{http://www.cuahsi.org/waterML/1.1/}variable").find("{http://www.cuahsi.org/waterML/1.1/}noDataValue").text
-    try:
-        unit_name = waterml.find("{http://www.cuahsi.org/waterML/1.1/}timeSeries").find("{http://www.cuahsi.org/waterML/1.1/}variable").find("{http://www.cuahsi.org/waterML/1.1/}unit").find("{http://www.cuahsi.org/waterML/1.1/}unitAbbreviation").text
-    except:
-        unit_name = None
-    timeseries_data = [[
-        x.get('dateTime'),
-        x.text if x.text != no_data_value else None
-    ] for x in waterml.find("{http://www.cuahsi.org/waterML/1.1/}timeSeries").find("{http://www.cuahsi.org/waterML/1.1/}values").iter("{http://www.cuahsi.org/waterML/1.1/}value")]
+    timeseries = get_timeseries(layer_code, site_code, variable_code)
+    times, values = select_window(timeseries["times"], timeseries["values"], start_time, end_time)
+    point_count = int(times.size)
+    if max_points:
+        times, values = downsample_timeseries(times, values, max_points, downsample_method)
 
     # -------------------------- #
     #   RETURNS DATA TO CLIENT   #
     # -------------------------- #
 
-    return_obj["timeseries_data"] = timeseries_data
-    return_obj["no_data_value"] = no_data_value
+    return_obj["no_data_value"] = timeseries["no_data_value"]
     return_obj["site_name"] = site_name
     return_obj["variable_name"] = variable_name
-    return_obj["unit_name"] = unit_name
+    return_obj["unit_name"] = timeseries["unit_name"]
     return_obj["variable_code"] = variable_code
     return_obj["site_code"] = site_code
     return_obj["layer_code"] = layer_code
+    return_obj["start_time"] = start_time
+    return_obj["end_time"] = end_time
+    return_obj["point_count"] = point_count
+
+    if response_format == "binary":
+        return HttpResponse(
+            encode_timeseries_binary(return_obj, times, values),
+            content_type="application/octet-stream"
+        )
+
+    return_obj["timeseries_data"] = get_columnar_data(times, values)
+
+    return JsonResponse(return_obj)
+
+
+@timed_view
+def get_timeseries_batch(request):
+    """
+    AJAX Controller for getting data for several time series.
+
+    Takes a JSON list of site and variable codes for a time series layer
+    and returns the series aligned on a shared time column, with a status
+    for each series.
+    """
+
+    return_obj = {}
+
+    # -------------------- #
+    #   VERIFIES REQUEST   #
+    # -------------------- #
+
+    if not (request.is_ajax() and request.method == "POST"):
+        return_obj["error"] = "Unable to establish a secure connection."
+
+        return JsonResponse(return_obj)
+
+    # -------------------------- #
+    #   GETS DATA FROM REQUEST   #
+    # -------------------------- #
 
-    return JsonResponse(return_obj) 
+    layer_code = request.POST.get("layer_code")
+    series_list = json.loads(request.POST.get("series"))
+    max_points = int(request.POST.get("max_points", 0))
+    start_time = int(request.POST["start_time"]) if request.POST.get("start_time") else None
+    end_time = int(request.POST["end_time"]) if request.POST.get("end_time") else None
+    downsample_method = request.POST.get("downsample", "lttb")
+
+    # ------------------------- #
+    #   GETS TIME SERIES DATA   #
+    # ------------------------- #
+
+    series_codes = [(series["site_code"], series["var_code"]) for series in series_list]
+    series_data = []
+    series_status = []
+    for (site_code, variable_code), (timeseries, error) in zip(series_codes, get_timeseries_list(layer_code, series_codes)):
+        status = {
+            "site_code": site_code,
+            "variable_code": variable_code
+        }
+        if timeseries is None:
+            status["status"] = "error"
+            status["error"] = error
+        else:
+            times, values = select_window(timeseries["times"], timeseries["values"], start_time, end_time)
+            status["status"] = "ok"
+            status["point_count"] = int(times.size)
+            status["unit_name"] = timeseries["unit_name"]
+            status["no_data_value"] = timeseries["no_data_value"]
+            if max_points:
+                times, values = downsample_timeseries(times, values, max_points, downsample_method)
+            series_data.append((times, values))
+        series_status.append(status)
+    times, aligned_values = align_timeseries(series_data)
+    aligned_values = iter(aligned_values)
+    for status in series_status:
+        status["values"] = get_json_values(next(aligned_values)) if status["status"] == "ok" else None
+
+    # -------------------------- #
+    #   RETURNS DATA TO CLIENT   #
+    # -------------------------- #
+
+    return_obj["layer_code"] = layer_code
+    return_obj["start_time"] = start_time
+    return_obj["end_time"] = end_time
+    return_obj["times"] = times.tolist()
+    return_obj["series"] = series_status
+
+    return JsonResponse(return_obj)
+
+
+@timed_view
+def save_workspace(request):
+    """
+    AJAX Controller for saving a user's workspace.
+
+    Takes a JSON list of the workspace layers in display order with their
+    metadata and settings, and stores it as a snapshot in the user's
+    workspace.
+    """
+
+    return_obj = {}
+
+    # -------------------- #
+    #   VERIFIES REQUEST   #
+    # -------------------- #
+
+    if not (request.is_ajax() and request.method == "POST"):
+        return_obj["error"] = "Unable to establish a secure connection."
+
+        return JsonResponse(return_obj)
+
+    if not request.user.is_authenticated:
+        return_obj["error"] = "Sign in to save your workspace."
+
+        return JsonResponse(return_obj)
+
+    # -------------------------- #
+    #   GETS DATA FROM REQUEST   #
+    # -------------------------- #
+
+    layers = json.loads(request.POST.get("workspace"))["layers"]
+
+    # -------------------- #
+    #   SAVES WORKSPACE    #
+    # -------------------- #
+
+    try:
+        save_workspace_snapshot(app.get_user_workspace(request.user).path, layers)
+    except ValueError as e:
+        return_obj["error"] = str(e)
+
+        return JsonResponse(return_obj)
+
+    # -------------------- #
+    #   RETURNS RESPONSE   #
+    # -------------------- #
+
+    return_obj["layerCount"] = len(layers)
+
+    return JsonResponse(return_obj)
+
+
+@timed_view
+def restore_workspace(request):
+    """
+    AJAX Controller for restoring a user's workspace.
+
+    Returns the layers of the user's saved workspace in display order.
+    Layers of resources that have not changed since the workspace was saved
+    are restored without discovering the resource's layers again.
+    """
+
+    return_obj = {}
+
+    # -------------------- #
+    #   VERIFIES REQUEST   #
+    # -------------------- #
+
+    if not (request.is_ajax() and request.method == "POST"):
+        return_obj["error"] = "Unable to establish a secure connection."
+
+        return JsonResponse(return_obj)
+
+    if not request.user.is_authenticated:
+        return_obj["layerList"] = []
+        return_obj["layerErrors"] = []
+
+        return JsonResponse(return_obj)
+
+    # ---------------------- #
+    #   RESTORES WORKSPACE   #
+    # ---------------------- #
+
+    layer_list, layer_errors = restore_workspace_snapshot(app.get_user_workspace(request.user).path)
+
+    # -------------------- #
+    #   RETURNS RESPONSE   #
+    # -------------------- #
+
+    return_obj["layerList"] = layer_list
+    return_obj["layerErrors"] = layer_errors
+
+    return JsonResponse(return_obj)
@@ -23,6 +23,7 @@ class HydroshareDataViewer(TethysAppBase):
         Add controllers
         """
         UrlMap = url_map_maker(self.root_url)
+        view_controllers = 'async_controllers' if self.serves_async_views() else 'ajax_controllers'
 
         url_maps = (
             UrlMap(
@@ -30,6 +31,26 @@ class HydroshareDataViewer(TethysAppBase):
                 url='hydroshare-data-viewer',
                 controller='hydroshare_data_viewer.controllers.home'
             ),
+            UrlMap(
+                name='export-layer',
+                url='hydroshare-data-viewer/export-layer',
+                controller='hydroshare_data_viewer.controllers.export_layer'
+            ),
+            UrlMap(
+                name='get-tile',
+                url='hydroshare-data-viewer/tiles/{z}/{x}/{y}',
+                controller='hydroshare_data_viewer.controllers.get_tile'
+            ),
+            UrlMap(
+                name='composite-map',
+                url='hydroshare-data-viewer/composite-map',
+                controller='hydroshare_data_viewer.controllers.composite_map'
+            ),
+            UrlMap(
+                name='metrics',
+                url='hydroshare-data-viewer/metrics',
+                controller='hydroshare_data_viewer.controllers.metrics'
+            ),
             UrlMap(
                 name='update-discover-table',
                 url='hydroshare-data-viewer/ajax/update-discover-table',
@@ -38,17 +59,32 @@ class HydroshareDataViewer(TethysAppBase):
             UrlMap(
                 name='get-resource-metadata',
                 url='hydroshare-data-viewer/ajax/get-resource-metadata',
-                controller='hydroshare_data_viewer.ajax_controllers.get_resource_metadata'
+                controller=f'hydroshare_data_viewer.{view_controllers}.get_resource_metadata'
             ),
             UrlMap(
                 name='get-field-statistics',
                 url='hydroshare-data-viewer/ajax/get-field-statistics',
                 controller='hydroshare_data_viewer.ajax_controllers.get_field_statistics'
             ),
+            UrlMap(
+                name='get-layer-field-statistics',
+                url='hydroshare-data-viewer/ajax/get-layer-field-statistics',
+                controller='hydroshare_data_viewer.ajax_controllers.get_layer_field_statistics'
+            ),
+            UrlMap(
+                name='get-field-classification',
+                url='hydroshare-data-viewer/ajax/get-field-classification',
+                controller='hydroshare_data_viewer.ajax_controllers.get_field_classification'
+            ),
+            UrlMap(
+                name='update-layer-style',
+                url='hydroshare-data-viewer/ajax/update-layer-style',
+                controller='hydroshare_data_viewer.ajax_controllers.update_layer_style'
+            ),
             UrlMap(
                 name='update-attribute-table',
                 url='hydroshare-data-viewer/ajax/update-attribute-table',
-                controller='hydroshare_data_viewer.ajax_controllers.update_attribute_table'
+                controller=f'hydroshare_data_viewer.{view_controllers}.update_attribute_table'
             ),
             UrlMap(
                 name='select-feature',
@@ -58,12 +94,47 @@ class HydroshareDataViewer(TethysAppBase):
             UrlMap(
                 name='get-timeseries-data',
                 url='hydroshare-data-viewer/ajax/get-timeseries-data',
-                controller='hydroshare_data_viewer.ajax_controllers.get_timeseries_data'
+                controller=f'hydroshare_data_viewer.{view_controllers}.get_timeseries_data'
+            ),
+            UrlMap(
+                name='get-timeseries-batch',
+                url='hydroshare-data-viewer/ajax/get-timeseries-batch',
+                controller='hydroshare_data_viewer.ajax_controllers.get_timeseries_batch'
+            ),
+            UrlMap(
+                name='save-workspace',
+                url='hydroshare-data-viewer/ajax/save-workspace',
+                controller='hydroshare_data_viewer.ajax_controllers.save_workspace'
+            ),
+            UrlMap(
+                name='restore-workspace',
+                url='hydroshare-data-viewer/ajax/restore-workspace',
+                controller='hydroshare_data_viewer.ajax_controllers.restore_workspace'
             )
         )
 
         return url_maps
 
+    @classmethod
+    def serves_async_views(cls):
+        """
+        Checks whether views can be served asynchronously.
+
+        Async views need Django 3.1 or later running under an ASGI server.
+        Tethys defines an ASGI application even when the portal is served
+        under WSGI, so the server is taken from the Async Views setting. If
+        it is not enabled, or app settings can not be read yet (e.g. before
+        the app is installed), the sync ajax controllers are used instead.
+        """
+        import django
+
+        if django.VERSION < (3, 1):
+            return False
+        try:
+            return bool(cls.get_custom_setting('async_views'))
+        except Exception:
+            return False
+
     def custom_settings(self):
         custom_settings = (
             CustomSetting(
@@ -108,6 +179,162 @@ class HydroshareDataViewer(TethysAppBase):
                 description='Maximum number of layers allowed in the workspace.',
                 required=True
             ),
+            CustomSetting(
+                name='discovery_workers',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum number of concurrent upstream requests used to discover resource layers (default 8).',
+                required=False
+            ),
+            CustomSetting(
+                name='upstream_pool_size',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum number of keep-alive connections per upstream host (default 10).',
+                required=False
+            ),
+            CustomSetting(
+                name='upstream_connect_timeout',
+                type=CustomSetting.TYPE_FLOAT,
+                description='Seconds to wait for an upstream connection (default 5).',
+                required=False
+            ),
+            CustomSetting(
+                name='upstream_read_timeout',
+                type=CustomSetting.TYPE_FLOAT,
+                description='Seconds to wait for an upstream response (default 60).',
+                required=False
+            ),
+            CustomSetting(
+                name='upstream_max_retries',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum number of retries for failed upstream GET requests (default 2).',
+                required=False
+            ),
+            CustomSetting(
+                name='async_views',
+                type=CustomSetting.TYPE_BOOLEAN,
+                description='Serve the resource metadata, attribute table, and time series views as async views. Only enable if the Tethys Portal is served by an ASGI server (e.g. Daphne or Uvicorn) with Django 3.1 or later. Takes effect when the portal is restarted.',
+                required=False
+            ),
+            CustomSetting(
+                name='shared_cache',
+                type=CustomSetting.TYPE_STRING,
+                description='Django cache alias shared by all worker processes (e.g. a Redis or Memcached cache). Leave blank to cache within each process only.',
+                required=False
+            ),
+            CustomSetting(
+                name='shared_lock_timeout',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Seconds a worker process waits for another worker loading the same upstream data through the Shared Cache before loading it itself (default 30). Set to 0 to only merge identical requests within each worker.',
+                required=False
+            ),
+            CustomSetting(
+                name='layer_cache_ttl',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Seconds to keep cached resource layer metadata (default 86400).',
+                required=False
+            ),
+            CustomSetting(
+                name='layer_cache_size',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum memory in MB used by the in-process layer metadata cache (default 64).',
+                required=False
+            ),
+            CustomSetting(
+                name='discover_cache_ttl',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Seconds to keep cached pages of HydroShare search results (default 60).',
+                required=False
+            ),
+            CustomSetting(
+                name='timeseries_store_size',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum disk space in MB used to store downloaded time series in the app workspace (default 512).',
+                required=False
+            ),
+            CustomSetting(
+                name='timeseries_refresh_interval',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Seconds before a stored time series is checked for new values (default 300).',
+                required=False
+            ),
+            CustomSetting(
+                name='timeseries_workers',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum number of concurrent HydroServer requests for batch time series requests (default 4).',
+                required=False
+            ),
+            CustomSetting(
+                name='raster_stats_size',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum width and height in cells of the reduced resolution coverage used to compute raster statistics (default 512).',
+                required=False
+            ),
+            CustomSetting(
+                name='geoserver_username',
+                type=CustomSetting.TYPE_STRING,
+                description='GeoServer user allowed to create styles. Layer styles are sent with every map request when left blank.',
+                required=False
+            ),
+            CustomSetting(
+                name='geoserver_password',
+                type=CustomSetting.TYPE_STRING,
+                description='Password of the GeoServer user allowed to create styles.',
+                required=False
+            ),
+            CustomSetting(
+                name='style_cache_size',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum number of registered layer styles each worker remembers, so they are not registered again (default 500).',
+                required=False
+            ),
+            CustomSetting(
+                name='tile_cache_size',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum disk space in MB used to cache map tiles in the app workspace (default 1024).',
+                required=False
+            ),
+            CustomSetting(
+                name='tile_max_age',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Seconds browsers may reuse a map tile before checking it again (default 3600).',
+                required=False
+            ),
+            CustomSetting(
+                name='style_max_idle',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Seconds before a layer style that no worker has used is removed from GeoServer (default 86400). Styles are only removed when a Shared Cache is configured.',
+                required=False
+            ),
+            CustomSetting(
+                name='metrics_token',
+                type=CustomSetting.TYPE_STRING,
+                description='Bearer token required to read the app metrics. Leave blank to allow any request.',
+                required=False
+            ),
+            CustomSetting(
+                name='prewarm_interval',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Seconds between background cache pre-warming runs in each worker. Leave blank to only pre-warm with the prewarm_layers command.',
+                required=False
+            ),
+            CustomSetting(
+                name='prewarm_resources',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Number of most viewed and of most recently updated resources loaded by each pre-warming run (default 20).',
+                required=False
+            ),
+            CustomSetting(
+                name='prewarm_concurrency',
+                type=CustomSetting.TYPE_INTEGER,
+                description='Maximum number of concurrent upstream requests made by pre-warming (default 2).',
+                required=False
+            ),
+            CustomSetting(
+                name='prewarm_rate',
+                type=CustomSetting.TYPE_FLOAT,
+                description='Maximum number of upstream requests per second made by pre-warming (default 5).',
+                required=False
+            ),
         )
 
         return custom_settings
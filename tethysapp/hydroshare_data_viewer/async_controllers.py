@@ -0,0 +1,186 @@
+import json
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from . import upstream
+from .metrics import timed_view
+from .features import build_cql_filter, build_sort_by, get_table_query, build_table_params, build_table_rows
+from .timeseries import select_window, downsample_timeseries, get_columnar_data, encode_timeseries_binary
+from .utilities import async_get_resource_layers, async_get_feature_count, async_get_timeseries, \
+    set_resource_version, get_resource_summary, record_resource_view, hydroshare_url, geoserver_url
+
+
+@timed_view
+async def get_resource_metadata(request):
+    """
+    Gets resource metadata and aggregations.
+
+    Async version of ajax_controllers.get_resource_metadata. The HydroShare
+    request does not block a worker thread while it waits for a response.
+    """
+
+    return_obj = {}
+
+    # -------------------- #
+    #   VERIFIES REQUEST   #
+    # -------------------- #
+
+    if not (request.is_ajax() and request.method == "POST"):
+        return_obj["error"] = "Unable to establish a secure connection."
+
+        return JsonResponse(return_obj)
+
+    # -------------------------- #
+    #   GETS DATA FROM REQUEST   #
+    # -------------------------- #
+
+    resource_id = request.POST.get('resourceId')
+
+    # -------------------------- #
+    #   GETS RESOURCE METADATA   #
+    # -------------------------- #
+
+    request_url = f"{hydroshare_url}/hsapi/resource/{resource_id}/sysmeta/"
+    response = json.loads((await upstream.async_get(request_url)).content)
+    await sync_to_async(set_resource_version, thread_sensitive=False)(resource_id, response["date_last_updated"])
+    await sync_to_async(record_resource_view, thread_sensitive=False)(resource_id)
+    layer_list, layer_errors = await async_get_resource_layers(resource_id, response["date_last_updated"])
+
+    # -------------------- #
+    #   RETURNS RESPONSE   #
+    # -------------------- #
+
+    return_obj.update(get_resource_summary(resource_id, response))
+    return_obj["layerList"] = layer_list
+    return_obj["layerErrors"] = layer_errors
+
+    return JsonResponse(return_obj)
+
+
+@timed_view
+async def update_attribute_table(request):
+    """
+    Loads data for Datatables.
+
+    Async version of ajax_controllers.update_attribute_table. Feature counts
+    and the requested page are read from GeoServer without blocking a worker
+    thread.
+    """
+
+    return_obj = {}
+
+    # -------------------- #
+    #   VERIFIES REQUEST   #
+    # -------------------- #
+
+    if not (request.is_ajax() and request.method == "POST"):
+        return_obj["error"] = "Unable to establish a secure connection."
+
+        return JsonResponse(return_obj)
+
+    # -------------------------- #
+    #   GETS DATA FROM REQUEST   #
+    # -------------------------- #
+
+    draw = request.POST.get('draw')
+    length = int(request.POST.get('length'))
+    start = int(request.POST.get('start'))
+    layer_fields = request.POST.getlist('layer_fields[]')
+    layer_field_types = request.POST.getlist('layer_field_types[]') or ["categorical"] * len(layer_fields)
+    layer_code = request.POST.get("layer_code")
+    search_value, column_search_values, sort_order = get_table_query(request.POST, len(layer_fields))
+
+    # ------------- #
+    #   GETS DATA   #
+    # ------------- #
+
+    cql_filter = build_cql_filter(list(zip(layer_fields, layer_field_types)), search_value, column_search_values)
+    sort_by = build_sort_by(layer_fields, sort_order)
+    layer_count = await async_get_feature_count(layer_code)
+    filtered_count = await async_get_feature_count(layer_code, cql_filter) if cql_filter is not None else layer_count
+
+    request_url = f"{geoserver_url}/wfs/"
+    request_params = build_table_params(layer_code, layer_fields, start, length, cql_filter, sort_by)
+    response = await upstream.async_get(request_url, params=request_params)
+    data = build_table_rows(json.loads(response.content)["features"], start, layer_fields)
+
+    # -------------------- #
+    #   RETURNS RESPONSE   #
+    # -------------------- #
+
+    return_obj["draw"] = [int(draw)]
+    return_obj["recordsTotal"] = layer_count
+    return_obj["recordsFiltered"] = filtered_count
+    return_obj["data"] = data
+
+    return JsonResponse(return_obj)
+
+
+@timed_view
+async def get_timeseries_data(request):
+    """
+    AJAX Controller for getting time series data.
+
+    Async version of ajax_controllers.get_timeseries_data. New values are
+    downloaded from HydroServer without blocking a worker thread.
+    """
+
+    return_obj = {}
+
+    # -------------------- #
+    #   VERIFIES REQUEST   #
+    # -------------------- #
+
+    if not (request.is_ajax() and request.method == "POST"):
+        return_obj["error"] = "Unable to establish a secure connection."
+
+        return JsonResponse(return_obj)
+
+    # -------------------------- #
+    #   GETS DATA FROM REQUEST   #
+    # -------------------------- #
+
+    layer_code = request.POST.get("layer_code")
+    site_code = request.POST.get("site_code")
+    variable_code = request.POST.get("var_code")
+    site_name = request.POST.get("site_name")
+    variable_name = request.POST.get("var_name")
+    response_format = request.POST.get("format", "json")
+    max_points = int(request.POST.get("max_points", 0))
+    start_time = int(request.POST["start_time"]) if request.POST.get("start_time") else None
+    end_time = int(request.POST["end_time"]) if request.POST.get("end_time") else None
+    downsample_method = request.POST.get("downsample", "lttb")
+
+    # ------------------------- #
+    #   GETS TIME SERIES DATA   #
+    # ------------------------- #
+
+    timeseries = await async_get_timeseries(layer_code, site_code, variable_code)
+    times, values = select_window(timeseries["times"], timeseries["values"], start_time, end_time)
+    point_count = int(times.size)
+    if max_points:
+        times, values = downsample_timeseries(times, values, max_points, downsample_method)
+
+    # -------------------------- #
+    #   RETURNS DATA TO CLIENT   #
+    # -------------------------- #
+
+    return_obj["no_data_value"] = timeseries["no_data_value"]
+    return_obj["site_name"] = site_name
+    return_obj["variable_name"] = variable_name
+    return_obj["unit_name"] = timeseries["unit_name"]
+    return_obj["variable_code"] = variable_code
+    return_obj["site_code"] = site_code
+    return_obj["layer_code"] = layer_code
+    return_obj["start_time"] = start_time
+    return_obj["end_time"] = end_time
+    return_obj["point_count"] = point_count
+
+    if response_format == "binary":
+        return HttpResponse(
+            encode_timeseries_binary(return_obj, times, values),
+            content_type="application/octet-stream"
+        )
+
+    return_obj["timeseries_data"] = get_columnar_data(times, values)
+
+    return JsonResponse(return_obj)
@@ -0,0 +1,609 @@
+import asyncio
+import contextvars
+import fcntl
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from asgiref.sync import sync_to_async
+from . import metrics
+
+background_work = contextvars.ContextVar("background_work", default=False)
+
+
+@contextmanager
+def file_lock(lock_path, exclusive):
+    """
+    Holds a lock on a file, shared across processes.
+    """
+
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def add_recorded_size(path, size_change):
+    """
+    Adds to the size recorded for an on-disk store.
+
+    Returns the new size, or None if no size is recorded yet. Callers must
+    hold the store's lock shared, so eviction, which holds it exclusively
+    and records the size it finds, never runs while the size changes.
+    """
+
+    size_path = os.path.join(path, "size")
+    with file_lock(os.path.join(path, "size.lock"), exclusive=True):
+        try:
+            with open(size_path) as size_file:
+                store_size = int(size_file.read()) + size_change
+        except (OSError, ValueError):
+            return None
+        with open(size_path, "w") as size_file:
+            size_file.write(str(store_size))
+    return store_size
+
+
+def write_recorded_size(path, store_size):
+    """
+    Records the size of an on-disk store.
+    """
+
+    with file_lock(os.path.join(path, "size.lock"), exclusive=True):
+        with open(os.path.join(path, "size"), "w") as size_file:
+            size_file.write(str(store_size))
+
+
+class LocalCache:
+    """
+    In-process LRU cache with TTL expiry.
+
+    Values are stored pickled, so callers always receive their own copy and
+    the memory used by each entry is known. The least recently used entries
+    are evicted once the total size exceeds the memory cap.
+    """
+
+    def __init__(self, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.monotonic():
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+        return data
+
+    def set(self, key, data, ttl=None):
+        if len(data) > self.max_bytes:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (expires, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class SharedLock:
+    """
+    Lock shared by worker processes through a Django cache.
+
+    A worker holds the lock for a key by adding an entry to the shared
+    backend, which only one worker can do at a time. The entry expires
+    after the lock timeout, so a worker that dies while holding the lock
+    does not block the others for long. Without a shared backend or a
+    timeout the lock does nothing.
+    """
+
+    poll_interval = 0.05
+    max_poll_interval = 0.5
+
+    def __init__(self, name, shared_cache=None, timeout=None):
+        self.name = name
+        self.shared_cache = shared_cache or None
+        self.timeout = timeout
+
+    def get_shared(self):
+        if self.shared_cache is None or not self.timeout:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_cache]
+
+    @contextmanager
+    def hold(self, key, is_done):
+        """
+        Holds the lock for a key while a worker loads its value.
+
+        A worker that finds the key locked waits until is_done returns True
+        because the worker holding the lock stored the value, until the lock
+        is released, or until the lock timeout passes. It then continues,
+        holding the lock only if it was released, so the caller should check
+        for a stored value before loading it. Background work never takes
+        the lock.
+        """
+
+        shared = self.get_shared()
+        if shared is None or background_work.get():
+            yield
+            return
+        lock_key = f"hydroshare_data_viewer:{self.name}:lock:{hashlib.sha1(repr(key).encode()).hexdigest()}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.timeout
+        poll_interval = self.poll_interval
+        acquired = shared.add(lock_key, token, self.timeout)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, self.max_poll_interval)
+            if is_done():
+                metrics.observe_coalesced(self.name)
+                break
+            acquired = shared.add(lock_key, token, self.timeout)
+        try:
+            yield
+        finally:
+            if acquired and shared.get(lock_key) == token:
+                shared.delete(lock_key)
+
+
+class Cache:
+    """
+    Two-level cache for computed upstream metadata.
+
+    Entries are kept in an in-process LRU cache and, when a Django cache
+    alias is configured, in a shared backend (e.g. Redis or Memcached) that
+    every worker process can read. Given a lock timeout, values computed by
+    get_or_set are also computed by one worker process at a time.
+    """
+
+    def __init__(self, name, ttl, max_bytes, shared_cache=None, lock_timeout=None):
+        self.name = name
+        self.ttl = ttl
+        self.local = LocalCache(ttl, max_bytes)
+        self.shared_cache = shared_cache or None
+        self.shared_lock = SharedLock(name, shared_cache, lock_timeout)
+        self.hits = 0
+        self.misses = 0
+        self.key_locks = {}
+        self.key_locks_lock = threading.Lock()
+        self.async_calls = AsyncSingleFlight(name)
+
+    def get_shared(self):
+        if self.shared_cache is None:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_cache]
+
+    @contextmanager
+    def lock_key(self, key):
+        """
+        Holds a lock for a single cache key within this process.
+        """
+
+        with self.key_locks_lock:
+            key_lock = self.key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                yield
+        finally:
+            with self.key_locks_lock:
+                key_lock[1] -= 1
+                if key_lock[1] == 0:
+                    del self.key_locks[key]
+
+    def get_key(self, key):
+        return f"hydroshare_data_viewer:{self.name}:{hashlib.sha1(repr(key).encode()).hexdigest()}"
+
+    def get(self, key, default=None):
+        """
+        Gets a cached value.
+
+        Checks the local cache first, then the shared backend. Values found in
+        the shared backend are copied into the local cache.
+        """
+
+        data = self.get_data(key)
+        if data is None:
+            self.misses += 1
+            metrics.observe_cache(self.name, False)
+            return default
+        self.hits += 1
+        metrics.observe_cache(self.name, True)
+        return pickle.loads(data)
+
+    def get_data(self, key):
+        cache_key = self.get_key(key)
+        data = self.local.get(cache_key)
+        if data is None and self.get_shared() is not None:
+            data = self.get_shared().get(cache_key)
+            if data is not None:
+                self.local.set(cache_key, data)
+        return data
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a value in the local cache and the shared backend.
+        """
+
+        cache_key = self.get_key(key)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.local.set(cache_key, data, ttl)
+        if self.get_shared() is not None:
+            self.get_shared().set(cache_key, data, self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        """
+        Removes a value from the local cache and the shared backend.
+        """
+
+        cache_key = self.get_key(key)
+        self.local.delete(cache_key)
+        if self.get_shared() is not None:
+            self.get_shared().delete(cache_key)
+
+    async def async_get(self, key, default=None):
+        """
+        Gets a cached value in an async view.
+
+        Without a shared backend the value is read from the local cache
+        directly. Otherwise the lookup runs on a worker thread, so a slow
+        shared backend does not block the event loop.
+        """
+
+        if self.shared_cache is None:
+            return self.get(key, default)
+        return await sync_to_async(self.get, thread_sensitive=False)(key, default)
+
+    async def async_set(self, key, value, ttl=None):
+        """
+        Stores a value in an async view, like async_get.
+        """
+
+        if self.shared_cache is None:
+            return self.set(key, value, ttl)
+        return await sync_to_async(self.set, thread_sensitive=False)(key, value, ttl)
+
+    def get_or_set(self, key, func, ttl=None):
+        """
+        Gets a cached value, computing it on a miss.
+
+        Concurrent misses for the same key in this process wait for a single
+        call to func and share its result. With a shared lock, misses in
+        other worker processes wait for it too. Background work calls func
+        without taking either lock, so live requests never wait for its
+        rate limited upstream requests.
+        """
+
+        value = self.get(key)
+        if value is not None:
+            return value
+        if background_work.get():
+            value = func()
+            if value is not None:
+                self.set(key, value, ttl)
+            return value
+        with self.lock_key(key):
+            data = self.get_data(key)
+            if data is not None:
+                metrics.observe_coalesced(self.name)
+                return pickle.loads(data)
+            with self.shared_lock.hold(key, lambda: self.get_data(key) is not None):
+                data = self.get_data(key)
+                if data is not None:
+                    return pickle.loads(data)
+                value = func()
+                if value is not None:
+                    self.set(key, value, ttl)
+        return value
+
+    async def async_get_or_set(self, key, func, ttl=None):
+        """
+        Gets a cached value in an async view, computing it on a miss.
+
+        func is a coroutine function. Concurrent misses for the same key in
+        this event loop wait for a single call to func and share its result.
+        """
+
+        value = await self.async_get(key)
+        if value is not None:
+            return value
+
+        async def compute():
+            value = await func()
+            if value is not None:
+                await self.async_set(key, value, ttl)
+            return value
+
+        return await self.async_calls.do(key, compute)
+
+
+class SingleFlight:
+    """
+    Merges concurrent identical calls.
+
+    The first caller for a key runs the call. Callers that arrive while it
+    is in flight wait for it and receive the same result or exception. If
+    a name is given, waiting callers are counted in the app metrics.
+    Background work may wait for a call but never runs one that others
+    wait for.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, func):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None and not background_work.get()
+            if leader:
+                future = Future()
+                self.calls[key] = future
+        if future is None:
+            return func()
+        if not leader:
+            if self.name is not None:
+                metrics.observe_coalesced(self.name)
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+
+class AsyncSingleFlight:
+    """
+    Merges concurrent identical calls in an event loop.
+
+    Works like SingleFlight for coroutine functions. Callers that arrive
+    while a call is in flight await it without blocking the event loop. A
+    waiting caller that is cancelled does not cancel the shared call.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.calls = {}
+
+    async def do(self, key, func):
+        future = self.calls.get(key)
+        if future is not None:
+            if self.name is not None:
+                metrics.observe_coalesced(self.name)
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Marks the exception as retrieved in case no caller is waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.calls[key]
+
+
+class TileCache:
+    """
+    Size-bounded on-disk cache of map tiles.
+
+    Tiles are stored per layer, and a layer's tiles are removed when the
+    version they were rendered for changes. The cache size is recorded in
+    the cache directory, so all processes sharing the directory see the same
+    size. Once the cache grows past its size limit, the least recently used
+    tiles are removed.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_layer_path(self, layer_code):
+        return os.path.join(self.path, hashlib.sha1(layer_code.encode()).hexdigest())
+
+    def get_tile_path(self, layer_code, style_name, z, x, y):
+        return os.path.join(self.get_layer_path(layer_code), style_name, str(z), str(x), f"{y}.png")
+
+    def check_version(self, layer_code, version):
+        """
+        Removes a layer's tiles if they were rendered for another version.
+        """
+
+        layer_path = self.get_layer_path(layer_code)
+        version_path = os.path.join(layer_path, "version")
+        try:
+            with open(version_path) as version_file:
+                if version_file.read() == version:
+                    return
+        except OSError:
+            pass
+        with file_lock(os.path.join(self.path, "cache.lock"), exclusive=True):
+            layer_size = 0
+            for directory, directory_names, file_names in os.walk(layer_path):
+                for file_name in file_names:
+                    if file_name.endswith(".png"):
+                        try:
+                            layer_size += os.stat(os.path.join(directory, file_name)).st_size
+                        except FileNotFoundError:
+                            pass
+            shutil.rmtree(layer_path, ignore_errors=True)
+            add_recorded_size(self.path, -layer_size)
+            os.makedirs(layer_path, exist_ok=True)
+            with open(version_path, "w") as version_file:
+                version_file.write(version)
+
+    def get(self, layer_code, style_name, z, x, y):
+        """
+        Gets a cached tile, or None if it is not cached.
+        """
+
+        tile_path = self.get_tile_path(layer_code, style_name, z, x, y)
+        try:
+            with open(tile_path, "rb") as tile_file:
+                data = tile_file.read()
+            os.utime(tile_path)
+        except OSError:
+            metrics.observe_cache("tiles", False)
+            return None
+        metrics.observe_cache("tiles", True)
+        return data
+
+    def set(self, layer_code, style_name, z, x, y, data):
+        """
+        Stores a tile, removing old tiles if the cache is full.
+        """
+
+        tile_path = self.get_tile_path(layer_code, style_name, z, x, y)
+        with file_lock(os.path.join(self.path, "cache.lock"), exclusive=False):
+            os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+            try:
+                replaced_size = os.stat(tile_path).st_size
+            except FileNotFoundError:
+                replaced_size = 0
+            temp_path = f"{tile_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as tile_file:
+                tile_file.write(data)
+            os.replace(temp_path, tile_path)
+            cache_size = add_recorded_size(self.path, len(data) - replaced_size)
+        if cache_size is None or cache_size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used tiles until the cache is below 90% of its
+        size limit.
+        """
+
+        with file_lock(os.path.join(self.path, "cache.lock"), exclusive=True):
+            tiles = []
+            cache_size = 0
+            for directory, directory_names, file_names in os.walk(self.path):
+                for file_name in file_names:
+                    if not file_name.endswith(".png"):
+                        continue
+                    tile_path = os.path.join(directory, file_name)
+                    try:
+                        tile_stat = os.stat(tile_path)
+                    except FileNotFoundError:
+                        continue
+                    tiles.append((tile_stat.st_mtime, tile_stat.st_size, tile_path))
+                    cache_size += tile_stat.st_size
+            if cache_size > self.max_bytes:
+                tiles.sort()
+                for last_used, tile_size, tile_path in tiles:
+                    if cache_size <= self.max_bytes * 0.9:
+                        break
+                    try:
+                        os.remove(tile_path)
+                    except FileNotFoundError:
+                        pass
+                    cache_size -= tile_size
+            write_recorded_size(self.path, cache_size)
+
+
+class FileCache:
+    """
+    On-disk cache of text values, shared by all processes using the same
+    directory.
+
+    Keys must be valid file names. Values that have not been used for the
+    TTL are removed, at most once per prune interval.
+    """
+
+    def __init__(self, name, path, ttl, prune_interval):
+        self.name = name
+        self.path = path
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self.last_pruned = time.time()
+        self.prune_lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def get(self, key):
+        """
+        Gets a cached value, or None if it is not cached.
+        """
+
+        file_path = os.path.join(self.path, key)
+        try:
+            with open(file_path, encoding="utf-8") as value_file:
+                value = value_file.read()
+            os.utime(file_path)
+        except OSError:
+            metrics.observe_cache(self.name, False)
+            return None
+        metrics.observe_cache(self.name, True)
+        return value
+
+    def set(self, key, value):
+        """
+        Stores a value, or marks it as used if it is already stored.
+        """
+
+        file_path = os.path.join(self.path, key)
+        try:
+            os.utime(file_path)
+        except FileNotFoundError:
+            temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as value_file:
+                value_file.write(value)
+            os.replace(temp_path, file_path)
+        self.prune()
+
+    def prune(self):
+        """
+        Removes values that have not been used for the TTL.
+        """
+
+        with self.prune_lock:
+            if time.time() - self.last_pruned < self.prune_interval:
+                return
+            self.last_pruned = time.time()
+        for entry in os.scandir(self.path):
+            try:
+                if entry.stat().st_mtime < self.last_pruned - self.ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
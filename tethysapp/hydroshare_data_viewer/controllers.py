@@ -1,5 +1,20 @@
+import hashlib
+import hmac
+import re
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import render
 from .app import HydroshareDataViewer as app
+from . import upstream
+from .metrics import render_metrics
+from .features import export_formats, serialize_features
+from .utilities import get_layer_fields, get_layer_feature_pages, get_layer_resource_id, get_layer_tile, \
+    get_current_resource_version, get_composite_map, start_prewarmer
+
+tile_max_age = app.get_custom_setting("tile_max_age") or 3600
+metrics_token = app.get_custom_setting("metrics_token")
+style_name_pattern = re.compile(r"^hdv_[0-9a-f]{24}$")
+composite_map_params = ("version", "crs", "srs", "bbox", "width", "height", "format", "transparent", "dpi", "format_options")
+composite_map_max_size = 4096
 
 
 def home(request):
@@ -8,15 +23,136 @@ def home(request):
 
     GET requests can be launched from either HydroShare or the Tethys
     Portal. Requests can contain URL query parameters describing a resource
-    or aggregation.
+    or aggregation. The first request in each worker starts the background
+    cache pre-warmer if it is enabled.
     """
 
+    start_prewarmer()
+
     context = {
         "resource_id": request.GET.get("resource_id"),
         "aggregation_id": request.GET.get("aggregation_path"),
         "geoserver_url": app.get_custom_setting("geoserver_url"),
         "hydroserver_url": app.get_custom_setting("hydroserver_url"),
-        "max_layers": app.get_custom_setting("max_layers")
+        "max_layers": app.get_custom_setting("max_layers"),
+        "layer_tiles": bool(app.get_custom_setting("geoserver_username")),
+        "workspace_snapshots": request.user.is_authenticated
     }
 
     return render(request, 'hydroshare_data_viewer/home.html', context)
+
+
+def export_layer(request):
+    """
+    Controller for exporting a layer's features.
+
+    Streams every feature of a vector or time series layer as CSV,
+    GeoJSON, or NDJSON. Features are fetched from GeoServer page by page
+    and written as they arrive, so the full layer is never held in memory.
+    """
+
+    layer_code = request.GET.get("layer_code")
+    export_format = request.GET.get("format", "csv")
+
+    if not layer_code or export_format not in export_formats:
+        return HttpResponseBadRequest("Invalid export request.")
+
+    field_names = [i["fieldName"] for i in get_layer_fields("vector", layer_code, get_layer_resource_id(layer_code))]
+    feature_pages = get_layer_feature_pages(layer_code, field_names if export_format == "csv" else None)
+    content_type, file_extension = export_formats[export_format]
+    file_name = ":".join(layer_code.split(":")[1:]) or layer_code
+
+    response = StreamingHttpResponse(
+        serialize_features(feature_pages, export_format, field_names),
+        content_type=content_type
+    )
+    response["Content-Disposition"] = f'attachment; filename="{file_name}.{file_extension}"'
+
+    return response
+
+
+def get_tile(request, z, x, y):
+    """
+    Controller for map tiles.
+
+    Serves 256 pixel EPSG:3857 tiles for a layer and registered style from
+    the app's tile cache. Tile ETags change with the layer's resource
+    version, so browsers can revalidate tiles without downloading them.
+    """
+
+    layer_code = request.GET.get("layer_code")
+    style_name = request.GET.get("style_name", "")
+    z, x, y = int(z), int(x), int(y)
+
+    if not layer_code or not style_name_pattern.match(style_name) or not 0 <= z <= 24 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return HttpResponseBadRequest("Invalid tile request.")
+
+    resource_version = get_current_resource_version(get_layer_resource_id(layer_code))
+    if resource_version is None:
+        data = get_layer_tile(layer_code, style_name, None, z, x, y)
+        if data is None:
+            return HttpResponse("Unable to render tile.", status=502)
+        response = HttpResponse(data, content_type="image/png")
+        response["Cache-Control"] = "no-store"
+        return response
+
+    etag = '"' + hashlib.sha1(repr((layer_code, style_name, resource_version, z, x, y)).encode()).hexdigest() + '"'
+    cache_control = f"public, max-age={tile_max_age}"
+
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+    else:
+        data = get_layer_tile(layer_code, style_name, resource_version, z, x, y)
+        if data is None:
+            return HttpResponse("Unable to render tile.", status=502)
+        response = HttpResponse(data, content_type="image/png")
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+
+    return response
+
+
+def composite_map(request):
+    """
+    Controller for composite map images.
+
+    Takes WMS GetMap parameters for the visible workspace layers, in
+    drawing order, with the style key of each layer, and returns all of
+    them rendered by GeoServer as a single image.
+    """
+
+    layer_codes = [i for i in request.GET.get("LAYERS", "").split(",") if i]
+    style_keys = request.GET.get("STYLES", "").split(",")
+    map_params = {i: request.GET[i.upper()] for i in composite_map_params if i.upper() in request.GET}
+
+    if not layer_codes or len(style_keys) != len(layer_codes) or not all(style_name_pattern.match(i) for i in style_keys):
+        return HttpResponseBadRequest("Invalid map request.")
+    if not all(map_params.get(i, "").isdigit() and 0 < int(map_params[i]) <= composite_map_max_size for i in ("width", "height")):
+        return HttpResponseBadRequest("Invalid map size.")
+
+    response = get_composite_map(layer_codes, style_keys, map_params)
+    if response is None:
+        return HttpResponse("Unknown layer style.", status=404)
+    if not response.ok or not response.headers.get("Content-Type", "").startswith("image/"):
+        return HttpResponse("Unable to render map.", status=502)
+
+    return HttpResponse(response.content, content_type=response.headers["Content-Type"])
+
+
+def metrics(request):
+    """
+    Controller for the app's metrics.
+
+    Returns upstream request latency, response sizes, and errors per
+    endpoint, view latency, cache hits and misses, and upstream connection
+    counts for this worker process in the Prometheus text format. If a
+    metrics token is set, requests must send it as a bearer token.
+    """
+
+    if metrics_token and not hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {metrics_token}"):
+        return HttpResponse("Unauthorized.", status=401)
+
+    return HttpResponse(
+        render_metrics(upstream.get_connection_stats()),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
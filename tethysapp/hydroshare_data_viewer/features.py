@@ -0,0 +1,204 @@
+import csv
+import io
+import json
+import re
+
+
+def get_feature_rank(fid, layer_count):
+    """
+    Gets the row index of a feature in the attribute table.
+
+    GeoServer returns features ordered by their fid as a string, so feature
+    "10" sorts before feature "2". This computes the position of a numeric
+    fid among the strings "1" through str(layer_count) directly, without
+    building or sorting the list of fids.
+    """
+
+    fid = int(fid)
+    if not 1 <= fid <= layer_count:
+        raise ValueError(f"Feature {fid} is not in a layer of {layer_count} features.")
+
+    fid_string = str(fid)
+    fid_length = len(fid_string)
+    rank = 0
+    for length in range(1, len(str(layer_count)) + 1):
+        lower = 10 ** (length - 1)
+        upper = min(10 ** length - 1, layer_count)
+        if length < fid_length:
+            bound = int(fid_string[:length])
+        elif length == fid_length:
+            bound = fid - 1
+        else:
+            bound = fid * 10 ** (length - fid_length) - 1
+        rank += max(0, min(upper, bound) - lower + 1)
+
+    return rank
+
+
+comparison_pattern = re.compile(r"^\s*(<=|>=|<>|!=|=|<|>)?\s*(-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*$")
+
+
+def quote_cql_name(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_cql_text(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def get_field_filter(field_name, field_type, search_value):
+    """
+    Gets a CQL condition matching one field against a search value.
+
+    Numerical fields accept a number with an optional comparison operator,
+    e.g. ">= 10", and are skipped for other values. Categorical fields match
+    values containing the search text, ignoring case.
+    """
+
+    if field_type == "numerical":
+        match = comparison_pattern.match(search_value)
+        if match is None:
+            return None
+        operator = {None: "=", "!=": "<>"}.get(match.group(1), match.group(1))
+        return f"{quote_cql_name(field_name)} {operator} {match.group(2)}"
+    else:
+        return f"{quote_cql_name(field_name)} ILIKE {quote_cql_text('%' + search_value + '%')}"
+
+
+def build_cql_filter(layer_fields, search_value, column_search_values):
+    """
+    Builds a CQL filter for the attribute table's search boxes.
+
+    layer_fields is a list of (field name, field type) pairs. The table
+    search matches features where any field matches, and each column search
+    must also match its own field. Returns None when nothing is searched.
+    """
+
+    conditions = []
+    search_value = search_value.strip()
+    if search_value:
+        field_filters = [
+            get_field_filter(field_name, field_type, search_value)
+            for field_name, field_type in layer_fields
+        ]
+        field_filters = [i for i in field_filters if i is not None]
+        conditions.append(" OR ".join(field_filters) if field_filters else "EXCLUDE")
+    for (field_name, field_type), column_search_value in zip(layer_fields, column_search_values):
+        column_search_value = column_search_value.strip()
+        if column_search_value:
+            conditions.append(get_field_filter(field_name, field_type, column_search_value) or "EXCLUDE")
+    if not conditions:
+        return None
+    return " AND ".join(f"({i})" for i in conditions)
+
+
+def build_sort_by(field_names, sort_order):
+    """
+    Builds a WFS sortBy value for the attribute table's column ordering.
+
+    sort_order is a list of (field index, direction) pairs, where direction
+    is "asc" or "desc". Returns None for the layer's natural order.
+    """
+
+    sort_by = [
+        f"{field_names[field_index]} {'DESC' if direction == 'desc' else 'ASC'}"
+        for field_index, direction in sort_order
+        if 0 <= field_index < len(field_names)
+    ]
+    return ",".join(sort_by) or None
+
+
+def get_table_query(query, field_count):
+    """
+    Gets the search and ordering of a DataTables attribute table request.
+
+    The first two table columns hold the feature ID and row number. Returns
+    the table search value, the search value of each field's column, and a
+    list of (field index, direction) pairs for build_sort_by.
+    """
+
+    search_value = query.get("search[value]", "")
+    column_search_values = [query.get(f"columns[{i + 2}][search][value]", "") for i in range(field_count)]
+    sort_order = []
+    while f"order[{len(sort_order)}][column]" in query:
+        sort_order.append((
+            int(query[f"order[{len(sort_order)}][column]"]) - 2,
+            query.get(f"order[{len(sort_order)}][dir]", "asc")
+        ))
+    return search_value, column_search_values, sort_order
+
+
+def build_table_params(layer_code, field_names, start, length, cql_filter=None, sort_by=None):
+    """
+    Builds WFS GetFeature parameters for a page of the attribute table.
+    """
+
+    request_params = {
+        "service": "WFS",
+        "version": "1.3.0",
+        "request": "GetFeature",
+        "typeName": layer_code,
+        "propertyName": ",".join(field_names),
+        "outputFormat": "application/json",
+        "startIndex": start,
+        "count": length
+    }
+    if cql_filter is not None:
+        request_params["CQL_FILTER"] = cql_filter
+    if sort_by is not None:
+        request_params["sortBy"] = sort_by
+    return request_params
+
+
+def build_table_rows(features, start, field_names):
+    """
+    Builds attribute table rows for a page of GeoJSON features.
+
+    Each row holds the feature ID, the row number, and the feature's field
+    values in column order.
+    """
+
+    return [
+        [feature["id"], i + start + 1] + [feature["properties"].get(field_name) for field_name in field_names]
+        for i, feature in enumerate(features)
+    ]
+
+
+export_formats = {
+    "csv": ("text/csv", "csv"),
+    "geojson": ("application/geo+json", "geojson"),
+    "ndjson": ("application/x-ndjson", "ndjson")
+}
+
+
+def serialize_features(feature_pages, export_format, field_names):
+    """
+    Serializes pages of GeoJSON features as they arrive.
+
+    Yields CSV rows of feature attributes, a GeoJSON feature collection, or
+    one GeoJSON feature per line (NDJSON). Only one page of features is
+    held at a time.
+    """
+
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["fid"] + field_names)
+        for features in feature_pages:
+            for feature in features:
+                writer.writerow([feature["id"]] + [feature["properties"].get(i) for i in field_names])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    elif export_format == "geojson":
+        yield '{"type": "FeatureCollection", "features": ['
+        separator = ""
+        for features in feature_pages:
+            if features:
+                yield separator + ",".join(json.dumps(feature) for feature in features)
+                separator = ","
+        yield "]}"
+    elif export_format == "ndjson":
+        for features in feature_pages:
+            yield "".join(json.dumps(feature) + "\n" for feature in features)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Loads layer metadata of popular and recently updated resources into the
+    app caches.
+
+    Run from cron alongside a shared cache, so that every worker process
+    reads the metadata loaded by this command.
+    """
+
+    help = "Loads layer metadata, feature counts, and field statistics of the most viewed and most recently updated HydroShare resources into the app caches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--resources", type=int, help="number of most viewed and of most recently updated resources to load")
+        parser.add_argument("--concurrency", type=int, help="maximum number of concurrent upstream requests")
+        parser.add_argument("--rate", type=float, help="maximum number of upstream requests per second")
+
+    def handle(self, *args, **options):
+        from tethysapp.hydroshare_data_viewer.utilities import prewarm_resources
+
+        warmed_resources, prewarm_errors = prewarm_resources(options["resources"], options["concurrency"], options["rate"])
+        for resource in warmed_resources:
+            self.stdout.write(f"{resource['resourceId']}: {resource['layerCount']} layers")
+        for error in prewarm_errors:
+            self.stderr.write(f"{error['resourceId']} {error.get('layerCode') or ''}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(f"Pre-warmed {len(warmed_resources)} resources with {len(prewarm_errors)} errors."))
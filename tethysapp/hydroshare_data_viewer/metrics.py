@@ -0,0 +1,274 @@
+import asyncio
+import contextvars
+import functools
+import re
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl
+from django.http import JsonResponse
+
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+endpoint_patterns = (
+    (re.compile(r"/hsapi/resource/[^/]+/sysmeta/?$"), "hydroshare.sysmeta"),
+    (re.compile(r"/hsapi/resource/?$"), "hydroshare.resource_list"),
+    (re.compile(r"/rest/layers/[^/]+$"), "geoserver.rest_layer"),
+    (re.compile(r"/rest/styles(/[^/]+)?$"), "geoserver.rest_styles"),
+    (re.compile(r"/wof/.+/values/?$"), "hydroserver.values")
+)
+
+metrics_lock = threading.Lock()
+upstream_latency = {}
+upstream_bytes = {}
+upstream_errors = {}
+view_latency = {}
+view_errors = {}
+cache_hits = {}
+cache_misses = {}
+coalesced_calls = {}
+
+request_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+class Histogram:
+    """
+    Cumulative latency histogram in the Prometheus bucket layout.
+    """
+
+    def __init__(self, buckets=latency_buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[i] += 1
+        self.count += 1
+        self.total += value
+
+
+class RequestTimer:
+    """
+    Upstream call and cache timings for a single view request.
+
+    Timings are added from every thread working on the request, so the
+    timer is shared through a context variable and guarded by a lock.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.endpoints = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds):
+        with self.lock:
+            endpoint_timing = self.endpoints.setdefault(endpoint, [0.0, 0])
+            endpoint_timing[0] += seconds
+            endpoint_timing[1] += 1
+
+    def add_cache(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_header(self):
+        """
+        Gets the Server-Timing header value for the request.
+
+        Each upstream endpoint reports its total time and number of calls.
+        Calls made in parallel overlap, so their durations can add up to more
+        than the total time.
+        """
+
+        with self.lock:
+            timings = [
+                f'{endpoint};dur={seconds * 1000:.1f};desc="calls: {count}"'
+                for endpoint, (seconds, count) in sorted(self.endpoints.items())
+            ]
+            timings.append(f'cache;desc="hits: {self.hits}, misses: {self.misses}"')
+        timings.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(timings)
+
+
+def get_endpoint_name(url, params=None):
+    """
+    Gets the metric name of an upstream endpoint.
+
+    OGC requests are named by service and request, e.g. "geoserver.wfs_getfeature",
+    with "_hits" added to feature counts. Other requests are named by the path
+    patterns in endpoint_patterns.
+    """
+
+    url_parts = urlsplit(url)
+    query = dict(parse_qsl(url_parts.query))
+    if isinstance(params, dict):
+        query.update(params)
+    query = {str(key).lower(): str(value).lower() for key, value in query.items()}
+    if "request" in query:
+        service = query.get("service") or url_parts.path.rstrip("/").rsplit("/", 1)[-1].lower()
+        endpoint = f"geoserver.{service}_{query['request']}"
+        if query.get("resulttype") == "hits":
+            endpoint += "_hits"
+        return endpoint
+    for pattern, endpoint in endpoint_patterns:
+        if pattern.search(url_parts.path):
+            return endpoint
+    return "other"
+
+
+def observe_upstream(endpoint, seconds, response_bytes=0, error=False):
+    """
+    Records an upstream call in the endpoint's metrics and the current
+    request's timings.
+    """
+
+    with metrics_lock:
+        upstream_latency.setdefault(endpoint, Histogram()).observe(seconds)
+        upstream_bytes[endpoint] = upstream_bytes.get(endpoint, 0) + response_bytes
+        if error:
+            upstream_errors[endpoint] = upstream_errors.get(endpoint, 0) + 1
+    timer = request_timer.get()
+    if timer is not None:
+        timer.add(endpoint, seconds)
+
+
+def observe_cache(cache_name, hit):
+    """
+    Records a cache hit or miss.
+    """
+
+    with metrics_lock:
+        counts = cache_hits if hit else cache_misses
+        counts[cache_name] = counts.get(cache_name, 0) + 1
+    timer = request_timer.get()
+    if timer is not None:
+        timer.add_cache(hit)
+
+
+def observe_coalesced(call_name):
+    """
+    Records a call that waited for an identical call in flight instead of
+    loading its value again.
+    """
+
+    with metrics_lock:
+        coalesced_calls[call_name] = coalesced_calls.get(call_name, 0) + 1
+
+
+def observe_view(view_name, seconds, error=False):
+    """
+    Records the time taken by a view.
+    """
+
+    with metrics_lock:
+        view_latency.setdefault(view_name, Histogram()).observe(seconds)
+        if error:
+            view_errors[view_name] = view_errors.get(view_name, 0) + 1
+
+
+def submit(executor, func, *args):
+    """
+    Submits a call to an executor in a copy of the current context.
+
+    Upstream calls made by the worker thread are then added to the timings
+    of the request that submitted them.
+    """
+
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+def finish_view(view_name, timer, response, error):
+    request_timer.set(None)
+    observe_view(view_name, time.perf_counter() - timer.start, error)
+    if isinstance(response, JsonResponse):
+        response["Server-Timing"] = timer.get_header()
+    return response
+
+
+def timed_view(view):
+    """
+    Decorates a sync or async view to record its metrics.
+
+    JSON responses get a Server-Timing header with the time spent in each
+    upstream endpoint and the view's cache hits and misses.
+    """
+
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            timer = RequestTimer()
+            request_timer.set(timer)
+            try:
+                response = await view(request, *args, **kwargs)
+            except Exception:
+                finish_view(view.__name__, timer, None, True)
+                raise
+            return finish_view(view.__name__, timer, response, False)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        timer = RequestTimer()
+        request_timer.set(timer)
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            finish_view(view.__name__, timer, None, True)
+            raise
+        return finish_view(view.__name__, timer, response, False)
+    return wrapper
+
+
+def format_labels(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+def render_histograms(lines, metric_name, label_name, histograms):
+    lines.append(f"# TYPE {metric_name} histogram")
+    for label_value, histogram in sorted(histograms.items()):
+        for bucket, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{metric_name}_bucket{{{format_labels(((label_name, label_value), ("le", bucket)))}}} {count}')
+        lines.append(f'{metric_name}_bucket{{{format_labels(((label_name, label_value), ("le", "+Inf")))}}} {histogram.count}')
+        lines.append(f'{metric_name}_sum{{{label_name}="{label_value}"}} {histogram.total}')
+        lines.append(f'{metric_name}_count{{{label_name}="{label_value}"}} {histogram.count}')
+
+
+def render_counters(lines, metric_name, label_name, counters):
+    lines.append(f"# TYPE {metric_name} counter")
+    for label_value, count in sorted(counters.items()):
+        lines.append(f'{metric_name}{{{label_name}="{label_value}"}} {count}')
+
+
+def render_metrics(connection_stats=None):
+    """
+    Renders the metrics of this worker process in the Prometheus text format.
+
+    connection_stats are the upstream connection counts from
+    upstream.get_connection_stats.
+    """
+
+    lines = []
+    with metrics_lock:
+        render_histograms(lines, "hydroshare_data_viewer_upstream_request_seconds", "endpoint", upstream_latency)
+        render_counters(lines, "hydroshare_data_viewer_upstream_response_bytes_total", "endpoint", upstream_bytes)
+        render_counters(lines, "hydroshare_data_viewer_upstream_errors_total", "endpoint", upstream_errors)
+        render_histograms(lines, "hydroshare_data_viewer_view_seconds", "view", view_latency)
+        render_counters(lines, "hydroshare_data_viewer_view_errors_total", "view", view_errors)
+        render_counters(lines, "hydroshare_data_viewer_cache_hits_total", "cache", cache_hits)
+        render_counters(lines, "hydroshare_data_viewer_cache_misses_total", "cache", cache_misses)
+        render_counters(lines, "hydroshare_data_viewer_coalesced_calls_total", "call", coalesced_calls)
+    if connection_stats is not None:
+        for stat in ("requests", "opened", "reused"):
+            render_counters(
+                lines,
+                f"hydroshare_data_viewer_upstream_connections_{stat}_total",
+                "host",
+                {host: host_stats[stat] for host, host_stats in connection_stats.items()}
+            )
+    return "\n".join(lines) + "\n"
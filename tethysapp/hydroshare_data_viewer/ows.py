@@ -0,0 +1,74 @@
+from lxml import etree
+
+WFS_NS = "{http://www.opengis.net/wfs}"
+WCS_NS = "{http://www.opengis.net/wcs/1.1.1}"
+XSD_NS = "{http://www.w3.org/2001/XMLSchema}"
+
+numerical_field_types = ("xsd:long", "xsd:int", "xsd:double", "xsd:float")
+
+
+def parse_wfs_capabilities(content):
+    """
+    Parses a WFS GetCapabilities document.
+
+    Returns a list of (layer code, FeatureType element) pairs.
+    """
+
+    wfs_capabilities = etree.fromstring(content)
+    return [
+        (wfs_layer.find(f"{WFS_NS}Name").text, wfs_layer)
+        for wfs_layer in wfs_capabilities.iter(f"{WFS_NS}FeatureType")
+    ]
+
+
+def parse_wcs_capabilities(content):
+    """
+    Parses a WCS 1.1.1 GetCapabilities document.
+
+    Returns a list of (layer code, CoverageSummary element) pairs.
+    """
+
+    wcs_capabilities = etree.fromstring(content)
+    return [
+        (wcs_layer.find(f"{WCS_NS}Identifier").text, wcs_layer)
+        for wcs_layer in wcs_capabilities.iter(f"{WCS_NS}CoverageSummary")
+    ]
+
+
+def parse_feature_type_fields(content):
+    """
+    Parses the fields of a WFS DescribeFeatureType document.
+
+    The first element of the feature type is its geometry and is skipped.
+    Integer and floating point fields are numerical; all other fields are
+    categorical.
+    """
+
+    sequence = next(etree.fromstring(content).iter(f"{XSD_NS}sequence"))
+    return [{
+        "fieldName": i.get("name"),
+        "fieldType": "numerical" if i.get("type") in numerical_field_types else "categorical",
+        "fieldStats": None
+    } for i in list(sequence.iter(f"{XSD_NS}element"))[1:]]
+
+
+def get_layer_coverage(layer_type, layer_response):
+    """
+    Gets coverage for a layer.
+
+    Determines the bounding box for vector and raster layers from their
+    capabilities element.
+    """
+
+    if layer_type == "raster":
+        ns = "{http://www.opengis.net/ows/1.1}"
+    else:
+        ns = "{http://www.opengis.net/ows}"
+    max_x, max_y = next(layer_response.iter(f"{ns}UpperCorner")).text.split(" ")[:2]
+    min_x, min_y = next(layer_response.iter(f"{ns}LowerCorner")).text.split(" ")[:2]
+    return {
+        "maxX": float(max_x),
+        "maxY": float(max_y),
+        "minX": float(min_x),
+        "minY": float(min_y)
+    }
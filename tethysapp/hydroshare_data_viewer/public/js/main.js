@@ -11,13 +11,19 @@
     var basemapTerrain;
     var basemapLabels;
     var overviewMap;
+    var compositeWMS;
+    var compositeLayer;
     var discoverTable;
     var workspaceTable;
     var attributeTable;
     var timeseriesPlot;
+    var timeseriesOverview = [];
+    var timeseriesMaxPoints = 2000;
     var discoverSearchTimeout;
     var resizeTimeout;
     var sliderTimeout;
+    var workspaceSaveTimeout;
+    var workspaceRestored = false;
     var layerList = {};
     var aggregationsList = [];
     var selectedFeature = {};
@@ -50,10 +56,12 @@
         $(document).ready(function(){
             buildWorkspaceTable();
             $('.workspace-loading-container').hide();
-            if ($('#resource_id').text() !== 'None') {
-                $('.workspace-loading-container').show();
-                loadHydroShareData($('#resource_id').text());
-            };
+            restoreWorkspace(function() {
+                if ($('#resource_id').text() !== 'None') {
+                    $('.workspace-loading-container').show();
+                    loadHydroShareData($('#resource_id').text());
+                };
+            });
         });
 
         // Sets initial nav tab.
@@ -293,7 +301,7 @@
         map.on('click', function(evt) {
             if (activeLayer !== null) {
                 var viewResolution = (mapView.getResolution());
-                var url = layerList[activeLayer]['layerSource'].getSource().getGetFeatureInfoUrl(
+                var url = layerList[activeLayer]['layerWMS'].getGetFeatureInfoUrl(
                     evt.coordinate, viewResolution, 'EPSG:3857',
                     {'INFO_FORMAT': 'application/json'});
                 var featureUrl = url
@@ -380,6 +388,28 @@
         });
         map.addControl(overviewMap);
 
+        // Creates composite image of visible workspace layers
+        if ($('#layer_tiles').text() !== 'True') {
+            compositeWMS = new ol.source.ImageWMS({
+                url: '/apps/hydroshare-data-viewer/composite-map/',
+                params: {'LAYERS': '', 'STYLES': ''},
+                serverType: 'geoserver',
+                crossOrigin: 'Anonymous'
+            });
+            compositeWMS.on('imageloadstart', function() {
+                compositeWMS.getParams()['LAYERS'].split(',').filter(x => x in layerList).forEach(x => setLayerLoading(x, true));
+            });
+            compositeWMS.on(['imageloadend', 'imageloaderror'], function() {
+                compositeWMS.getParams()['LAYERS'].split(',').filter(x => x in layerList).forEach(x => setLayerLoading(x, false));
+            });
+            compositeLayer = new ol.layer.Image({
+                source: compositeWMS,
+                visible: false,
+                zIndex: 1
+            });
+            map.addLayer(compositeLayer);
+        };
+
         // Load initial basemap.
         updateBasemap();
     };
@@ -400,11 +430,11 @@
                     var fillGradient = layerList[layerCode]['layerSymbology']['fillGradient'];
                     var fillField = layerList[layerCode]['layerSymbology']['fillField'];
                     var fieldStats = layerList[layerCode]['layerFields'][layerList[layerCode]['layerFields'].findIndex(x => x.fieldName === fillField)]['fieldStats'];
-                    if (fieldStats !== 'loading') {
+                    if (fieldStats !== 'loading' && fieldStats !== null) {
                         var colorMap = getColorMap(fillGradient, fieldStats);
                         var svgGradient = ``;
                         for (var i = 0; i < colorMap['colors'].length; i++) { 
-                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - fieldStats['min']) / (fieldStats['max'] - fieldStats['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
+                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - colorMap['min']) / (colorMap['max'] - colorMap['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
                         };
                         var layerGradient = `
                             <svg height="30" width="200" style="display: block;">
@@ -417,12 +447,13 @@
                                 .grad-text { font: 14px sans-serif; }
                               </style>
                                 <rect class="workspace-icon" width="200" height="10" fill="url(#${'grad-' + gradientCode})" stroke="black" stroke-width="0.3"/>
-                                <text x=0 y=25 class="grad-text">${fieldStats['min'].toPrecision(4)}</text>
-                                <text text-anchor="end" x=200 y=25 class="grad-text">${fieldStats['max'].toPrecision(4)}</text>
+                                <text x=0 y=25 class="grad-text">${(colorMap['empty'] === true) ? 'No values' : colorMap['min'].toPrecision(4)}</text>
+                                <text text-anchor="end" x=200 y=25 class="grad-text">${(colorMap['empty'] === true) ? '' : colorMap['max'].toPrecision(4)}</text>
                             </svg>
                         `;
                         $('.legend-content').append(`
                             <div class="legend-gradient">
+                                ${('histogram' in fieldStats) ? createHistogram(fieldStats['histogram'], colorMap) : ''}
                                 ${layerGradient}
                             </div>
                         `);
@@ -432,6 +463,23 @@
         };
     };
 
+    /* Creates SVG histogram of raster values over a color map range */
+    function createHistogram(histogram, colorMap) {
+        var maxCount = Math.max(...histogram['counts'], 1);
+        var rangeWidth = colorMap['max'] - colorMap['min'];
+        var histogramBars = ``;
+        for (var i = 0; i < histogram['counts'].length; i++) {
+            var barStart = Math.max(0, (histogram['edges'][i] - colorMap['min']) / rangeWidth);
+            var barEnd = Math.min(1, (histogram['edges'][i + 1] - colorMap['min']) / rangeWidth);
+            if (barEnd <= barStart || !(rangeWidth > 0)) {
+                continue;
+            };
+            var barHeight = 20 * histogram['counts'][i] / maxCount;
+            histogramBars = histogramBars + `<rect x="${barStart * 200}" y="${20 - barHeight}" width="${(barEnd - barStart) * 200}" height="${barHeight}" fill="gray"/>`;
+        };
+        return `<svg height="20" width="200" style="display: block;">${histogramBars}</svg>`;
+    };
+
     /* Updates OpenLayers basemap */
     function updateBasemap() {
 
@@ -606,19 +654,34 @@
             try {
                 selectedFeature['layerSource'].setZIndex(layerList[activeLayer]['layerOrder'] + 1);
             } catch {};
+            updateCompositeMap();
+            saveWorkspace();
         }, 100);
     };
 
+    /* Updates the composite image of visible workspace layers */
+    function updateCompositeMap() {
+        if (compositeWMS === undefined) {
+            return;
+        };
+        var compositeLayers = Object.values(layerList).filter(x => x['layerVisible'] === true && 'layerStyle' in x);
+        compositeLayers.sort((a, b) => a['layerOrder'] - b['layerOrder']);
+        compositeWMS.updateParams({
+            'LAYERS': compositeLayers.map(x => x['layerCode']).join(','),
+            'STYLES': compositeLayers.map(x => x['layerStyle']['styleKey']).join(',')
+        });
+        compositeLayer.setVisible(compositeLayers.length > 0);
+    };
+
     /* Updates map selected feature */
     function updateMapFeature() {
         try {
             map.removeLayer(selectedFeature['layerSource']);
         } catch {};
-        if (!($.isEmptyObject(selectedLayer))) {
-            var sldBody = buildLayerStyle(layerList[activeLayer], true);
+        if (!($.isEmptyObject(selectedLayer)) && layerList[activeLayer]['highlightStyle']) {
             selectedFeature['layerWMS'] = new ol.source.ImageWMS({
                 url: $('#geoserver_url').text() + '/wms',
-                params: {'LAYERS': layerList[activeLayer]['layerCode'], 'SLD_BODY': sldBody},
+                params: Object.assign({'LAYERS': layerList[activeLayer]['layerCode'], 'FEATUREID': selectedLayer['fid'].toString()}, getStyleParams(layerList[activeLayer]['highlightStyle'])),
                 serverType: 'geoserver',
                 crossOrigin: 'Anonymous'
             });
@@ -633,6 +696,11 @@
         };
     };
 
+    /* Checks whether the attribute table is sorted or searched */
+    function attributeTableFiltered() {
+        return attributeTable.order().length > 0 || attributeTable.search() !== '' || attributeTable.columns().search().toArray().some(x => x !== '');
+    };
+
     /* Sets selected feature of a layer */
     function selectFeature(selectType, fid, feature, row) {
         if (selectType === 'map') {
@@ -650,7 +718,9 @@
                         buildPlot();
                     };
                     updateMapFeature();
-                    $('#attribute-table').DataTable().scroller.toPosition(selectedLayer['feature'], false);
+                    if (!attributeTableFiltered()) {
+                        $('#attribute-table').DataTable().scroller.toPosition(selectedLayer['feature'], false);
+                    };
                     attributeTable.rows().eq(0).each(function(index){
                         var row = attributeTable.row(index);
                         var data = row.data();
@@ -812,6 +882,7 @@
         $('.layer-options-container').hide();
         $('#show-layer-btn').addClass('hidden');
         $('#hide-layer-btn').addClass('hidden');
+        $('#download-data-container').addClass('hidden');
         $('.data-viewer-tab').removeClass('active-tab');
         $('#label-field-input').empty();
         try {
@@ -834,6 +905,9 @@
             $('#layer-options-view').show();
             $('#layer-actions-container').show();
             $('#layer-name-input').val(layerList[activeLayer]['layerName']);
+            if (layerList[activeLayer]['layerType'] !== 'raster') {
+                $('#download-data-container').removeClass('hidden');
+            };
             switch (layerList[activeLayer]['layerType']) {
                 case 'timeseries':
                     $('#attr-table').show();
@@ -930,8 +1004,10 @@
         delete layerList[activeLayer];
         activeLayer = null;
         activeResource = null;
+        updateCompositeMap();
         updateDataViewer();
         updateLegend();
+        saveWorkspace();
     };
 
     /* Updates Layer Visibility */
@@ -946,11 +1022,13 @@
             $('#show-layer-btn').addClass('hidden');
             $('#hide-layer-btn').removeClass('hidden');
         };
-        layerList[activeLayer]['layerSource'].setVisible(layerList[activeLayer]['layerVisible']);
+        layerList[activeLayer]['layerSource'].setVisible(layerList[activeLayer]['layerVisible'] && 'layerStyle' in layerList[activeLayer] && compositeWMS === undefined);
+        updateCompositeMap();
         try {
             selectedFeature['layerSource'].setVisible(layerList[activeLayer]['layerVisible']);
         } catch {};
         updateLegend();
+        saveWorkspace();
     };
 
     /* Changes Layer Display Name */
@@ -964,6 +1042,7 @@
             };
         });
         updateLegend();
+        saveWorkspace();
     };
 
     /* Cancels layer rename */
@@ -1003,13 +1082,19 @@
                             parseFloat(response['boundingBox']['max_y'])
                         );
                     };
+                    response['layerList'].forEach(x => x['lastUpdated'] = response['lastUpdated']);
                     buildAggregationList(response['layerList']);
+                    for (var i = 0; i < response['layerErrors'].length; i++) {
+                        console.log('Layer Load Failed: ' + response['layerErrors'][i]['layerCode']);
+                    };
                     $('.resource-info-container').show();
                     $('.data-view-loading-container').hide();
                     if (addLayers === true) {
                         $('.workspace-loading-container').hide();
                         for (var i = 0; i < response['layerList'].length; i++) {
-                            addLayerToMap(response['layerList'][i]);
+                            if (!(response['layerList'][i]['layerCode'] in layerList)) {
+                                addLayerToMap(response['layerList'][i]);
+                            };
                         };
                     };
                 };
@@ -1021,6 +1106,85 @@
         });
     };
 
+    /* Saves the workspace layers and their settings for the next session */
+    function saveWorkspace() {
+        // Saving waits for a successful restore, so a failed or unfinished restore never replaces the saved workspace
+        if ($('#workspace_snapshots').text() !== 'True' || workspaceRestored === false) {
+            return;
+        };
+        clearTimeout(workspaceSaveTimeout);
+        workspaceSaveTimeout = setTimeout(function() {
+            var workspaceLayers = [];
+            $('#workspace-table').find('tbody').find('tr[layer-code]').each(function(i, r) {
+                var layerData = layerList[$(r).attr('layer-code')];
+                workspaceLayers.push({
+                    'layerCode': layerData['layerCode'],
+                    'layerName': layerData['layerName'],
+                    'layerCoverage': layerData['layerCoverage'],
+                    'layerType': layerData['layerType'],
+                    'layerFields': layerData['layerFields'].map(x => Object.assign({}, x, {
+                        'fieldStats': (x['fieldStats'] === 'loading') ? null : x['fieldStats']
+                    })),
+                    'layerSymbology': layerData['layerSymbology'],
+                    'layerVisible': layerData['layerVisible'],
+                    'lastUpdated': layerData['lastUpdated']
+                });
+            });
+            $.ajax({
+                headers: {
+                    'X-CSRFToken': getCookie('csrftoken')
+                },
+                type: 'POST',
+                data: {
+                    'workspace': JSON.stringify({'layers': workspaceLayers})
+                },
+                url: '/apps/hydroshare-data-viewer/ajax/save-workspace/',
+                success: function(response) {
+                    if ('error' in response) {
+                        console.log('Workspace Save Failed: ' + response['error']);
+                    };
+                },
+                error: function(response) {
+                    console.log('Workspace Save Failed');
+                }
+            });
+        }, 1000);
+    };
+
+    /* Restores the workspace layers saved in the last session */
+    function restoreWorkspace(callback) {
+        if ($('#workspace_snapshots').text() !== 'True') {
+            callback();
+            return;
+        };
+        $('.workspace-loading-container').show();
+        $.ajax({
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            type: 'POST',
+            url: '/apps/hydroshare-data-viewer/ajax/restore-workspace/',
+            success: function(response) {
+                $('.workspace-loading-container').hide();
+                for (var i = 0; i < response['layerErrors'].length; i++) {
+                    console.log('Layer Load Failed: ' + response['layerErrors'][i]['layerCode']);
+                };
+
+                // Layers are added to the top of the workspace, so the bottom layer is added first
+                for (var i = response['layerList'].length - 1; i >= 0; i--) {
+                    addLayerToMap(response['layerList'][i]);
+                };
+                workspaceRestored = !('error' in response);
+                callback();
+            },
+            error: function(response) {
+                $('.workspace-loading-container').hide();
+                console.log('Workspace Restore Failed');
+                callback();
+            }
+        });
+    };
+
     /* Builds aggregation table */
     function buildAggregationList(aggregationList) {
         $('#resource-aggregation-list').empty();
@@ -1129,47 +1293,51 @@
         $(rowNode).find('td').eq(1).addClass('workspace-layer-name');
         $(rowNode).find('td').eq(2).addClass('workspace-layer-move');
 
-        // Gets SLD body for layer
-        var sldBody = buildLayerStyle(layerData, false);
-
         // Creates layer WMS object
         layerList[layerCode]['layerWMS'] = new ol.source.ImageWMS({
             url: $('#geoserver_url').text() + '/wms',
-            params: {'LAYERS': layerList[layerCode]['layerCode'], 'SLD_BODY': sldBody},
+            params: {'LAYERS': layerList[layerCode]['layerCode']},
             serverType: 'geoserver',
             crossOrigin: 'Anonymous'
         });
 
-        // Adds spinning icon to layer while layer is loading
-        layerList[layerCode]['layerWMS'].on('imageloadstart', function() {
-            workspaceTable.rows().every(function() {
-                var tableRow = this.data();
-                var tableLayerCode = tableRow[1];
-                if (tableLayerCode === layerCode) {
-                    workspaceTable.cell(this[0][0], 2).data('<img class="workspace-loading-icon" src="/static/hydroshare_data_viewer/images/spinner.gif">');
-                };
+        // Creates layer map object, shown once its style is registered
+        if ($('#layer_tiles').text() === 'True') {
+            layerList[layerCode]['layerTiles'] = new ol.source.XYZ({
+                crossOrigin: 'Anonymous'
             });
-        });
+            layerList[layerCode]['tilesLoading'] = 0;
 
-        // Adds layer icon to layer when layer finishes loading
-        layerList[layerCode]['layerWMS'].on('imageloadend', function() {
-            var layerIcon = createLayerIcon(layerCode);
-            workspaceTable.rows().every(function() {
-                var tableRow = this.data();
-                var tableLayerCode = tableRow[1];
-                if (tableLayerCode === layerCode) {
-                    workspaceTable.cell(this[0][0], 2).data(layerIcon);
+            // Shows loading icon while any tile of the layer is loading
+            layerList[layerCode]['layerTiles'].on('tileloadstart', function() {
+                layerList[layerCode]['tilesLoading'] += 1;
+                setLayerLoading(layerCode, true);
+            });
+            layerList[layerCode]['layerTiles'].on(['tileloadend', 'tileloaderror'], function() {
+                layerList[layerCode]['tilesLoading'] -= 1;
+                if (layerList[layerCode]['tilesLoading'] === 0) {
+                    setLayerLoading(layerCode, false);
                 };
             });
-        });
 
-        // Creates layer image object
-        layerList[layerCode]['layerSource'] = new ol.layer.Image({
-            source: layerList[layerCode]['layerWMS']
-        });
+            layerList[layerCode]['layerSource'] = new ol.layer.Tile({
+                source: layerList[layerCode]['layerTiles'],
+                visible: false
+            });
+        } else {
+
+            // Layer is drawn as part of the composite map image
+            layerList[layerCode]['layerSource'] = new ol.layer.Image({
+                source: layerList[layerCode]['layerWMS'],
+                visible: false
+            });
+        };
+        updateLayerStyle(layerCode);
 
         // Add layer to map
-        map.addLayer(layerList[layerCode]['layerSource']);
+        if (compositeWMS === undefined) {
+            map.addLayer(layerList[layerCode]['layerSource']);
+        };
 
         //Reorder map layers
         reorderMapLayers();
@@ -1177,11 +1345,30 @@
         // Update legend
         updateLegend();
 
+        // Saves workspace
+        saveWorkspace();
+
         return true;
     };
 
+    /* Switches a workspace layer icon between its loading and layer icons */
+    function setLayerLoading(layerCode, loading) {
+        var layerIcon = (loading === true) ? '<img class="workspace-loading-icon" src="/static/hydroshare_data_viewer/images/spinner.gif">' : createLayerIcon(layerCode);
+        workspaceTable.rows().every(function() {
+            var tableRow = this.data();
+            var tableLayerCode = tableRow[1];
+            if (tableLayerCode === layerCode) {
+                workspaceTable.cell(this[0][0], 2).data(layerIcon);
+            };
+        });
+    };
+
     /* Gets statistics metadata for a layer field */
     function getFieldStats(layerType, layerCode, resourceId, fieldName, fieldType) {
+        if (layerType !== 'raster') {
+            getLayerFieldStats(layerCode);
+            return;
+        };
         $.ajax({
             headers: {
                 'X-CSRFToken': getCookie('csrftoken')
@@ -1196,9 +1383,39 @@
             },
             url: '/apps/hydroshare-data-viewer/ajax/get-field-statistics/',
             success: function(response) {
-                layerList[response['layer_code']]['layerFields'][layerList[response['layer_code']]['layerFields'].findIndex(x => x.fieldName === response['field_name'])]['fieldStats'] = {
-                    'min': response['min'],
-                    'max': response['max']
+                layerList[response['layer_code']]['layerFields'][layerList[response['layer_code']]['layerFields'].findIndex(x => x.fieldName === response['field_name'])]['fieldStats'] = response['field_stats'];
+                if (response['layer_code'] !== activeLayer) {
+                    updateLayerStyle(response['layer_code']);
+                };
+                updateLayerSymbology(true);
+            },
+            error: function(response) {
+                console.log('Layer Load Failed');
+            }
+        });
+    };
+
+    /* Gets statistics metadata for all numeric fields of a layer */
+    function getLayerFieldStats(layerCode) {
+        $.ajax({
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            type: 'POST',
+            data: {
+                'layer_code': layerCode
+            },
+            url: '/apps/hydroshare-data-viewer/ajax/get-layer-field-statistics/',
+            success: function(response) {
+                var layerFields = layerList[response['layer_code']]['layerFields'];
+                for (var fieldName in response['field_stats']) {
+                    var fieldIndex = layerFields.findIndex(x => x.fieldName === fieldName);
+                    if (fieldIndex !== -1) {
+                        layerFields[fieldIndex]['fieldStats'] = response['field_stats'][fieldName];
+                    };
+                };
+                if (response['layer_code'] !== activeLayer) {
+                    updateLayerStyle(response['layer_code']);
                 };
                 updateLayerSymbology(true);
             },
@@ -1208,354 +1425,84 @@
         });
     };
 
-    /* Builds layer SLD */
-    function buildLayerStyle(layerData, filter) {
+    /* Gets statistics of the field used by a layer's gradient symbology */
+    function getStyleFieldStats(layerData) {
+        var layerSymbology = layerData['layerSymbology'];
+        if (layerData['layerType'] === 'line') {
+            var styleField = (layerSymbology['strokeType'] === 'gradient') ? layerSymbology['strokeField'] : null;
+        } else {
+            var styleField = (layerSymbology['fillType'] === 'gradient') ? layerSymbology['fillField'] : null;
+        };
+        if (styleField === null) {
+            return null;
+        };
+        var fieldIndex = layerData['layerFields'].findIndex(x => x.fieldName === styleField);
+        if (layerData['layerFields'][fieldIndex]['fieldStats'] === null) {
+            layerData['layerFields'][fieldIndex]['fieldStats'] = 'loading';
+            getFieldStats(
+                layerData['layerType'],
+                layerData['layerCode'],
+                layerData['resourceId'],
+                layerData['layerFields'][fieldIndex]['fieldName'],
+                layerData['layerFields'][fieldIndex]['fieldType']
+            );
+        };
+        return layerData['layerFields'][fieldIndex]['fieldStats'];
+    };
 
-        if (layerData['layerSymbology']['labelField'] === 'none') {
-            var labelRule = '';
+    /* Gets WMS parameters for a layer style */
+    function getStyleParams(layerStyle) {
+        if (layerStyle['styleName'] !== null) {
+            return {'STYLES': layerStyle['styleName'], 'SLD_BODY': undefined};
         } else {
-            if (layerData['layerType'] === 'point' || layerData['layerType'] === 'timeseries') {
-                var displacement = '<LabelPlacement>' +
-                    '<PointPlacement>' +
-                        '<Displacement>' +
-                            '<DisplacementY>0</DisplacementY>' +
-                            '<DisplacementX>' + (parseFloat(layerData['layerSymbology']['fillSize'])/2 + parseFloat(layerData['layerSymbology']['strokeSize'])/2 + 3).toString() + '</DisplacementX>' +
-                        '</Displacement>' +
-                    '</PointPlacement>' +
-                '</LabelPlacement>';
-            } else {
-                var displacement = '';
-            };
-            var labelRule = '<FeatureTypeStyle>' +
-                '<Rule>' +
-                    '<TextSymbolizer>' +
-                        '<Label>' +
-                            '<ogc:PropertyName>' + layerData['layerSymbology']['labelField'] + '</ogc:PropertyName>' +
-                        '</Label>' +
-                        '<Font>' +
-                            '<CssParameter name="font-family">' + layerData['layerSymbology']['labelFont'] + '</CssParameter>' +
-                            '<CssParameter name="font-size">' + layerData['layerSymbology']['labelSize'] + '</CssParameter>' +
-                            '<CssParameter name="font-style">normal</CssParameter>' +
-                            '<CssParameter name="font-weight">bold</CssParameter>' +
-                        '</Font>' +
-                        '<Fill>' +
-                            '<CssParameter name="fill">' + layerData['layerSymbology']['labelColor'] + '</CssParameter>' +
-                            '<CssParameter name="fill-opacity">' + layerData['layerSymbology']['labelOpacity'] + '</CssParameter>' +
-                        '</Fill>' +
-                        displacement +
-                    '</TextSymbolizer>' +
-                '</Rule>' +
-            '</FeatureTypeStyle>';
+            return {'STYLES': undefined, 'SLD_BODY': layerStyle['sldBody']};
         };
+    };
 
-        switch (layerData['layerType']) {
-            case 'timeseries':
-            case 'point':
-                switch (layerData['layerSymbology']['fillType']) {
-                    case 'simple':
-                        var sldRules = '<Rule>' +
-                            ((filter === true) ? '<ogc:Filter><ogc:FeatureId fid="' + selectedLayer['fid'].toString() + '"/></ogc:Filter>' : '') +
-                            '<PointSymbolizer>' +
-                                '<Graphic>' +
-                                    '<Mark>' +
-                                        '<WellKnownName>' +
-                                            layerData['layerSymbology']['fillShape'] +
-                                        '</WellKnownName>' +
-                                        '<Fill>' +
-                                            '<CssParameter name="fill">' +
-                                                layerData['layerSymbology']['fillColor'] +
-                                            '</CssParameter>' +
-                                            '<CssParameter name="fill-opacity">' +
-                                                layerData['layerSymbology']['fillOpacity'] +
-                                            '</CssParameter>' +
-                                        '</Fill>' +
-                                        '<Stroke>' +
-                                            '<CssParameter name="stroke">' +
-                                                ((filter === true) ? '#42E9F5' : layerData['layerSymbology']['strokeColor']) +
-                                            '</CssParameter>' +
-                                            '<CssParameter name="stroke-opacity">' +
-                                                ((filter === true) ? '1' : layerData['layerSymbology']['strokeOpacity']) +
-                                            '</CssParameter>' + 
-                                            '<CssParameter name="stroke-width">' +
-                                                ((filter === true) ? (parseFloat(layerData['layerSymbology']['strokeSize']) + 2).toString() : layerData['layerSymbology']['strokeSize']) +
-                                            '</CssParameter>' + 
-                                        '</Stroke>' +
-                                    '</Mark>' +
-                                    '<Size>' +
-                                        layerData['layerSymbology']['fillSize'] +
-                                    '</Size>' +
-                                '</Graphic>' +
-                            '</PointSymbolizer>' +
-                        '</Rule>';
-                        break;
-                    case 'gradient':
-                        var fieldStats = layerData['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldStats'];
-                        if (fieldStats === null) {
-                            layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldStats'] = 'loading';
-                            getFieldStats(
-                                layerList[activeLayer]['layerType'], 
-                                layerList[activeLayer]['layerCode'], 
-                                layerList[activeLayer]['resourceId'],
-                                layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldName'],
-                                layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldType']
-                            );
-                            sldRules = '';
-                        } else if (fieldStats === 'loading') {
-                            sldRules = '';
-                        } else {
-                            var colormap = getColorMap(layerData['layerSymbology']['fillGradient'], fieldStats);
-                            var gradValue = '';
-                            for (var i = 0; i < colormap['positions'].length; i++) {
-                                gradValue = gradValue + 
-                                    '<ogc:Literal>' + colormap['positions'][i] + '</ogc:Literal>' +
-                                    '<ogc:Literal>' + colormap['colors'][i] + '</ogc:Literal>'
-                            };
-                            var sldRules = '<Rule>' +
-                                ((filter === true) ? '<ogc:Filter><ogc:FeatureId fid="' + selectedLayer['fid'].toString() + '"/></ogc:Filter>' : '') +
-                                '<PointSymbolizer>' +
-                                    '<Graphic>' +
-                                        '<Mark>' +
-                                            '<WellKnownName>' +
-                                                layerData['layerSymbology']['fillShape'] +
-                                            '</WellKnownName>' +
-                                            '<Fill>' +
-                                                '<CssParameter name="fill">' +
-                                                    '<ogc:Function name="Interpolate">' +
-                                                        '<ogc:PropertyName>' + layerData['layerSymbology']['fillField'] +'</ogc:PropertyName>' +
-                                                        gradValue +
-                                                        '<ogc:Literal>color</ogc:Literal>' +
-                                                    '</ogc:Function>' +
-                                                '</CssParameter>' +
-                                                '<CssParameter name="fill-opacity">' +
-                                                    layerData['layerSymbology']['fillOpacity'] +
-                                                '</CssParameter>' +
-                                            '</Fill>' +
-                                            '<Stroke>' +
-                                                '<CssParameter name="stroke">' +
-                                                    ((filter === true) ? '#42E9F5' : layerData['layerSymbology']['strokeColor']) +
-                                                '</CssParameter>' +
-                                                '<CssParameter name="stroke-opacity">' +
-                                                    ((filter === true) ? '1' : layerData['layerSymbology']['strokeOpacity']) +
-                                                '</CssParameter>' + 
-                                                '<CssParameter name="stroke-width">' +
-                                                    ((filter === true) ? (parseFloat(layerData['layerSymbology']['strokeSize']) + 2).toString() : layerData['layerSymbology']['strokeSize']) +
-                                                '</CssParameter>' + 
-                                            '</Stroke>' +
-                                        '</Mark>' +
-                                        '<Size>' +
-                                            layerData['layerSymbology']['fillSize'] +
-                                        '</Size>' +
-                                    '</Graphic>' +
-                                '</PointSymbolizer>' +
-                            '</Rule>';
-                        };
-                        break;
-                };
-                break;
-            case 'line':
-                switch (layerData['layerSymbology']['strokeType']) {
-                    case 'simple':
-                        var sldRules = '<Rule>' +
-                            ((filter === true) ? '<ogc:Filter><ogc:FeatureId fid="' + selectedLayer['fid'].toString() + '"/></ogc:Filter>' : '') +
-                            '<LineSymbolizer>' +
-                                '<Stroke>' +
-                                    '<CssParameter name="stroke">' +
-                                        ((filter === true) ? '#42E9F5' : layerData['layerSymbology']['strokeColor']) +
-                                    '</CssParameter>' +
-                                    '<CssParameter name="stroke-opacity">' +
-                                        ((filter === true) ? '1' : layerData['layerSymbology']['strokeOpacity']) +
-                                    '</CssParameter>' + 
-                                    '<CssParameter name="stroke-width">' +
-                                        ((filter === true) ? (parseFloat(layerData['layerSymbology']['strokeSize']) + 2).toString() : layerData['layerSymbology']['strokeSize']) +
-                                    '</CssParameter>' + 
-                                '</Stroke>' +
-                            '</LineSymbolizer>' +
-                        '</Rule>';
-                        break;
-                    case 'gradient':
-                        var fieldStats = layerData['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['strokeField'])]['fieldStats'];
-                        if (fieldStats === null) {
-                            layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['strokeField'])]['fieldStats'] = 'loading';
-                            getFieldStats(
-                                layerList[activeLayer]['layerType'], 
-                                layerList[activeLayer]['layerCode'], 
-                                layerList[activeLayer]['resourceId'],
-                                layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['strokeField'])]['fieldName'],
-                                layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['strokeField'])]['fieldType']
-                            );
-                            sldRules = '';
-                        } else if (fieldStats === 'loading') {
-                            sldRules = '';
-                        } else {
-                            var colormap = getColorMap(layerData['layerSymbology']['strokeGradient'], fieldStats);
-                            var gradValue = '';
-                            for (var i = 0; i < colormap['positions'].length; i++) {
-                                gradValue = gradValue + 
-                                    '<ogc:Literal>' + colormap['positions'][i] + '</ogc:Literal>' +
-                                    '<ogc:Literal>' + colormap['colors'][i] + '</ogc:Literal>'
-                            };
-                            var sldRules = '<Rule>' +
-                                ((filter === true) ? '<ogc:Filter><ogc:FeatureId fid="' + selectedLayer['fid'].toString() + '"/></ogc:Filter>' : '') +
-                                '<LineSymbolizer>' +
-                                    '<Stroke>' +
-                                        '<CssParameter name="stroke">' +
-                                            ((filter === true) ? '#42E9F5' : (
-                                            '<ogc:Function name="Interpolate">' +
-                                                '<ogc:PropertyName>' + layerData['layerSymbology']['strokeField'] +'</ogc:PropertyName>' +
-                                                    gradValue +
-                                                '<ogc:Literal>color</ogc:Literal>' +
-                                            '</ogc:Function>')) +
-                                        '</CssParameter>' +
-                                        '<CssParameter name="stroke-opacity">' +
-                                            ((filter === true) ? '1' : layerData['layerSymbology']['strokeOpacity']) +
-                                        '</CssParameter>' + 
-                                        '<CssParameter name="stroke-width">' +
-                                            ((filter === true) ? (parseFloat(layerData['layerSymbology']['strokeSize']) + 2).toString() : layerData['layerSymbology']['strokeSize']) +
-                                        '</CssParameter>' + 
-                                    '</Stroke>' +
-                                '</LineSymbolizer>' +
-                            '</Rule>';
-                        };
-                        break;
+    /* Updates the WMS style of a layer */
+    function updateLayerStyle(layerCode) {
+        var layerData = layerList[layerCode];
+        var fieldStats = getStyleFieldStats(layerData);
+        if (fieldStats === 'loading') {
+            return;
+        };
+        var styleRequest = (layerData['styleRequest'] || 0) + 1;
+        layerData['styleRequest'] = styleRequest;
+        $.ajax({
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            type: 'POST',
+            data: {
+                'layer_code': layerCode,
+                'layer_type': layerData['layerType'],
+                'layer_symbology': JSON.stringify(layerData['layerSymbology']),
+                'field_stats': JSON.stringify(fieldStats)
+            },
+            url: '/apps/hydroshare-data-viewer/ajax/update-layer-style/',
+            success: function(response) {
+                if (layerList[layerCode] !== layerData || layerData['styleRequest'] !== styleRequest) {
+                    return;
                 };
-                break;
-            case 'polygon':
-                switch (layerData['layerSymbology']['fillType']) {
-                    case 'simple':
-                        var sldRules = '<Rule>' +
-                            ((filter === true) ? '<ogc:Filter><ogc:FeatureId fid="' + selectedLayer['fid'].toString() + '"/></ogc:Filter>' : '') +
-                            '<PolygonSymbolizer>' +
-                                '<Fill>' +
-                                    '<CssParameter name="fill">' +
-                                        layerData['layerSymbology']['fillColor'] +
-                                    '</CssParameter>' +
-                                    '<CssParameter name="fill-opacity">' +
-                                        ((filter === true) ? '0' : layerData['layerSymbology']['fillOpacity']) +
-                                    '</CssParameter>' +
-                                '</Fill>' +
-                                '<Stroke>' +
-                                    '<CssParameter name="stroke">' +
-                                        ((filter === true) ? '#42E9F5' : layerData['layerSymbology']['strokeColor']) +
-                                    '</CssParameter>' +
-                                    '<CssParameter name="stroke-opacity">' +
-                                        ((filter === true) ? '1' : layerData['layerSymbology']['strokeOpacity']) +
-                                    '</CssParameter>' + 
-                                    '<CssParameter name="stroke-width">' +
-                                        ((filter === true) ? (parseFloat(layerData['layerSymbology']['strokeSize']) + 2).toString() : layerData['layerSymbology']['strokeSize']) +
-                                    '</CssParameter>' + 
-                                '</Stroke>' +
-                            '</PolygonSymbolizer>' +
-                        '</Rule>';
-                        break;
-                    case 'gradient':
-                        var fieldStats = layerData['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldStats'];
-                        if (fieldStats === null) {
-                            layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldStats'] = 'loading';
-                            getFieldStats(
-                                layerList[activeLayer]['layerType'], 
-                                layerList[activeLayer]['layerCode'], 
-                                layerList[activeLayer]['resourceId'],
-                                layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldName'],
-                                layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldType']
-                            );
-                            sldRules = '';
-                        } else if (fieldStats === 'loading') {
-                            sldRules = '';
-                        } else {
-                            var colormap = getColorMap(layerData['layerSymbology']['fillGradient'], fieldStats);
-                            var gradValue = '';
-                            for (var i = 0; i < colormap['positions'].length; i++) {
-                                gradValue = gradValue + 
-                                    '<ogc:Literal>' + colormap['positions'][i] + '</ogc:Literal>' +
-                                    '<ogc:Literal>' + colormap['colors'][i] + '</ogc:Literal>'
-                            };
-                            var sldRules = '<Rule>' +
-                                ((filter === true) ? '<ogc:Filter><ogc:FeatureId fid="' + selectedLayer['fid'].toString() + '"/></ogc:Filter>' : '') +
-                                '<PolygonSymbolizer>' +
-                                    '<Fill>' +
-                                        '<CssParameter name="fill">' +
-                                            '<ogc:Function name="Interpolate">' +
-                                                '<ogc:PropertyName>' + layerData['layerSymbology']['fillField'] +'</ogc:PropertyName>' +
-                                                gradValue +
-                                                '<ogc:Literal>color</ogc:Literal>' +
-                                            '</ogc:Function>' +
-                                        '</CssParameter>' +
-                                        '<CssParameter name="fill-opacity">' +
-                                            ((filter === true) ? '0' : layerData['layerSymbology']['fillOpacity']) +
-                                        '</CssParameter>' +
-                                    '</Fill>' +
-                                    '<Stroke>' +
-                                        '<CssParameter name="stroke">' +
-                                            ((filter === true) ? '#42E9F5' : layerData['layerSymbology']['strokeColor']) +
-                                        '</CssParameter>' +
-                                        '<CssParameter name="stroke-opacity">' +
-                                            ((filter === true) ? '1' : layerData['layerSymbology']['strokeOpacity']) +
-                                        '</CssParameter>' + 
-                                        '<CssParameter name="stroke-width">' +
-                                            ((filter === true) ? (parseFloat(layerData['layerSymbology']['strokeSize']) + 2).toString() : layerData['layerSymbology']['strokeSize']) +
-                                        '</CssParameter>' + 
-                                    '</Stroke>' +
-                                '</PolygonSymbolizer>' +
-                            '</Rule>';
-                        };
-                        break;
+                layerData['layerStyle'] = response['layer_style'];
+                layerData['highlightStyle'] = response['highlight_style'];
+                layerData['layerWMS'].updateParams(getStyleParams(layerData['layerStyle']));
+                if ('layerTiles' in layerData) {
+                    layerData['layerTiles'].setUrl(
+                        '/apps/hydroshare-data-viewer/tiles/{z}/{x}/{y}/?layer_code=' + encodeURIComponent(layerCode) +
+                        '&style_name=' + layerData['layerStyle']['styleName']
+                    );
                 };
-                break;
-            case 'raster':
-                var filterRule = ''
-                switch (layerData['layerSymbology']['fillType']) {
-                    case 'gradient':
-                        var fieldStats = layerData['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldStats'];
-                        if (fieldStats === null) {
-                            layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldStats'] = 'loading';
-                            getFieldStats(
-                                layerList[activeLayer]['layerType'], 
-                                layerList[activeLayer]['layerCode'], 
-                                layerList[activeLayer]['resourceId'],
-                                layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldName'],
-                                layerList[activeLayer]['layerFields'][layerData['layerFields'].findIndex(x => x.fieldName === layerData['layerSymbology']['fillField'])]['fieldType']
-                            );
-                            sldRules = '';
-                        } else if (fieldStats === 'loading') {
-                            sldRules = '';
-                        } else {
-                            var colormap = getColorMap(layerData['layerSymbology']['fillGradient'], fieldStats);
-                            var gradValue = '';
-                            for (var i = 0; i < colormap['positions'].length; i++) {
-                                gradValue = gradValue + '<ColorMapEntry color="' + colormap['colors'][i] + '" quantity="' + colormap['positions'][i] + '" />';
-                            };
-                            var sldRules = '<Rule>' +
-                                '<RasterSymbolizer>' +
-                                    '<Opacity>' + layerData['layerSymbology']['fillOpacity'] + '</Opacity>' +
-                                    '<ColorMap>' +
-                                        gradValue +
-                                    '</ColorMap>' +
-                                '</RasterSymbolizer>' +
-                            '</Rule>';
-                        };
-                        break;
+                layerData['layerSource'].setVisible(layerData['layerVisible'] && compositeWMS === undefined);
+                updateCompositeMap();
+                if (layerCode === activeLayer) {
+                    updateMapFeature();
                 };
-                break;
-        };
-
-        var sldString = '<?xml version="1.0" encoding="ISO-8859-1"?>' +
-            '<StyledLayerDescriptor version="1.0.0" ' +
-            'xsi:schemaLocation="http://www.opengis.net/sld http://schemas.opengis.net/sld/1.0.0/StyledLayerDescriptor.xsd" ' +
-            'xmlns="http://www.opengis.net/sld" ' +
-            'xmlns:ogc="http://www.opengis.net/ogc" ' +
-            'xmlns:xlink="http://www.w3.org/1999/xlink" ' +
-            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">' +
-                '<NamedLayer>' +
-                    '<Name>' + layerData['layerCode'] + '</Name>' +
-                    '<UserStyle>' +
-                        '<FeatureTypeStyle>' +
-                        sldRules +
-                        '</FeatureTypeStyle>' +
-                        labelRule +
-                    '</UserStyle>' +
-                '</NamedLayer>' +
-            '</StyledLayerDescriptor>';
-        return sldString;
+            },
+            error: function(response) {
+                console.log('Layer Style Failed');
+            }
+        });
     };
 
     /* Updates symbology fields */
@@ -1753,13 +1700,28 @@
                 'positions': [0, .376, .753, 1]
             }
         };
+        var rangeMin = (fieldStats['p2'] != null) ? fieldStats['p2'] : fieldStats['min'];
+        var rangeMax = (fieldStats['p98'] != null) ? fieldStats['p98'] : fieldStats['max'];
+
+        // Fields without values are drawn in the first color of the gradient
+        if (rangeMin == null || rangeMax == null) {
+            return {
+                'colors': colorMaps[colorMap]['colors'].slice(0, 1),
+                'positions': [0],
+                'min': 0,
+                'max': 1,
+                'empty': true
+            };
+        };
         var positions = [];
         for (var i = 0; i < colorMaps[colorMap]['positions'].length; i++) {
-            positions.push(fieldStats['min'] + colorMaps[colorMap]['positions'][i] * (fieldStats['max'] - fieldStats['min']))
+            positions.push(rangeMin + colorMaps[colorMap]['positions'][i] * (rangeMax - rangeMin))
         };
         return {
             'colors': colorMaps[colorMap]['colors'],
-            'positions': positions
+            'positions': positions,
+            'min': rangeMin,
+            'max': rangeMax
         };
     };
 
@@ -1796,7 +1758,7 @@
                         var colorMap = getColorMap(fillGradient, fieldStats);
                         var svgGradient = ``;
                         for (var i = 0; i < colorMap['colors'].length; i++) { 
-                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - fieldStats['min']) / (fieldStats['max'] - fieldStats['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
+                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - colorMap['min']) / (colorMap['max'] - colorMap['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
                         };
                         var def = `<defs>
                                 <linearGradient id="${'grad-' + gradientCode}" x1="0%" y1="0%" x2="100%" y2="0%">
@@ -1848,7 +1810,7 @@
                         var colorMap = getColorMap(strokeGradient, fieldStats);
                         var svgGradient = ``;
                         for (var i = 0; i < colorMap['colors'].length; i++) { 
-                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - fieldStats['min']) / (fieldStats['max'] - fieldStats['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
+                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - colorMap['min']) / (colorMap['max'] - colorMap['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
                         };
                         var def = `<defs>
                                 <linearGradient id="${'grad-' + gradientCode}" x1="0%" y1="0%" x2="100%" y2="0%">
@@ -1880,7 +1842,7 @@
                         var colorMap = getColorMap(fillGradient, fieldStats);
                         var svgGradient = ``;
                         for (var i = 0; i < colorMap['colors'].length; i++) { 
-                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - fieldStats['min']) / (fieldStats['max'] - fieldStats['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
+                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - colorMap['min']) / (colorMap['max'] - colorMap['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
                         };
                         var def = `<defs>
                                 <linearGradient id="${'grad-' + gradientCode}" x1="0%" y1="0%" x2="100%" y2="0%">
@@ -1912,7 +1874,7 @@
                         var colorMap = getColorMap(fillGradient, fieldStats);
                         var svgGradient = ``;
                         for (var i = 0; i < colorMap['colors'].length; i++) { 
-                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - fieldStats['min']) / (fieldStats['max'] - fieldStats['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
+                            svgGradient = svgGradient + `<stop offset="${(((colorMap['positions'][i] - colorMap['min']) / (colorMap['max'] - colorMap['min'])) * 100).toString()}%" style="stop-color:${colorMap['colors'][i]};stop-opacity:1" />`
                         };
                         var def = `<defs>
                                 <linearGradient id="${'grad-' + gradientCode}" x1="0%" y1="0%" x2="100%" y2="0%">
@@ -1972,7 +1934,7 @@
 
     /* Changes Layer Symbology */
     function updateLayerSymbology(force) {
-        var sldBodyOld = buildLayerStyle(layerList[activeLayer], false);
+        var layerSymbologyOld = JSON.stringify(layerList[activeLayer]['layerSymbology']);
         switch (layerList[activeLayer]['layerType']) {
             case 'timeseries':
             case 'point':
@@ -2026,11 +1988,10 @@
                 layerList[activeLayer]['layerSymbology']['fillOpacity'] = $('#fill-opacity-input').val();
                 break;
         };
-        var sldBody = buildLayerStyle(layerList[activeLayer], false);
-        if (sldBodyOld !== sldBody || force === true) {
-            layerList[activeLayer]['layerWMS'].updateParams({'SLD_BODY': sldBody});
+        if (layerSymbologyOld !== JSON.stringify(layerList[activeLayer]['layerSymbology']) || force === true) {
+            updateLayerStyle(activeLayer);
             updateLegend();
-            updateMapFeature();
+            saveWorkspace();
         };
         updateSymbologyFields();
     };
@@ -2065,12 +2026,17 @@
         // Setup table columns
         $('#attr-table-container').append('<table id="attribute-table" class="display"></table>');
         $('#attribute-table').append("<thead><tr></tr></thead>");
+        $('#attribute-table').append("<tfoot><tr></tr></tfoot>");
         $('#attribute-table>thead>tr').append('<th>GS_FID</th>');
         $('#attribute-table>thead>tr').append('<th>Feature</th>');
+        $('#attribute-table>tfoot>tr').append('<th></th><th></th>');
         var layerFields = [];
+        var layerFieldTypes = [];
         for (var i = 0; i < layerList[activeLayer]['layerFields'].length; i++) {
             layerFields.push(layerList[activeLayer]['layerFields'][i]['fieldName']);
+            layerFieldTypes.push(layerList[activeLayer]['layerFields'][i]['fieldType']);
             $('#attribute-table>thead>tr').append(`<th>${layerList[activeLayer]['layerFields'][i]['fieldName']}</th>`);
+            $('#attribute-table>tfoot>tr').append(`<th><input type="text" class="attribute-search-input" column-index="${i + 2}" placeholder="${layerFieldTypes[i] === 'numerical' ? 'e.g. >= 10' : 'Search'}"></th>`);
         };
 
         // Initializes Discover Table
@@ -2080,12 +2046,15 @@
             },
             'serverSide': true,
             'lengthChange': false,
-            'sort': false,
+            'ordering': true,
+            'order': [],
+            'searchDelay': 500,
             'ajax': {
                 'url': '/apps/hydroshare-data-viewer/ajax/update-attribute-table/',
                 'type': 'POST',
                 'data': {
                     'layer_fields': layerFields,
+                    'layer_field_types': layerFieldTypes,
                     'layer_code': activeLayer
                 },
                 'headers': {
@@ -2106,6 +2075,7 @@
             },
             'columnDefs': [
                 {'visible': false, 'targets': [0]},
+                {'orderable': false, 'targets': [0, 1]},
             ],
             'drawCallback': function() {
                 $('.dataTables_scrollHeadInner').css({'width':'100%'});
@@ -2123,6 +2093,19 @@
         // Adds event listeners to Discover Table
         attributeTable.on('select', selectFeature);
         attributeTable.on('deselect', selectFeature);
+
+        // Adds column search listeners to Attribute Table
+        var columnSearchTimeout;
+        $(attributeTable.table().container()).on('keyup change', '.attribute-search-input', function() {
+            var columnIndex = parseInt($(this).attr('column-index'));
+            var searchValue = this.value;
+            clearTimeout(columnSearchTimeout);
+            columnSearchTimeout = setTimeout(function() {
+                if (attributeTable.column(columnIndex).search() !== searchValue) {
+                    attributeTable.column(columnIndex).search(searchValue).draw();
+                };
+            }, 500);
+        });
     };
 
     /* Sets up plot viewer */
@@ -2143,23 +2126,19 @@
                 'site_code': selectedLayer['row'][1],
                 'var_code': selectedLayer['row'][3],
                 'site_name': selectedLayer['row'][0],
-                'var_name': selectedLayer['row'][2]
+                'var_name': selectedLayer['row'][2],
+                'max_points': timeseriesMaxPoints
             },
             url: '/apps/hydroshare-data-viewer/ajax/get-timeseries-data/',
             success: function(response) {
                 if (response['layer_code'] === activeLayer && response['variable_code'] === selectedLayer['row'][3] && response['site_code'] === selectedLayer['row'][1]) {
-                    var timeseriesData = [];
-                    for (var i = 0; i < response['timeseries_data'].length; i++) {
-                        timeseriesData.push({
-                            'x': Date.parse(response['timeseries_data'][i][0]),
-                            'y': parseFloat(response['timeseries_data'][i][1])
-                        })
-                    };
+                    timeseriesOverview = getPlotData(response);
                     timeseriesPlot = new CanvasJS.Chart('plot', {
                         height: 250,
                         responsive: true,
                         animationEnabled: true,
                         zoomEnabled: true,
+                        rangeChanged: updatePlotRange,
                         title: {
                             text: response['variable_name'] + ' at ' + response['site_name']
                         },
@@ -2172,7 +2151,7 @@
                             name: response['variable_name'],
                             xValueType: 'dateTime',
                             xValueFormatString: 'DD MMM hh:mm TT',
-                            dataPoints: timeseriesData
+                            dataPoints: timeseriesOverview
                         }]
                     });
                     $('#plot-loading').hide();
@@ -2186,6 +2165,76 @@
         });
     };
 
+    /* Converts time series response to plot data points */
+    function getPlotData(response) {
+        var timeseriesData = [];
+        var times = response['timeseries_data']['times'];
+        var values = response['timeseries_data']['values'];
+        for (var i = 0; i < times.length; i++) {
+            timeseriesData.push({
+                'x': times[i] + new Date(times[i]).getTimezoneOffset() * 60000,
+                'y': values[i]
+            })
+        };
+        return timeseriesData;
+    };
+
+    /* Loads a finer downsample of the zoomed plot range */
+    function updatePlotRange(evt) {
+        var viewportMinimum = evt.axisX[0].viewportMinimum;
+        var viewportMaximum = evt.axisX[0].viewportMaximum;
+        if (evt.trigger === 'reset' || viewportMinimum == null || viewportMaximum == null) {
+            timeseriesPlot.options.data[0].dataPoints = timeseriesOverview;
+            timeseriesPlot.options.axisX.viewportMinimum = null;
+            timeseriesPlot.options.axisX.viewportMaximum = null;
+            timeseriesPlot.render();
+            return;
+        };
+        var startTime = Math.floor(viewportMinimum - new Date(viewportMinimum).getTimezoneOffset() * 60000);
+        var endTime = Math.ceil(viewportMaximum - new Date(viewportMaximum).getTimezoneOffset() * 60000);
+        var layerCode = activeLayer;
+        var siteCode = selectedLayer['row'][1];
+        var variableCode = selectedLayer['row'][3];
+        $.ajax({
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            type: 'POST',
+            data: {
+                'layer_code': layerCode,
+                'site_code': siteCode,
+                'var_code': variableCode,
+                'site_name': selectedLayer['row'][0],
+                'var_name': selectedLayer['row'][2],
+                'max_points': timeseriesMaxPoints,
+                'start_time': startTime,
+                'end_time': endTime
+            },
+            url: '/apps/hydroshare-data-viewer/ajax/get-timeseries-data/',
+            success: function(response) {
+                if (response['layer_code'] === activeLayer && response['variable_code'] === selectedLayer['row'][3] && response['site_code'] === selectedLayer['row'][1]) {
+                    var windowData = getPlotData(response);
+                    timeseriesPlot.options.data[0].dataPoints = timeseriesOverview.filter(x => x.x < viewportMinimum).concat(
+                        windowData,
+                        timeseriesOverview.filter(x => x.x > viewportMaximum)
+                    );
+                    timeseriesPlot.options.axisX.viewportMinimum = viewportMinimum;
+                    timeseriesPlot.options.axisX.viewportMaximum = viewportMaximum;
+                    timeseriesPlot.render();
+                };
+            },
+            error: function(response) {
+                console.log('Layer Load Failed');
+            }
+        });
+    };
+
+    /* Downloads all features of the active layer */
+    function downloadLayerData(evt) {
+        $('#download-data-btn').dropdown('toggle');
+        window.location.href = '/apps/hydroshare-data-viewer/export-layer/?layer_code=' + encodeURIComponent(activeLayer) + '&format=' + $(this).attr('data-format');
+    };
+
     /* Gets CSRF Token for AJAX Requests */
     function getCookie(name) {
         var cookieValue = null;
@@ -2251,6 +2300,9 @@
     /* Listener for showing layer */
     $(document).on('click', '#show-layer-btn', toggleLayer);
 
+    /* Listener for downloading layer data */
+    $(document).on('click', '.download-data-option', downloadLayerData);
+
     /* Listener for removing layer */
     $(document).on('click', '#remove-layer-confirm-btn', removeLayer);
 
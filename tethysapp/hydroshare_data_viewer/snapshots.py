@@ -0,0 +1,89 @@
+import gzip
+import json
+import os
+import tempfile
+
+snapshot_version = 1
+snapshot_metadata_keys = ("layerCode", "layerName", "resourceId", "layerCoverage", "layerType", "layerFields")
+snapshot_state_keys = ("layerName", "layerVisible", "layerSymbology")
+symbology_field_keys = ("fillField", "strokeField", "labelField")
+
+
+def build_workspace_snapshot(layers, resource_versions):
+    """
+    Builds a workspace snapshot.
+
+    layers are the workspace layers in display order, top layer first, and
+    resource_versions maps each layer's resource ID to its last updated
+    date. Only layer metadata and the user's layer settings are kept.
+    """
+
+    return {
+        "version": snapshot_version,
+        "resources": resource_versions,
+        "layers": [
+            {key: layer[key] for key in snapshot_metadata_keys + snapshot_state_keys if key in layer}
+            for layer in layers
+        ]
+    }
+
+
+def merge_snapshot_layer(saved_layer, layer):
+    """
+    Applies a saved layer's settings to newly discovered layer metadata.
+
+    The saved name and visibility are kept. The saved symbology is kept
+    unless it uses a field the layer no longer has, in which case the new
+    layer's default symbology is used.
+    """
+
+    merged_layer = dict(layer)
+    merged_layer["layerName"] = saved_layer.get("layerName", layer["layerName"])
+    merged_layer["layerVisible"] = saved_layer.get("layerVisible", True)
+    symbology = saved_layer.get("layerSymbology") or {}
+    field_names = {i["fieldName"] for i in layer["layerFields"]}
+    if symbology and all(
+        symbology.get(key) in (None, "none") or symbology.get(key) in field_names
+        for key in symbology_field_keys
+    ):
+        merged_layer["layerSymbology"] = symbology
+    return merged_layer
+
+
+def write_workspace_snapshot(snapshot_path, snapshot):
+    """
+    Writes a workspace snapshot as gzipped JSON.
+
+    The snapshot is written to a temporary file and moved into place, so a
+    concurrent restore never reads a partly written snapshot.
+    """
+
+    snapshot_dir = os.path.dirname(snapshot_path)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=snapshot_dir, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            with gzip.open(temp_file, "wt", encoding="utf-8") as snapshot_file:
+                json.dump(snapshot, snapshot_file, separators=(",", ":"))
+        os.replace(temp_path, snapshot_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_workspace_snapshot(snapshot_path):
+    """
+    Reads a workspace snapshot.
+
+    Returns None if there is no snapshot or it was written by an
+    incompatible version of the app.
+    """
+
+    try:
+        with gzip.open(snapshot_path, "rt", encoding="utf-8") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    if snapshot.get("version") != snapshot_version:
+        return None
+    return snapshot
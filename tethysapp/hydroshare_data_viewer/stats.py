@@ -0,0 +1,315 @@
+import numpy as np
+
+jenks_sample_size = 1000
+
+
+class FieldStatistics:
+    """
+    Single-pass statistics for numeric layer fields.
+
+    Feature pages are added one at a time with update, so a layer's fields
+    can be summarized without holding every feature in memory.
+    """
+
+    def __init__(self, field_names):
+        self.field_names = list(field_names)
+        self.count = {field_name: 0 for field_name in self.field_names}
+        self.null_count = {field_name: 0 for field_name in self.field_names}
+        self.total = {field_name: 0.0 for field_name in self.field_names}
+        self.min = {field_name: None for field_name in self.field_names}
+        self.max = {field_name: None for field_name in self.field_names}
+
+    def update(self, features):
+        """
+        Adds a page of GeoJSON features to the statistics.
+        """
+
+        for field_name in self.field_names:
+            values = np.array(
+                [feature["properties"].get(field_name) for feature in features],
+                dtype=np.float64
+            )
+            null_mask = np.isnan(values)
+            values = values[~null_mask]
+            self.null_count[field_name] += int(null_mask.sum())
+            if values.size == 0:
+                continue
+            self.count[field_name] += int(values.size)
+            self.total[field_name] += float(values.sum())
+            page_min = float(values.min())
+            page_max = float(values.max())
+            if self.min[field_name] is None or page_min < self.min[field_name]:
+                self.min[field_name] = page_min
+            if self.max[field_name] is None or page_max > self.max[field_name]:
+                self.max[field_name] = page_max
+
+    def result(self):
+        """
+        Gets min, max, count, null count, and mean for each field.
+        """
+
+        return {
+            field_name: {
+                "min": self.min[field_name],
+                "max": self.max[field_name],
+                "count": self.count[field_name],
+                "nullCount": self.null_count[field_name],
+                "mean": self.total[field_name] / self.count[field_name] if self.count[field_name] else None
+            } for field_name in self.field_names
+        }
+
+
+def parse_ascii_grid(lines):
+    """
+    Parses an ESRI ASCII grid.
+
+    Takes the lines of the grid, e.g. as they are streamed from a WCS
+    GetCoverage response, and converts each row of values as it is read.
+    Returns the grid's values as a flat float64 array and its no data
+    value, or None if the grid has none.
+    """
+
+    header = {}
+    rows = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("ascii")
+        parts = line.split()
+        if not parts:
+            continue
+        if not rows and parts[0][0].isalpha():
+            header[parts[0].lower()] = parts[1]
+            continue
+        rows.append(np.array(parts, dtype=np.float64))
+    values = np.concatenate(rows) if rows else np.empty(0, dtype=np.float64)
+    no_data_value = float(header["nodata_value"]) if "nodata_value" in header else None
+    return values, no_data_value
+
+
+def get_raster_statistics(values, no_data_value=None, bin_count=64):
+    """
+    Gets statistics for raster cell values.
+
+    Cells equal to the no data value and non-finite cells are masked.
+    Returns min, max, mean, standard deviation, 2nd and 98th percentiles,
+    valid and masked cell counts, and a histogram of the valid values.
+    """
+
+    valid = np.isfinite(values)
+    if no_data_value is not None:
+        valid &= values != no_data_value
+    values = values[valid]
+    if values.size == 0:
+        return {
+            "min": None, "max": None, "mean": None, "std": None, "p2": None, "p98": None,
+            "count": 0, "nullCount": int(valid.size), "ndv": no_data_value,
+            "histogram": {"counts": [], "edges": []}
+        }
+    p2, p98 = np.percentile(values, [2, 98])
+    counts, edges = np.histogram(values, bins=bin_count)
+    return {
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "p2": float(p2),
+        "p98": float(p98),
+        "count": int(values.size),
+        "nullCount": int(valid.size - values.size),
+        "ndv": no_data_value,
+        "histogram": {"counts": counts.tolist(), "edges": edges.tolist()}
+    }
+
+
+def get_equal_interval_breaks(min_value, max_value, class_count):
+    """
+    Gets class breaks that split a value range into equal intervals.
+    """
+
+    return np.linspace(min_value, max_value, class_count + 1).tolist()
+
+
+def get_quantile_breaks(values, class_count):
+    """
+    Gets class breaks with an equal number of values in each class.
+    """
+
+    return np.quantile(values, np.linspace(0, 1, class_count + 1)).tolist()
+
+
+def get_jenks_breaks(values, class_count):
+    """
+    Gets natural breaks (Jenks) class breaks.
+
+    Finds the classes that minimize the total squared deviation from the
+    class means with dynamic programming. The cost of every candidate class
+    is computed at once from cumulative sums, so each additional class is a
+    single vectorized step over an n by n matrix. values should be a sample
+    of at most a few thousand values.
+    """
+
+    x = np.sort(values)
+    n = x.size
+    if n <= class_count:
+        return np.unique(x).tolist()
+
+    sums = np.r_[0, np.cumsum(x)]
+    square_sums = np.r_[0, np.cumsum(x * x)]
+    starts = np.arange(n)[:, None]
+    ends = np.arange(n)[None, :]
+    counts = ends - starts + 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        costs = square_sums[ends + 1] - square_sums[starts] - (sums[ends + 1] - sums[starts]) ** 2 / counts
+    costs[counts < 1] = np.inf
+
+    total_costs = costs[0]
+    class_starts = []
+    for _ in range(1, class_count):
+        candidate_costs = total_costs[:-1, None] + costs[1:, :]
+        best_starts = np.argmin(candidate_costs, axis=0)
+        total_costs = candidate_costs[best_starts, np.arange(n)]
+        class_starts.append(best_starts + 1)
+
+    breaks = [x[-1]]
+    end = n - 1
+    for best_starts in reversed(class_starts):
+        start = best_starts[end]
+        breaks.append(x[start - 1])
+        end = start - 1
+    breaks.append(x[0])
+
+    return [float(i) for i in reversed(breaks)]
+
+
+class FieldClassifier:
+    """
+    Single-pass summary of a layer field for classification.
+
+    Numeric fields keep their exact range and a fixed-size uniform sample
+    of their values. Categorical fields keep counts of their distinct
+    values; once there are more than max_categories values, the least
+    common are dropped (Misra-Gries), so memory stays bounded and the
+    remaining counts are lower bounds. The remaining values are then
+    counted exactly with recount.
+    """
+
+    def __init__(self, field_name, field_type, sample_size=10000, max_categories=1000, seed=0):
+        self.field_name = field_name
+        self.field_type = field_type
+        self.sample_size = sample_size
+        self.max_categories = max_categories
+        self.random = np.random.default_rng(seed)
+        self.count = 0
+        self.null_count = 0
+        self.min = None
+        self.max = None
+        self.sample = np.empty(0, dtype=np.float64)
+        self.categories = {}
+        self.truncated = False
+
+    def update(self, features):
+        """
+        Adds a page of GeoJSON features to the summary.
+        """
+
+        values = [feature["properties"].get(self.field_name) for feature in features]
+        if self.field_type == "numerical":
+            self.update_numerical(np.array(values, dtype=np.float64))
+        else:
+            self.update_categorical(values)
+
+    def update_numerical(self, values):
+        null_mask = np.isnan(values)
+        values = values[~null_mask]
+        self.null_count += int(null_mask.sum())
+        if values.size == 0:
+            return
+        page_min = float(values.min())
+        page_max = float(values.max())
+        self.min = page_min if self.min is None else min(self.min, page_min)
+        self.max = page_max if self.max is None else max(self.max, page_max)
+
+        free = max(0, self.sample_size - self.sample.size)
+        self.sample = np.concatenate((self.sample, values[:free]))
+        positions = self.count + np.arange(free, values.size)
+        replacements = self.random.integers(0, positions + 1)
+        replaced = replacements < self.sample_size
+        self.sample[replacements[replaced]] = values[free:][replaced]
+        self.count += int(values.size)
+
+    def update_categorical(self, values):
+        page_size = len(values)
+        values = np.array([str(i) for i in values if i is not None], dtype=str)
+        self.null_count += page_size - int(values.size)
+        if values.size == 0:
+            return
+        self.count += int(values.size)
+        page_values, page_counts = np.unique(values, return_counts=True)
+        for value, count in zip(page_values.tolist(), page_counts.tolist()):
+            self.categories[value] = self.categories.get(value, 0) + count
+        if len(self.categories) > self.max_categories:
+            self.truncated = True
+            threshold = sorted(self.categories.values(), reverse=True)[self.max_categories]
+            self.categories = {
+                value: count - threshold
+                for value, count in self.categories.items()
+                if count > threshold
+            }
+
+    def recount(self, pages):
+        """
+        Counts the remaining categories exactly.
+
+        Takes the feature pages of a second pass over the field. Only needed
+        if the categories were truncated, as their counts are otherwise
+        exact already.
+        """
+
+        categories = dict.fromkeys(self.categories, 0)
+        for features in pages:
+            for feature in features:
+                value = feature["properties"].get(self.field_name)
+                if value is not None and str(value) in categories:
+                    categories[str(value)] += 1
+        self.categories = categories
+
+    def result(self, method, class_count):
+        """
+        Gets class breaks or category counts for the field.
+
+        method is "equal_interval", "quantile", or "jenks" for numeric
+        fields. Categorical fields always return their most common values.
+        """
+
+        if self.field_type != "numerical":
+            categories = sorted(self.categories.items(), key=lambda i: (-i[1], i[0]))
+            return {
+                "method": "categories",
+                "categories": [{"value": value, "count": count} for value, count in categories],
+                "otherCount": self.count - sum(self.categories.values()),
+                "truncated": self.truncated,
+                "count": self.count,
+                "nullCount": self.null_count
+            }
+        if self.count == 0:
+            breaks = []
+        elif method == "quantile":
+            breaks = get_quantile_breaks(self.sample, class_count)
+        elif method == "jenks":
+            if self.sample.size > jenks_sample_size:
+                jenks_sample = self.random.choice(self.sample, jenks_sample_size, replace=False)
+            else:
+                jenks_sample = self.sample
+            breaks = get_jenks_breaks(jenks_sample, class_count)
+        else:
+            breaks = get_equal_interval_breaks(self.min, self.max, class_count)
+        if breaks:
+            breaks[0], breaks[-1] = self.min, self.max
+        return {
+            "method": method,
+            "breaks": breaks,
+            "min": self.min,
+            "max": self.max,
+            "count": self.count,
+            "nullCount": self.null_count
+        }
@@ -0,0 +1,272 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
+
+highlight_color = "#42E9F5"
+style_name_prefix = "hdv_"
+
+color_maps = {
+    "gray": (["#000000", "#FFFFFF"], [0, 1]),
+    "rainbow": (
+        ["#96005A", "#0000C8", "#0019FF", "#0098FF", "#2CFF96", "#97FF00", "#FFEA00", "#FF6F00", "#FF0000"],
+        [0, .125, .25, .375, .5, .625, .75, .875, 1]
+    ),
+    "viridis": (
+        ["#4401FF", "#472C7A", "#3B518B", "#2C718E", "#21908D", "#27AD81", "#5CC863", "#AADC32", "#FDE725"],
+        [0, 0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1]
+    ),
+    "jet": (["#000083", "#003CAA", "#05FFFF", "#FFFF00", "#FF0000", "#800000"], [0, 0.125, 0.375, 0.625, 0.875, 1]),
+    "hot": (["#000000", "#E60000", "#FFD200", "#FFFFFF"], [0, 0.333, 0.666, 1]),
+    "cool": (["#00FFFF", "#FF00FF"], [0, 1]),
+    "magma": (
+        ["#000004", "#1C1044", "#4F127B", "#812581", "#B5367A", "#E55064", "#FB8761", "#FEC287", "#FCFDBF"],
+        [0, 0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1]
+    ),
+    "plasma": (
+        ["#0D0887", "#4B03A1", "#7D03A8", "#A82296", "#CB4679", "#E56B5D", "#F89441", "#FDC328", "#F0F921"],
+        [0, 0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1]
+    ),
+    "spring": (["#FF00FF", "#FFFF00"], [0, 1]),
+    "electric": (["#000000", "#1E0064", "#780064", "#A05A00", "#E6C800", "#FFFADC"], [0, .15, .4, .6, .8, 1]),
+    "blackbody": (["#000000", "#E60000", "#E6D200", "#FFFFFF", "#A0C8FF"], [0, .2, .4, .7, 1]),
+    "summer": (["#008066", "#FFFF66"], [0, 1]),
+    "autumn": (["#FF0000", "#FFFF00"], [0, 1]),
+    "winter": (["#0000FF", "#00FF80"], [0, 1]),
+    "bone": (["#000000", "#545474", "#A9C8C8", "#FFFFFF"], [0, .376, .753, 1])
+}
+
+
+def format_number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def get_color_map(color_map, field_stats):
+    """
+    Gets colors and field values for a named color gradient.
+
+    Gradient positions are scaled from 0 to 1 onto the field's min and max,
+    or onto its 2nd and 98th percentiles where those are known (rasters).
+    Fields without values, e.g. all null fields or all no data rasters, get
+    a single class in the first color of the gradient.
+    """
+
+    colors, positions = color_maps[color_map]
+    field_stats = field_stats or {}
+    range_min = field_stats.get("min") if field_stats.get("p2") is None else field_stats["p2"]
+    range_max = field_stats.get("max") if field_stats.get("p98") is None else field_stats["p98"]
+    if range_min is None or range_max is None:
+        return colors[:1], [0]
+    return colors, [range_min + i * (range_max - range_min) for i in positions]
+
+
+def css_parameter(name, value):
+    return f'<CssParameter name="{name}">{value}</CssParameter>'
+
+
+def build_stroke(symbology, highlight, stroke_color=None):
+    if highlight:
+        return (
+            "<Stroke>" +
+            css_parameter("stroke", highlight_color) +
+            css_parameter("stroke-opacity", "1") +
+            css_parameter("stroke-width", format_number(float(symbology["strokeSize"]) + 2)) +
+            "</Stroke>"
+        )
+    return (
+        "<Stroke>" +
+        css_parameter("stroke", stroke_color or escape(str(symbology["strokeColor"]))) +
+        css_parameter("stroke-opacity", escape(str(symbology["strokeOpacity"]))) +
+        css_parameter("stroke-width", escape(str(symbology["strokeSize"]))) +
+        "</Stroke>"
+    )
+
+
+def build_interpolate(field_name, color_map, field_stats):
+    colors, positions = get_color_map(color_map, field_stats)
+    return (
+        '<ogc:Function name="Interpolate">' +
+        f"<ogc:PropertyName>{escape(field_name)}</ogc:PropertyName>" +
+        "".join(
+            f"<ogc:Literal>{format_number(position)}</ogc:Literal><ogc:Literal>{color}</ogc:Literal>"
+            for color, position in zip(colors, positions)
+        ) +
+        "<ogc:Literal>color</ogc:Literal>" +
+        "</ogc:Function>"
+    )
+
+
+def build_label_rule(layer_type, symbology):
+    if symbology.get("labelField", "none") == "none":
+        return ""
+    if layer_type in ("point", "timeseries"):
+        displacement = format_number(float(symbology["fillSize"]) / 2 + float(symbology["strokeSize"]) / 2 + 3)
+        placement = (
+            "<LabelPlacement><PointPlacement><Displacement>" +
+            "<DisplacementY>0</DisplacementY>" +
+            f"<DisplacementX>{displacement}</DisplacementX>" +
+            "</Displacement></PointPlacement></LabelPlacement>"
+        )
+    else:
+        placement = ""
+    return (
+        "<FeatureTypeStyle><Rule><TextSymbolizer>" +
+        f"<Label><ogc:PropertyName>{escape(symbology['labelField'])}</ogc:PropertyName></Label>" +
+        "<Font>" +
+        css_parameter("font-family", escape(str(symbology["labelFont"]))) +
+        css_parameter("font-size", escape(str(symbology["labelSize"]))) +
+        css_parameter("font-style", "normal") +
+        css_parameter("font-weight", "bold") +
+        "</Font>" +
+        "<Fill>" +
+        css_parameter("fill", escape(str(symbology["labelColor"]))) +
+        css_parameter("fill-opacity", escape(str(symbology["labelOpacity"]))) +
+        "</Fill>" +
+        placement +
+        "</TextSymbolizer></Rule></FeatureTypeStyle>"
+    )
+
+
+def build_layer_style(layer_code, layer_type, symbology, field_stats=None, highlight=False):
+    """
+    Builds an SLD document for a layer's symbology.
+
+    field_stats holds the min and max of the gradient field for gradient
+    symbology. Rasters whose stats show no valid cells are drawn fully
+    transparent. The highlight style outlines features for the selected
+    feature overlay; the feature itself is chosen with the WMS FEATUREID
+    parameter, so one highlight style serves every feature of a layer.
+    """
+
+    if layer_type in ("point", "timeseries"):
+        if symbology["fillType"] == "gradient":
+            fill_color = build_interpolate(symbology["fillField"], symbology["fillGradient"], field_stats)
+        else:
+            fill_color = escape(str(symbology["fillColor"]))
+        rule = (
+            "<Rule><PointSymbolizer><Graphic><Mark>" +
+            f"<WellKnownName>{escape(str(symbology['fillShape']))}</WellKnownName>" +
+            "<Fill>" +
+            css_parameter("fill", fill_color) +
+            css_parameter("fill-opacity", escape(str(symbology["fillOpacity"]))) +
+            "</Fill>" +
+            build_stroke(symbology, highlight) +
+            "</Mark>" +
+            f"<Size>{escape(str(symbology['fillSize']))}</Size>" +
+            "</Graphic></PointSymbolizer></Rule>"
+        )
+    elif layer_type == "line":
+        if symbology["strokeType"] == "gradient":
+            stroke_color = build_interpolate(symbology["strokeField"], symbology["strokeGradient"], field_stats)
+        else:
+            stroke_color = None
+        rule = "<Rule><LineSymbolizer>" + build_stroke(symbology, highlight, stroke_color) + "</LineSymbolizer></Rule>"
+    elif layer_type == "polygon":
+        if symbology["fillType"] == "gradient":
+            fill_color = build_interpolate(symbology["fillField"], symbology["fillGradient"], field_stats)
+        else:
+            fill_color = escape(str(symbology["fillColor"]))
+        rule = (
+            "<Rule><PolygonSymbolizer>" +
+            "<Fill>" +
+            css_parameter("fill", fill_color) +
+            css_parameter("fill-opacity", "0" if highlight else escape(str(symbology["fillOpacity"]))) +
+            "</Fill>" +
+            build_stroke(symbology, highlight) +
+            "</PolygonSymbolizer></Rule>"
+        )
+    elif layer_type == "raster":
+        colors, positions = get_color_map(symbology["fillGradient"], field_stats)
+        entry_opacity = ' opacity="0"' if field_stats and field_stats.get("count") == 0 else ""
+        rule = (
+            "<Rule><RasterSymbolizer>" +
+            f"<Opacity>{escape(str(symbology['fillOpacity']))}</Opacity>" +
+            "<ColorMap>" +
+            "".join(
+                f"<ColorMapEntry color={quoteattr(color)} quantity=\"{format_number(position)}\"{entry_opacity} />"
+                for color, position in zip(colors, positions)
+            ) +
+            "</ColorMap>" +
+            "</RasterSymbolizer></Rule>"
+        )
+    else:
+        raise ValueError(f"Unknown layer type: {layer_type}")
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>' +
+        '<StyledLayerDescriptor version="1.0.0" ' +
+        'xsi:schemaLocation="http://www.opengis.net/sld http://schemas.opengis.net/sld/1.0.0/StyledLayerDescriptor.xsd" ' +
+        'xmlns="http://www.opengis.net/sld" ' +
+        'xmlns:ogc="http://www.opengis.net/ogc" ' +
+        'xmlns:xlink="http://www.w3.org/1999/xlink" ' +
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">' +
+        "<NamedLayer>" +
+        f"<Name>{escape(layer_code)}</Name>" +
+        "<UserStyle>" +
+        f"<FeatureTypeStyle>{rule}</FeatureTypeStyle>" +
+        build_label_rule(layer_type, symbology) +
+        "</UserStyle>" +
+        "</NamedLayer>" +
+        "</StyledLayerDescriptor>"
+    )
+
+
+def get_style_name(sld_body):
+    """
+    Gets the GeoServer style name for an SLD document.
+
+    Names are derived from a hash of the document, so identical symbology
+    always maps to the same registered style.
+    """
+
+    return style_name_prefix + hashlib.sha1(sld_body.encode("utf-8")).hexdigest()[:24]
+
+
+class StyleRegistry:
+    """
+    Registry of the styles a worker has registered with GeoServer.
+
+    Each style is registered once, the first time the worker uses it, and
+    remembered in an LRU list of up to max_styles names; forgotten styles
+    are registered again when they are next used. collect is called at
+    most once every collect_interval seconds to remove unused styles from
+    GeoServer.
+    """
+
+    def __init__(self, max_styles, collect_interval, register, collect):
+        self.max_styles = max_styles
+        self.collect_interval = collect_interval
+        self.register = register
+        self.collect = collect
+        self.styles = OrderedDict()
+        self.next_collect = time.monotonic() + collect_interval
+        self.lock = threading.Lock()
+
+    def use(self, style_name, sld_body, registered=True):
+        """
+        Registers a style if needed and marks it as recently used.
+
+        Pass registered=False to register the style again even if this
+        worker registered it before, e.g. because it may have been removed.
+        """
+
+        with self.lock:
+            known = registered and style_name in self.styles
+            if known:
+                self.styles.move_to_end(style_name)
+        if not known:
+            self.register(style_name, sld_body)
+            with self.lock:
+                self.styles[style_name] = True
+                self.styles.move_to_end(style_name)
+                while len(self.styles) > self.max_styles:
+                    self.styles.popitem(last=False)
+        now = time.monotonic()
+        with self.lock:
+            collect = now >= self.next_collect
+            if collect:
+                self.next_collect = now + self.collect_interval
+        if collect:
+            self.collect()
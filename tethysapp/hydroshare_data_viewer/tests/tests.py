@@ -1,5 +1,15 @@
 # Most of your test classes should inherit from TethysTestCase
+import os
+import tempfile
+import unittest
+import numpy as np
 from tethys_sdk.testing import TethysTestCase
+from ..features import get_feature_rank, build_cql_filter, build_sort_by, get_table_query, build_table_rows
+from ..stats import get_jenks_breaks, FieldClassifier, FieldStatistics
+from ..metrics import get_endpoint_name
+from ..snapshots import build_workspace_snapshot, merge_snapshot_layer
+from ..styles import get_color_map, build_layer_style
+from ..timeseries import downsample_lttb, downsample_minmax, TimeseriesStore
 
 # Use if your app has persistent stores that will be tested against.
 # Your app class from app.py must be passed as an argument to the TethysTestCase functions to both
@@ -164,3 +174,234 @@ class HydroshareDataViewerTestCase(TethysTestCase):
         context = response.context
         self.assertEqual(context['my_integer'], 10)
         '''
+
+
+class FeatureRankTestCase(unittest.TestCase):
+    """
+    Tests feature row lookup against a sorted list of fids.
+    """
+
+    def test_feature_rank_matches_sorted_fids(self):
+        for layer_count in (1, 9, 10, 11, 99, 100, 101, 1234):
+            fid_list = sorted(str(i) for i in range(1, layer_count + 1))
+            for fid in fid_list:
+                self.assertEqual(get_feature_rank(fid, layer_count), fid_list.index(fid))
+
+    def test_feature_rank_large_layer(self):
+        self.assertEqual(get_feature_rank("1", 10 ** 12), 0)
+        self.assertEqual(get_feature_rank("999999999999", 10 ** 12), 10 ** 12 - 1)
+
+    def test_feature_rank_out_of_range(self):
+        self.assertRaises(ValueError, get_feature_rank, "11", 10)
+
+
+class AttributeTableFilterTestCase(unittest.TestCase):
+    """
+    Tests for building attribute table filters and sort orders.
+    """
+
+    def test_cql_filter(self):
+        layer_fields = [("name", "categorical"), ("population", "numerical")]
+        self.assertIsNone(build_cql_filter(layer_fields, "", ["", ""]))
+        self.assertEqual(
+            build_cql_filter(layer_fields, "O'Neil", ["", ">= 5"]),
+            "(\"name\" ILIKE '%O''Neil%') AND (\"population\" >= 5)"
+        )
+        self.assertEqual(
+            build_cql_filter(layer_fields, "12", ["", ""]),
+            "(\"name\" ILIKE '%12%' OR \"population\" = 12)"
+        )
+        self.assertEqual(build_cql_filter(layer_fields, "", ["", "abc"]), "(EXCLUDE)")
+
+    def test_sort_by(self):
+        self.assertIsNone(build_sort_by(["name"], []))
+        self.assertEqual(build_sort_by(["name", "population"], [(1, "desc"), (0, "asc")]), "population DESC,name ASC")
+
+    def test_table_query(self):
+        query = {
+            "search[value]": "abc",
+            "columns[3][search][value]": "> 5",
+            "order[0][column]": "3",
+            "order[0][dir]": "desc",
+            "order[1][column]": "2"
+        }
+        self.assertEqual(get_table_query(query, 2), ("abc", ["", "> 5"], [(1, "desc"), (0, "asc")]))
+
+    def test_table_rows(self):
+        features = [{"id": "layer.7", "properties": {"population": 5}}]
+        self.assertEqual(build_table_rows(features, 10, ["name", "population"]), [["layer.7", 11, None, 5]])
+
+
+class FieldStatisticsTestCase(unittest.TestCase):
+    """
+    Tests for single-pass vector field statistics.
+    """
+
+    def test_statistics_across_pages(self):
+        field_statistics = FieldStatistics(["depth", "flow"])
+        field_statistics.update([{"properties": {"depth": 2, "flow": None}}, {"properties": {"depth": None}}])
+        field_statistics.update([{"properties": {"depth": -1, "flow": None}}, {"properties": {"depth": 5, "flow": None}}])
+        field_statistics.update([])
+        result = field_statistics.result()
+        self.assertEqual(result["depth"], {"min": -1.0, "max": 5.0, "count": 3, "nullCount": 1, "mean": 2.0})
+        self.assertEqual(result["flow"], {"min": None, "max": None, "count": 0, "nullCount": 4, "mean": None})
+
+
+class FieldClassificationTestCase(unittest.TestCase):
+    """
+    Tests for layer field classification.
+    """
+
+    def test_jenks_breaks(self):
+        values = [1, 2, 3, 10, 11, 12, 30, 31, 32]
+        self.assertEqual(get_jenks_breaks(values, 3), [1, 3, 12, 32])
+
+    def test_categories_are_bounded(self):
+        features = [{"properties": {"name": i}} for i in "aaaabbbcd"] + [{"properties": {"name": None}}]
+        field_classifier = FieldClassifier("name", "categorical", max_categories=2)
+        field_classifier.update(features)
+        field_classifier.recount([features])
+        result = field_classifier.result("categories", None)
+        self.assertEqual(result["categories"], [{"value": "a", "count": 4}, {"value": "b", "count": 3}])
+        self.assertEqual(result["otherCount"], 2)
+        self.assertTrue(result["truncated"])
+        self.assertEqual(result["nullCount"], 1)
+
+
+class DownsampleTestCase(unittest.TestCase):
+    """
+    Tests for time series downsampling.
+    """
+
+    times = np.arange(100000, dtype=np.int64) * 60000
+    values = np.sin(np.arange(100000) / 500)
+
+    def test_downsample_is_bounded(self):
+        for downsample in (downsample_lttb, downsample_minmax):
+            times, values = downsample(self.times, self.values, 1000)
+            self.assertLessEqual(times.size, 1000)
+            self.assertEqual(times[0], self.times[0])
+            self.assertTrue((np.diff(times) > 0).all())
+
+    def test_downsample_with_gaps_is_bounded(self):
+        values = self.values.copy()
+        values[::3] = np.nan
+        values[50000:60000] = np.nan
+        for downsample in (downsample_lttb, downsample_minmax):
+            times, sampled_values = downsample(self.times, values, 1000)
+            self.assertLessEqual(times.size, 1000)
+            self.assertTrue(np.isnan(sampled_values).any())
+            self.assertTrue((np.diff(times) > 0).all())
+
+    def test_short_series_is_unchanged(self):
+        values = self.values[:500].copy()
+        values[100:120] = np.nan
+        times, sampled_values = downsample_lttb(self.times[:500], values, 1000)
+        self.assertEqual(times.size, 500)
+        self.assertEqual(int(np.isnan(sampled_values).sum()), 20)
+
+
+class TimeseriesStoreTestCase(unittest.TestCase):
+    """
+    Tests for the on-disk time series store.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = TimeseriesStore(self.temp_dir.name, max_bytes=6000)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def append(self, key, start, end):
+        times = np.arange(start, end, dtype=np.int64)
+        self.store.append(key, times, times.astype(np.float64), -9999, "cfs", 0)
+
+    def test_overlapping_appends(self):
+        self.append("a", 0, 100)
+        self.append("a", 50, 150)
+        self.append("a", 0, 20)
+        timeseries = self.store.read("a")
+        self.assertEqual(timeseries["length"], 150)
+        self.assertEqual(timeseries["last_time"], 149)
+        self.assertTrue((np.asarray(timeseries["times"]) == np.arange(150)).all())
+        self.assertTrue((np.asarray(timeseries["values"]) == np.arange(150)).all())
+        self.assertIsNone(self.store.read("b"))
+
+    def test_evicts_least_recently_used(self):
+        for age, key in enumerate(("c", "b", "a")):
+            self.append(key, 0, 100)
+            last_used = 1000000 - age * 1000
+            os.utime(os.path.join(self.store.get_series_path(key), "metadata.json"), (last_used, last_used))
+        self.append("d", 0, 100)
+        self.assertIsNone(self.store.read("a"))
+        self.assertIsNotNone(self.store.read("b"))
+        self.assertIsNotNone(self.store.read("d"))
+        with open(os.path.join(self.temp_dir.name, "size")) as size_file:
+            self.assertLessEqual(int(size_file.read()), self.store.max_bytes)
+
+
+class LayerStyleTestCase(unittest.TestCase):
+    """
+    Tests for layer styles.
+    """
+
+    def test_color_map_without_values(self):
+        self.assertEqual(get_color_map("gray", {"min": None, "max": None, "p2": None, "p98": None}), (["#000000"], [0]))
+        self.assertEqual(get_color_map("gray", None), (["#000000"], [0]))
+        self.assertEqual(get_color_map("gray", {"min": 1, "max": 5, "p2": 2, "p98": 4}), (["#000000", "#FFFFFF"], [2, 4]))
+
+    def test_no_data_raster_style(self):
+        field_stats = {"min": None, "max": None, "p2": None, "p98": None, "count": 0, "nullCount": 100, "ndv": -9999}
+        sld_body = build_layer_style("HS-abc123:elevation", "raster", {"fillGradient": "viridis", "fillOpacity": 1}, field_stats)
+        self.assertIn('<ColorMapEntry color="#4401FF" quantity="0" opacity="0" />', sld_body)
+        self.assertEqual(sld_body.count("<ColorMapEntry"), 1)
+
+
+class MetricsTestCase(unittest.TestCase):
+    """
+    Tests for upstream request metrics.
+    """
+
+    def test_endpoint_names(self):
+        self.assertEqual(
+            get_endpoint_name("https://geoserver.example.org/geoserver/wfs/", {"service": "WFS", "request": "GetFeature", "resultType": "hits"}),
+            "geoserver.wfs_getfeature_hits"
+        )
+        self.assertEqual(
+            get_endpoint_name("https://geoserver.example.org/geoserver/wfs/?service=WFS&request=describeFeatureType&typename=a:b"),
+            "geoserver.wfs_describefeaturetype"
+        )
+        self.assertEqual(get_endpoint_name("https://geoserver.example.org/geoserver/wms", {"REQUEST": "GetMap"}), "geoserver.wms_getmap")
+        self.assertEqual(get_endpoint_name("https://www.hydroshare.org/hsapi/resource/abc123/sysmeta/"), "hydroshare.sysmeta")
+        self.assertEqual(get_endpoint_name("https://geoserver.example.org/wds/wof/abc/db/values/"), "hydroserver.values")
+
+
+class WorkspaceSnapshotTestCase(unittest.TestCase):
+    """
+    Tests for workspace snapshots.
+    """
+
+    layer = {
+        "layerCode": "HS-abc123:rivers",
+        "layerName": "rivers",
+        "resourceId": "abc123",
+        "layerType": "line",
+        "layerFields": [{"fieldName": "flow", "fieldType": "double", "fieldStats": None}],
+        "layerSymbology": {"strokeType": "simple", "strokeField": None},
+        "layerVisible": True
+    }
+
+    def test_snapshot_keeps_layer_settings(self):
+        layer = dict(self.layer, layerStyle={"styleName": "abc"}, layerVisible=False)
+        snapshot = build_workspace_snapshot([layer], {"abc123": "2021-01-01T00:00:00Z"})
+        self.assertNotIn("layerStyle", snapshot["layers"][0])
+        self.assertFalse(snapshot["layers"][0]["layerVisible"])
+
+    def test_merge_keeps_valid_symbology(self):
+        saved_layer = dict(self.layer, layerName="Rivers", layerSymbology={"strokeType": "gradient", "strokeField": "flow"})
+        merged_layer = merge_snapshot_layer(saved_layer, self.layer)
+        self.assertEqual(merged_layer["layerName"], "Rivers")
+        self.assertEqual(merged_layer["layerSymbology"]["strokeField"], "flow")
+        saved_layer["layerSymbology"] = {"strokeType": "gradient", "strokeField": "depth"}
+        self.assertEqual(merge_snapshot_layer(saved_layer, self.layer)["layerSymbology"], self.layer["layerSymbology"])
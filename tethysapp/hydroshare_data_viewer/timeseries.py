@@ -0,0 +1,394 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import numpy as np
+from lxml import etree
+from .cache import file_lock, add_recorded_size, write_recorded_size
+
+WATERML_NS = "{http://www.cuahsi.org/waterML/1.1/}"
+
+parse_chunk_size = 65536
+
+
+def parse_waterml(source):
+    """
+    Parses a WaterML 1.1 values document.
+
+    Reads the first time series of the document incrementally, clearing
+    elements once they are read, and converts its values in chunks. Returns
+    a dictionary of value times as int64 epoch milliseconds, values as
+    float64 with NaN in place of the no data value, the no data value, and
+    the unit abbreviation. Times are taken as written in the document,
+    without applying a time zone offset.
+    """
+
+    no_data_value = None
+    unit_name = None
+    time_chunks = []
+    value_chunks = []
+    chunk_times = []
+    chunk_values = []
+
+    def flush_chunk():
+        time_chunks.append(np.array(chunk_times, dtype="datetime64[ms]").astype(np.int64))
+        value_chunks.append(np.array(chunk_values, dtype=np.float64))
+        chunk_times.clear()
+        chunk_values.clear()
+
+    tags = (
+        f"{WATERML_NS}noDataValue",
+        f"{WATERML_NS}unitAbbreviation",
+        f"{WATERML_NS}value",
+        f"{WATERML_NS}timeSeries"
+    )
+    for event, element in etree.iterparse(source, events=("end",), tag=tags):
+        tag = element.tag[len(WATERML_NS):]
+        if tag == "value":
+            chunk_times.append(element.get("dateTime")[:19])
+            chunk_values.append(element.text)
+            if len(chunk_times) == parse_chunk_size:
+                flush_chunk()
+        elif tag == "noDataValue" and no_data_value is None:
+            no_data_value = element.text
+        elif tag == "unitAbbreviation" and unit_name is None:
+            unit_name = element.text
+        elif tag == "timeSeries":
+            break
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    if chunk_times or not time_chunks:
+        flush_chunk()
+
+    times = np.concatenate(time_chunks)
+    values = np.concatenate(value_chunks)
+    if no_data_value is not None:
+        values[values == float(no_data_value)] = np.nan
+
+    return {
+        "times": times,
+        "values": values,
+        "no_data_value": no_data_value,
+        "unit_name": unit_name
+    }
+
+
+def select_window(times, values, start_time=None, end_time=None):
+    """
+    Gets the part of a time series within a time window.
+
+    Start and end times are epoch milliseconds and are inclusive. Times must
+    be sorted.
+    """
+
+    start = 0 if start_time is None else np.searchsorted(times, start_time, side="left")
+    end = times.size if end_time is None else np.searchsorted(times, end_time, side="right")
+    return times[start:end], values[start:end]
+
+
+def downsample_with_gaps(downsample, times, values, max_points):
+    """
+    Downsamples the values of a time series around its gaps.
+
+    Missing values are left out of the downsampling, and the first missing
+    value of each gap is kept as a marker, so plots still break the line
+    where the series has no values. Gap markers take up to half of
+    max_points: if there are more gaps, the series is split into
+    max_points / 2 buckets and only the first gap of each bucket is kept.
+    downsample gets the rest.
+    """
+
+    missing = np.isnan(values)
+    gap_starts = np.flatnonzero(missing & ~np.r_[False, missing[:-1]])
+    gap_limit = max_points // 2
+    if gap_starts.size > gap_limit:
+        gap_buckets = gap_starts * gap_limit // times.size
+        gap_starts = gap_starts[np.r_[True, gap_buckets[1:] != gap_buckets[:-1]]]
+    finite = ~missing
+    sampled_times, sampled_values = downsample(times[finite], values[finite], max_points - gap_starts.size)
+    times = np.concatenate((sampled_times, times[gap_starts]))
+    values = np.concatenate((sampled_values, values[gap_starts]))
+    order = np.argsort(times, kind="stable")
+    return times[order], values[order]
+
+
+def downsample_lttb(times, values, max_points):
+    """
+    Downsamples a time series with Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last points and, from each bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the average of the next bucket. Series with missing values are
+    downsampled around their gaps.
+    """
+
+    if max_points >= times.size or max_points < 3:
+        return times, values
+    if np.isnan(values).any():
+        return downsample_with_gaps(downsample_lttb, times, values, max_points)
+    n = times.size
+
+    x = times.astype(np.float64)
+    y = values
+    bucket_count = max_points - 2
+    edges = np.linspace(1, n - 1, bucket_count + 1).astype(np.int64)
+    bucket_sizes = np.diff(edges)
+    average_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / bucket_sizes
+    average_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / bucket_sizes
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(bucket_count):
+        lower, upper = edges[i], edges[i + 1]
+        if i + 1 < bucket_count:
+            next_x, next_y = average_x[i + 1], average_y[i + 1]
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        areas = np.abs(
+            (x[a] - next_x) * (y[lower:upper] - y[a]) -
+            (x[a] - x[lower:upper]) * (next_y - y[a])
+        )
+        a = lower + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return times[selected], values[selected]
+
+
+def downsample_minmax(times, values, max_points):
+    """
+    Downsamples a time series to a min/max envelope.
+
+    Splits the series into max_points / 2 buckets and keeps the lowest and
+    highest point of each bucket in time order, so every peak is kept.
+    Series with missing values are downsampled around their gaps.
+    """
+
+    n = times.size
+    bucket_count = max_points // 2
+    if max_points >= n or bucket_count < 1:
+        return times, values
+    if np.isnan(values).any():
+        return downsample_with_gaps(downsample_minmax, times, values, max_points)
+
+    buckets = np.arange(n) * bucket_count // n
+    order = np.lexsort((values, buckets))
+    bucket_starts = np.flatnonzero(np.r_[True, buckets[order][1:] != buckets[order][:-1]])
+    bucket_ends = np.r_[bucket_starts[1:], n] - 1
+    selected = np.unique(np.concatenate((order[bucket_starts], order[bucket_ends])))
+
+    return times[selected], values[selected]
+
+
+def downsample_timeseries(times, values, max_points, method="lttb"):
+    """
+    Downsamples a time series to at most max_points points.
+
+    Supports Largest-Triangle-Three-Buckets ("lttb") and min/max envelope
+    ("minmax") downsampling.
+    """
+
+    if method == "minmax":
+        return downsample_minmax(times, values, max_points)
+    else:
+        return downsample_lttb(times, values, max_points)
+
+
+def align_timeseries(series_list):
+    """
+    Aligns several time series on a shared time column.
+
+    Takes a list of (times, values) pairs and returns the sorted union of
+    their times and, for each series, its values on that time column with
+    NaN where the series has no value.
+    """
+
+    times = np.unique(np.concatenate([series_times for series_times, series_values in series_list] or [np.empty(0, dtype=np.int64)]))
+    aligned_values = []
+    for series_times, series_values in series_list:
+        values = np.full(times.size, np.nan)
+        values[np.searchsorted(times, series_times)] = series_values
+        aligned_values.append(values)
+    return times, aligned_values
+
+
+def get_json_values(values):
+    """
+    Gets a JSON serializable list of values with missing values as null.
+    """
+
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def get_columnar_data(times, values):
+    """
+    Gets JSON serializable columns for a time series.
+
+    Missing values are returned as null.
+    """
+
+    return {
+        "times": times.tolist(),
+        "values": get_json_values(values)
+    }
+
+
+def encode_timeseries_binary(metadata, times, values):
+    """
+    Encodes a time series as a binary payload.
+
+    The payload is a little-endian uint32 header length, a UTF-8 JSON
+    header padded to a multiple of eight bytes, then the times and values
+    as float64 arrays. Missing values are encoded as NaN.
+    """
+
+    header = json.dumps(dict(metadata, length=int(times.size))).encode("utf-8")
+    header += b" " * (-(len(header) + 4) % 8)
+    return b"".join((
+        struct.pack("<I", len(header)),
+        header,
+        times.astype("<f8").tobytes(),
+        values.astype("<f8").tobytes()
+    ))
+
+
+class TimeseriesStore:
+    """
+    On-disk store of downloaded time series.
+
+    Each series is kept in its own directory as raw int64 time and float64
+    value columns that can be memory-mapped, plus a JSON metadata file that
+    records the number of valid rows. New values are appended in place.
+    File locks make reads, appends, and eviction safe across processes. The
+    store size is recorded in the store directory and updated by each
+    append, and the least recently used series are removed once it grows
+    past the size limit.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_series_path(self, key):
+        return os.path.join(self.path, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def read_metadata(self, series_path):
+        try:
+            with open(os.path.join(series_path, "metadata.json")) as metadata_file:
+                return json.load(metadata_file)
+        except (OSError, ValueError):
+            return None
+
+    def write_metadata(self, series_path, metadata):
+        temp_path = os.path.join(series_path, "metadata.json.tmp")
+        with open(temp_path, "w") as metadata_file:
+            json.dump(metadata, metadata_file)
+        os.replace(temp_path, os.path.join(series_path, "metadata.json"))
+
+    def read(self, key):
+        """
+        Gets a stored time series.
+
+        Returns the metadata with memory-mapped "times" and "values" arrays,
+        or None if the series is not stored.
+        """
+
+        series_path = self.get_series_path(key)
+        if not os.path.isdir(series_path):
+            return None
+        try:
+            with file_lock(os.path.join(series_path, "lock"), exclusive=False):
+                metadata = self.read_metadata(series_path)
+                if metadata is None:
+                    return None
+                length = metadata["length"]
+                if length:
+                    times = np.memmap(os.path.join(series_path, "times.i8"), dtype="<i8", mode="r", shape=(length,))
+                    values = np.memmap(os.path.join(series_path, "values.f8"), dtype="<f8", mode="r", shape=(length,))
+                else:
+                    times = np.empty(0, dtype=np.int64)
+                    values = np.empty(0, dtype=np.float64)
+                os.utime(os.path.join(series_path, "metadata.json"))
+        except FileNotFoundError:
+            return None
+        return dict(metadata, times=times, values=values)
+
+    def append(self, key, times, values, no_data_value, unit_name, checked):
+        """
+        Appends values to a stored time series.
+
+        Values at or before the last stored time are ignored, so overlapping
+        downloads can be appended safely.
+        """
+
+        series_path = self.get_series_path(key)
+        with file_lock(os.path.join(self.path, "store.lock"), exclusive=False):
+            os.makedirs(series_path, exist_ok=True)
+            with file_lock(os.path.join(series_path, "lock"), exclusive=True):
+                old_size = self.get_series_size(series_path)
+                self.write_series(series_path, times, values, no_data_value, unit_name, checked)
+                store_size = add_recorded_size(self.path, self.get_series_size(series_path) - old_size)
+        if store_size is None or store_size > self.max_bytes:
+            self.evict()
+
+    def get_series_size(self, series_path):
+        series_size = 0
+        for entry in os.scandir(series_path):
+            try:
+                series_size += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return series_size
+
+    def write_series(self, series_path, times, values, no_data_value, unit_name, checked):
+        """
+        Writes new values and metadata to a series directory.
+
+        The caller holds the series lock.
+        """
+
+        metadata = self.read_metadata(series_path) or {"length": 0, "last_time": None}
+        if metadata["last_time"] is not None:
+            new_values = times > metadata["last_time"]
+            times, values = times[new_values], values[new_values]
+        for file_name, column, dtype in (("times.i8", times, "<i8"), ("values.f8", values, "<f8")):
+            with open(os.path.join(series_path, file_name), "ab") as column_file:
+                column_file.truncate(metadata["length"] * 8)
+                column_file.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+        self.write_metadata(series_path, {
+            "length": metadata["length"] + int(times.size),
+            "last_time": int(times[-1]) if times.size else metadata["last_time"],
+            "no_data_value": no_data_value,
+            "unit_name": unit_name,
+            "checked": checked
+        })
+
+    def evict(self):
+        """
+        Removes least recently used series until the store fits its size limit.
+        """
+
+        with file_lock(os.path.join(self.path, "store.lock"), exclusive=True):
+            series_list = []
+            store_size = 0
+            for entry in os.scandir(self.path):
+                if not entry.is_dir():
+                    continue
+                try:
+                    series_size = self.get_series_size(entry.path)
+                    last_used = os.stat(os.path.join(entry.path, "metadata.json")).st_mtime
+                except FileNotFoundError:
+                    continue
+                series_list.append((last_used, series_size, entry.path))
+                store_size += series_size
+            series_list.sort()
+            while store_size > self.max_bytes and len(series_list) > 1:
+                last_used, series_size, series_path = series_list.pop(0)
+                with file_lock(os.path.join(series_path, "lock"), exclusive=True):
+                    shutil.rmtree(series_path, ignore_errors=True)
+                store_size -= series_size
+            write_recorded_size(self.path, store_size)
@@ -0,0 +1,345 @@
+import asyncio
+import contextvars
+import shutil
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from .app import HydroshareDataViewer as app
+from . import metrics
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def get_setting(name, default):
+    """
+    Gets an optional app setting.
+
+    Returns the default value when the setting has not been defined.
+    """
+
+    value = app.get_custom_setting(name)
+    return default if value is None else value
+
+
+pool_size = get_setting("upstream_pool_size", 10)
+connect_timeout = get_setting("upstream_connect_timeout", 5)
+read_timeout = get_setting("upstream_read_timeout", 60)
+max_retries = get_setting("upstream_max_retries", 2)
+retry_backoff = 0.5
+retry_statuses = (502, 503, 504)
+
+sessions = {}
+sessions_lock = threading.Lock()
+async_clients = weakref.WeakKeyDictionary()
+connection_stats = {}
+connection_stats_lock = threading.Lock()
+
+request_budget = contextvars.ContextVar("request_budget", default=None)
+
+
+def count_connection(host, stat):
+    """
+    Increments a connection counter for an upstream host.
+    """
+
+    with connection_stats_lock:
+        host_stats = connection_stats.setdefault(host, {"requests": 0, "opened": 0})
+        host_stats[stat] += 1
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """
+    HTTP connection pool that counts requests and new connections.
+    """
+
+    def _new_conn(self):
+        count_connection(self.host, "opened")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        count_connection(self.host, "requests")
+        return super()._make_request(*args, **kwargs)
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """
+    HTTPS connection pool that counts requests and new connections.
+    """
+
+    def _new_conn(self):
+        count_connection(self.host, "opened")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        count_connection(self.host, "requests")
+        return super()._make_request(*args, **kwargs)
+
+
+class UpstreamAdapter(HTTPAdapter):
+    """
+    Transport adapter for upstream hosts.
+
+    Keeps a bounded pool of keep-alive connections and counts how many
+    requests reuse an existing connection.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool
+        }
+
+
+class RequestBudget:
+    """
+    Limits the upstream requests made by background work.
+
+    While a budget is set in request_budget, sync requests wait until fewer
+    than max_requests requests are in flight and are spaced to at most rate
+    requests per second. The budget follows work submitted with
+    metrics.submit, so requests made on worker threads are limited too.
+    """
+
+    def __init__(self, max_requests, rate):
+        self.semaphore = threading.BoundedSemaphore(max_requests)
+        self.interval = 1 / rate if rate else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.semaphore.release()
+
+
+def get_retry():
+    """
+    Gets the retry policy for upstream requests.
+
+    Only idempotent GET and HEAD requests are retried. The last response is
+    returned when a server error persists after all retries.
+    """
+
+    retry_options = {
+        "total": max_retries,
+        "backoff_factor": retry_backoff,
+        "status_forcelist": retry_statuses,
+        "raise_on_status": False
+    }
+    try:
+        return Retry(allowed_methods=frozenset(("GET", "HEAD")), **retry_options)
+    except TypeError:
+        return Retry(method_whitelist=frozenset(("GET", "HEAD")), **retry_options)
+
+
+def get_session(url):
+    """
+    Gets the pooled session for an upstream host.
+
+    One session is kept per scheme and host, so connections are reused by all
+    requests to that host made within the worker process.
+    """
+
+    host_key = "{0.scheme}://{0.netloc}".format(urlsplit(url))
+    session = sessions.get(host_key)
+    if session is None:
+        with sessions_lock:
+            session = sessions.get(host_key)
+            if session is None:
+                session = requests.Session()
+                adapter = UpstreamAdapter(
+                    pool_maxsize=pool_size,
+                    max_retries=get_retry()
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                sessions[host_key] = session
+    return session
+
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Sends a request to an upstream host.
+
+    Requests use the host's pooled session and are bounded by the configured
+    connect and read timeouts unless a timeout is given. Each request is
+    recorded in the metrics of its upstream endpoint; streamed responses are
+    timed until their headers arrive. Requests made within a request budget
+    wait for their turn before they are sent.
+    """
+
+    if timeout is None:
+        timeout = (connect_timeout, read_timeout)
+    endpoint = metrics.get_endpoint_name(url, kwargs.get("params") or kwargs.get("data"))
+    with request_budget.get() or nullcontext():
+        start = time.perf_counter()
+        try:
+            response = get_session(url).request(method, url, timeout=timeout, **kwargs)
+        except Exception:
+            metrics.observe_upstream(endpoint, time.perf_counter() - start, error=True)
+            raise
+    if kwargs.get("stream"):
+        response_bytes = int(response.headers.get("Content-Length") or 0)
+    else:
+        response_bytes = len(response.content)
+    metrics.observe_upstream(endpoint, time.perf_counter() - start, response_bytes, response.status_code >= 400)
+    return response
+
+
+def get(url, params=None, **kwargs):
+    """
+    Sends a GET request to an upstream host.
+    """
+
+    return request("GET", url, params=params, **kwargs)
+
+
+def get_async_client(url):
+    """
+    Gets the pooled async client for an upstream host.
+
+    One client is kept per scheme, host, and event loop. Like the sync
+    sessions, clients keep up to pool_size idle connections and open more
+    when needed, so concurrent requests never wait for a free connection.
+    """
+
+    host_key = "{0.scheme}://{0.netloc}".format(urlsplit(url))
+    loop_clients = async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = loop_clients.get(host_key)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+        loop_clients[host_key] = client
+    return client
+
+
+def get_async_timeout(timeout):
+    """
+    Converts a requests style timeout to an httpx timeout.
+    """
+
+    if isinstance(timeout, tuple):
+        return httpx.Timeout(timeout[1], connect=timeout[0])
+    return httpx.Timeout(timeout)
+
+
+async def async_request(method, url, timeout=None, **kwargs):
+    """
+    Sends a request to an upstream host without blocking the event loop.
+
+    Requests use the host's pooled async client, and GET and HEAD requests
+    are retried on connection errors and server errors like sync requests.
+    If httpx is not installed, the request is sent with the host's pooled
+    session on a worker thread. Returns the response with its body read.
+    """
+
+    if httpx is None:
+        return await sync_to_async(request, thread_sensitive=False)(method, url, timeout=timeout, **kwargs)
+    if timeout is not None:
+        kwargs["timeout"] = get_async_timeout(timeout)
+    endpoint = metrics.get_endpoint_name(url, kwargs.get("params") or kwargs.get("data"))
+    start = time.perf_counter()
+    try:
+        response = await send_async_request(method, url, **kwargs)
+    except Exception:
+        metrics.observe_upstream(endpoint, time.perf_counter() - start, error=True)
+        raise
+    metrics.observe_upstream(endpoint, time.perf_counter() - start, len(response.content), response.status_code >= 400)
+    return response
+
+
+async def send_async_request(method, url, **kwargs):
+    """
+    Sends a request with the host's pooled async client, retrying GET and
+    HEAD requests.
+    """
+
+    client = get_async_client(url)
+    retries = max_retries if method in ("GET", "HEAD") else 0
+    for attempt in range(retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in retry_statuses or attempt == retries:
+                return response
+        await asyncio.sleep(retry_backoff * 2 ** attempt)
+
+
+async def async_get(url, params=None, **kwargs):
+    """
+    Sends a GET request to an upstream host without blocking the event loop.
+    """
+
+    return await async_request("GET", url, params=params, **kwargs)
+
+
+async def async_download(url, file, params=None, **kwargs):
+    """
+    Downloads an upstream GET response into a file without blocking the
+    event loop.
+
+    The response body is written to the file as it arrives. The request is
+    timed until its headers arrive.
+    """
+
+    if httpx is None:
+        def download():
+            with get(url, params=params, stream=True, **kwargs) as response:
+                response.raw.decode_content = True
+                shutil.copyfileobj(response.raw, file)
+        return await sync_to_async(download, thread_sensitive=False)()
+    endpoint = metrics.get_endpoint_name(url, params)
+    start = time.perf_counter()
+    response = None
+    try:
+        async with get_async_client(url).stream("GET", url, params=params, **kwargs) as response:
+            response_bytes = int(response.headers.get("Content-Length") or 0)
+            metrics.observe_upstream(endpoint, time.perf_counter() - start, response_bytes, response.status_code >= 400)
+            async for chunk in response.aiter_bytes():
+                file.write(chunk)
+    except httpx.TransportError:
+        if response is None:
+            metrics.observe_upstream(endpoint, time.perf_counter() - start, error=True)
+        raise
+
+
+def get_connection_stats():
+    """
+    Gets connection counts for each upstream host.
+
+    Returns the number of requests sent, connections opened, and connections
+    reused for each host since the worker started.
+    """
+
+    with connection_stats_lock:
+        return {
+            host: {
+                "requests": host_stats["requests"],
+                "opened": host_stats["opened"],
+                "reused": max(host_stats["requests"] - host_stats["opened"], 0)
+            } for host, host_stats in connection_stats.items()
+        }
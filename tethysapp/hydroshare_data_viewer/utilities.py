@@ -1,16 +1,935 @@
 import random
 import string
-import requests
 import json
+import os
 import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from asgiref.sync import sync_to_async
 from lxml import etree
 from .app import HydroshareDataViewer as app
+from . import metrics, upstream
+from .cache import Cache, FileCache, SharedLock, SingleFlight, AsyncSingleFlight, TileCache, background_work
+from .snapshots import build_workspace_snapshot, merge_snapshot_layer, write_workspace_snapshot, \
+    read_workspace_snapshot
+from .ows import parse_wfs_capabilities, parse_wcs_capabilities, parse_feature_type_fields, get_layer_coverage
+from .stats import FieldStatistics, FieldClassifier, parse_ascii_grid, get_raster_statistics
+from .styles import build_layer_style, get_style_name, style_name_prefix, StyleRegistry
+from .timeseries import parse_waterml, TimeseriesStore
 
+hydroshare_url = app.get_custom_setting("hydroshare_url")
 geoserver_url = app.get_custom_setting("geoserver_url")
 hydroserver_url = app.get_custom_setting("hydroserver_url")
 include_feature = app.get_custom_setting("include_feature")
 include_raster = app.get_custom_setting("include_raster")
 include_timeseries = app.get_custom_setting("include_timeseries")
+discovery_workers = app.get_custom_setting("discovery_workers") or 8
+shared_cache = app.get_custom_setting("shared_cache")
+shared_lock_timeout = upstream.get_setting("shared_lock_timeout", 30)
+geoserver_username = app.get_custom_setting("geoserver_username")
+geoserver_password = app.get_custom_setting("geoserver_password")
+
+layer_cache_ttl = app.get_custom_setting("layer_cache_ttl") or 86400
+layer_error_ttl = 60
+
+layer_cache = Cache(
+    "layers",
+    ttl=layer_cache_ttl,
+    max_bytes=(app.get_custom_setting("layer_cache_size") or 64) * 1024 * 1024,
+    shared_cache=shared_cache,
+    lock_timeout=shared_lock_timeout
+)
+resource_version_cache = Cache(
+    "resource_versions",
+    ttl=layer_cache_ttl,
+    max_bytes=1024 * 1024,
+    shared_cache=shared_cache
+)
+feature_count_cache = Cache(
+    "feature_counts",
+    ttl=layer_cache_ttl,
+    max_bytes=4 * 1024 * 1024,
+    shared_cache=shared_cache,
+    lock_timeout=shared_lock_timeout
+)
+field_stats_cache = Cache(
+    "field_stats",
+    ttl=layer_cache_ttl,
+    max_bytes=8 * 1024 * 1024,
+    shared_cache=shared_cache,
+    lock_timeout=shared_lock_timeout
+)
+style_max_idle = app.get_custom_setting("style_max_idle") or 86400
+style_collect_interval = 3600
+style_usage_cache = Cache(
+    "style_usage",
+    ttl=style_max_idle,
+    max_bytes=1024 * 1024,
+    shared_cache=shared_cache
+)
+if shared_cache:
+    style_body_cache = Cache(
+        "style_bodies",
+        ttl=style_max_idle,
+        max_bytes=16 * 1024 * 1024,
+        shared_cache=shared_cache
+    )
+else:
+    style_body_cache = FileCache(
+        "style_bodies",
+        os.path.join(app.get_app_workspace().path, "styles"),
+        ttl=style_max_idle,
+        prune_interval=style_collect_interval
+    )
+field_classes_cache = Cache(
+    "field_classes",
+    ttl=layer_cache_ttl,
+    max_bytes=8 * 1024 * 1024,
+    shared_cache=shared_cache,
+    lock_timeout=shared_lock_timeout
+)
+resource_page_cache = Cache(
+    "resource_pages",
+    ttl=app.get_custom_setting("discover_cache_ttl") or 60,
+    max_bytes=16 * 1024 * 1024,
+    shared_cache=shared_cache
+)
+resource_view_cache = Cache(
+    "resource_views",
+    ttl=7 * 86400,
+    max_bytes=1024 * 1024,
+    shared_cache=shared_cache
+)
+layer_requests = SingleFlight("layers")
+
+timeseries_store = TimeseriesStore(
+    os.path.join(app.get_app_workspace().path, "timeseries"),
+    max_bytes=(app.get_custom_setting("timeseries_store_size") or 512) * 1024 * 1024
+)
+tile_cache = TileCache(
+    os.path.join(app.get_app_workspace().path, "tiles"),
+    max_bytes=(app.get_custom_setting("tile_cache_size") or 1024) * 1024 * 1024
+)
+tile_requests = SingleFlight("tiles")
+tile_size = 256
+tile_grid_extent = 20037508.342789244
+
+timeseries_refresh_interval = app.get_custom_setting("timeseries_refresh_interval") or 300
+timeseries_executor = ThreadPoolExecutor(max_workers=app.get_custom_setting("timeseries_workers") or 4)
+timeseries_requests = SingleFlight("timeseries")
+async_timeseries_requests = AsyncSingleFlight("timeseries")
+timeseries_lock = SharedLock("timeseries", shared_cache, shared_lock_timeout)
+waterml_spool_size = 8 * 1024 * 1024
+
+stats_page_size = 10000
+raster_stats_size = app.get_custom_setting("raster_stats_size") or 512
+classification_methods = ("equal_interval", "quantile", "jenks")
+export_page_size = 5000
+
+background_executor = ThreadPoolExecutor(max_workers=2)
+prefetching_pages = set()
+prefetching_pages_lock = threading.Lock()
+
+prewarm_interval = app.get_custom_setting("prewarm_interval")
+prewarm_resource_count = app.get_custom_setting("prewarm_resources") or 20
+prewarm_concurrency = app.get_custom_setting("prewarm_concurrency") or 2
+prewarm_rate = app.get_custom_setting("prewarm_rate") or 5
+recent_resource_days = 7
+viewed_resource_limit = 200
+resource_views = {}
+resource_views_lock = threading.Lock()
+prewarmer_lock = threading.Lock()
+prewarmer_started = threading.Event()
+
+max_layers = app.get_custom_setting("max_layers")
+workspace_snapshot_name = "workspace.json.gz"
+
+
+def get_resource_layers(resource_id, date_last_updated):
+    """
+    Gets cached list of layers for a resource.
+
+    Layer lists are cached by resource ID and the resource's last updated
+    date, so a resource is only discovered again after it changes. Results
+    with layer errors are only cached for layer_error_ttl seconds, so the
+    failed layers are retried soon. Concurrent requests for an uncached
+    resource share a single discovery.
+    """
+
+    layer_list = layer_cache.get((resource_id, date_last_updated))
+    if layer_list is not None:
+        return layer_list, []
+    return layer_requests.do(
+        (resource_id, date_last_updated),
+        lambda: discover_resource_layers(resource_id, date_last_updated)
+    )
+
+
+def discover_resource_layers(resource_id, date_last_updated):
+    """
+    Discovers a resource's layers and caches them.
+
+    With a shared cache, one worker process discovers a resource at a time
+    and the others use its cached layer list, or its result with layer
+    errors while that is cached.
+    """
+
+    layer_key = (resource_id, date_last_updated)
+    error_key = (resource_id, date_last_updated, "errors")
+    with layer_cache.shared_lock.hold(
+        layer_key,
+        lambda: layer_cache.get_data(layer_key) is not None or layer_cache.get_data(error_key) is not None
+    ):
+        layer_list = layer_cache.get(layer_key)
+        if layer_list is not None:
+            return layer_list, []
+        layer_result = layer_cache.get(error_key)
+        if layer_result is not None:
+            return layer_result
+        layer_list, layer_errors = get_layers(resource_id)
+        if layer_errors:
+            layer_cache.set(error_key, (layer_list, layer_errors), layer_error_ttl)
+        else:
+            layer_cache.set(layer_key, layer_list)
+    return layer_list, layer_errors
+
+
+async def async_get_resource_layers(resource_id, date_last_updated):
+    """
+    Gets cached list of layers for a resource in an async view.
+
+    Cached layer lists are read with Cache.async_get. Uncached resources
+    are discovered by get_resource_layers on a worker thread.
+    """
+
+    layer_list = await layer_cache.async_get((resource_id, date_last_updated))
+    if layer_list is not None:
+        return layer_list, []
+    return await sync_to_async(get_resource_layers, thread_sensitive=False)(resource_id, date_last_updated)
+
+
+def get_resource_summary(resource_id, sysmeta):
+    """
+    Gets resource info from a resource's HydroShare system metadata.
+
+    Returns the resource's title, abstract, creator, dates, link, sharing
+    status, type, and the bounding box of its point or box coverage.
+    """
+
+    if sysmeta["public"] is True:
+        sharing_status = "Public"
+    elif sysmeta["discoverable"] is True:
+        sharing_status = "Discoverable"
+    else:
+        sharing_status = "Private"
+
+    bounding_box = None
+    for coverage in sysmeta["coverages"]:
+        if coverage["type"] == "point":
+            bounding_box = {
+                "min_x": coverage["value"]["east"],
+                "min_y": coverage["value"]["north"],
+                "max_x": coverage["value"]["east"],
+                "max_y": coverage["value"]["north"]
+            }
+        elif coverage["type"] == "box":
+            bounding_box = {
+                "min_x": coverage["value"]["westlimit"],
+                "min_y": coverage["value"]["southlimit"],
+                "max_x": coverage["value"]["eastlimit"],
+                "max_y": coverage["value"]["northlimit"],
+            }
+
+    return {
+        "resourceTitle": sysmeta["resource_title"],
+        "resourceAbstract": sysmeta["abstract"],
+        "creator": sysmeta["creator"],
+        "dateCreated": sysmeta["date_created"],
+        "lastUpdated": sysmeta["date_last_updated"],
+        "resourceId": resource_id,
+        "resourceLink": sysmeta["resource_url"],
+        "sharingStatus": sharing_status,
+        "resourceType": sysmeta["resource_type"],
+        "boundingBox": bounding_box
+    }
+
+
+def set_resource_version(resource_id, date_last_updated):
+    """
+    Records the last updated date of a resource.
+
+    Cached layer statistics are tied to this date and are reloaded once the
+    resource changes.
+    """
+
+    resource_version_cache.set(resource_id, date_last_updated)
+
+
+def get_resource_version(resource_id):
+    """
+    Gets the last recorded updated date of a resource.
+    """
+
+    return resource_version_cache.get(resource_id)
+
+
+def get_current_resource_version(resource_id):
+    """
+    Gets the version that cached layer data of a resource is stored under.
+
+    Uses the recorded last updated date of the resource, reading it from
+    HydroShare if this worker has not recorded it. Returns None if the date
+    cannot be read, in which case layer data should not be cached.
+    """
+
+    resource_version = get_resource_version(resource_id)
+    if resource_version is None:
+        try:
+            resource_version = get_resource_date(resource_id)
+        except Exception:
+            return None
+        set_resource_version(resource_id, resource_version)
+    return resource_version
+
+
+def get_resource_date(resource_id):
+    """
+    Gets the last updated date of a resource from HydroShare.
+    """
+
+    request_url = f"{hydroshare_url}/hsapi/resource/{resource_id}/sysmeta/"
+    response = upstream.get(request_url)
+    response.raise_for_status()
+    return json.loads(response.content)["date_last_updated"]
+
+
+def get_layer_resource_id(layer_code):
+    """
+    Gets the resource ID from a layer code.
+
+    Layer workspaces are named "HS-<resource_id>" or "TS-<resource_id>".
+    """
+
+    return layer_code.split(":")[0][3:]
+
+
+def get_feature_count(layer_code, cql_filter=None):
+    """
+    Gets the number of features in a layer.
+
+    Counts are cached per layer, filter, and resource version. Concurrent
+    requests for an uncached count share a single WFS request.
+    """
+
+    resource_version = get_current_resource_version(get_layer_resource_id(layer_code))
+    if resource_version is None:
+        return fetch_feature_count(layer_code, cql_filter)
+    return feature_count_cache.get_or_set(
+        (layer_code, cql_filter, resource_version),
+        lambda: fetch_feature_count(layer_code, cql_filter)
+    )
+
+
+async def async_get_feature_count(layer_code, cql_filter=None):
+    """
+    Gets the number of features in a layer in an async view.
+
+    Shares the feature count cache with get_feature_count. Concurrent
+    requests for an uncached count share a single WFS request.
+    """
+
+    resource_version = await sync_to_async(get_current_resource_version, thread_sensitive=False)(
+        get_layer_resource_id(layer_code)
+    )
+    if resource_version is None:
+        return await async_fetch_feature_count(layer_code, cql_filter)
+    return await feature_count_cache.async_get_or_set(
+        (layer_code, cql_filter, resource_version),
+        lambda: async_fetch_feature_count(layer_code, cql_filter)
+    )
+
+
+def get_feature_count_params(layer_code, cql_filter=None):
+    """
+    Gets WFS GetFeature parameters for counting the features in a layer.
+
+    Only features matching the CQL filter are counted if one is given.
+    """
+
+    request_params = {
+        "service": "WFS",
+        "version": "1.1.0",
+        "request": "GetFeature",
+        "typeName": layer_code,
+        "resultType": "hits"
+    }
+    if cql_filter is not None:
+        request_params["CQL_FILTER"] = cql_filter
+    return request_params
+
+
+def fetch_feature_count(layer_code, cql_filter=None):
+    """
+    Gets the number of features in a layer from GeoServer.
+    """
+
+    request_url = f"{geoserver_url}/wfs/"
+    response = upstream.get(request_url, params=get_feature_count_params(layer_code, cql_filter))
+    return int(etree.fromstring(response.content).get("numberOfFeatures"))
+
+
+async def async_fetch_feature_count(layer_code, cql_filter=None):
+    """
+    Gets the number of features in a layer from GeoServer without blocking
+    the event loop.
+    """
+
+    request_url = f"{geoserver_url}/wfs/"
+    response = await upstream.async_get(request_url, params=get_feature_count_params(layer_code, cql_filter))
+    return int(etree.fromstring(response.content).get("numberOfFeatures"))
+
+
+def get_timeseries(layer_code, site_code, variable_code):
+    """
+    Gets time series data for a site and variable.
+
+    Series are kept in the app workspace time series store. A stored series
+    is returned as is if it was checked within the refresh interval;
+    otherwise only values newer than its last stored time are downloaded
+    and appended. Concurrent requests for the same series share one
+    download. Returns memory-mapped arrays of epoch millisecond times and
+    float values.
+    """
+
+    series_key = get_series_key(layer_code, site_code, variable_code)
+    timeseries = timeseries_store.read(series_key)
+    if is_timeseries_current(timeseries):
+        metrics.observe_cache("timeseries", True)
+        return timeseries
+    metrics.observe_cache("timeseries", False)
+
+    return timeseries_requests.do(series_key, lambda: update_timeseries(series_key))
+
+
+async def async_get_timeseries(layer_code, site_code, variable_code):
+    """
+    Gets time series data for a site and variable in an async view.
+
+    Works like get_timeseries. New values are downloaded without blocking
+    the event loop, while reading, parsing, and storing the series run on
+    worker threads.
+    """
+
+    series_key = get_series_key(layer_code, site_code, variable_code)
+    timeseries = await sync_to_async(timeseries_store.read, thread_sensitive=False)(series_key)
+    if is_timeseries_current(timeseries):
+        metrics.observe_cache("timeseries", True)
+        return timeseries
+    metrics.observe_cache("timeseries", False)
+
+    return await async_timeseries_requests.do(series_key, lambda: async_update_timeseries(series_key, timeseries))
+
+
+def is_timeseries_current(timeseries):
+    """
+    Checks whether a stored time series was checked within the refresh
+    interval.
+    """
+
+    return timeseries is not None and time.time() - timeseries["checked"] < timeseries_refresh_interval
+
+
+def get_series_key(layer_code, site_code, variable_code):
+    """
+    Gets the time series store key for a site and variable.
+
+    Time series layers are named "TS-<network_id>:<database_id>".
+    """
+
+    network_id = layer_code.split(":")[0].split("-")[1]
+    database_id = ":".join(layer_code.split(":")[1:])
+    return network_id, database_id, site_code, variable_code
+
+
+def update_timeseries(series_key):
+    """
+    Downloads new values for a stored time series.
+
+    Appends the values after the series' last stored time to the time
+    series store and returns the updated series. With a shared cache, one
+    worker process updates a series at a time, and the others read the
+    values it stored.
+    """
+
+    with timeseries_lock.hold(series_key, lambda: is_timeseries_current(timeseries_store.read(series_key))):
+        timeseries = timeseries_store.read(series_key)
+        if is_timeseries_current(timeseries):
+            return timeseries
+        network_id, database_id, site_code, variable_code = series_key
+        start_time = timeseries["last_time"] if timeseries is not None else None
+        new_timeseries = fetch_timeseries(network_id, database_id, site_code, variable_code, start_time)
+        return store_timeseries(series_key, new_timeseries)
+
+
+async def async_update_timeseries(series_key, timeseries):
+    """
+    Downloads new values for a stored time series without blocking the
+    event loop.
+
+    The WaterML response is spooled to a temporary file, then parsed and
+    appended to the time series store on worker threads.
+    """
+
+    network_id, database_id, site_code, variable_code = series_key
+    start_time = timeseries["last_time"] if timeseries is not None else None
+    request_url, request_params = get_timeseries_request(network_id, database_id, site_code, variable_code, start_time)
+    with tempfile.SpooledTemporaryFile(max_size=waterml_spool_size) as waterml_file:
+        await upstream.async_download(request_url, waterml_file, params=request_params)
+        waterml_file.seek(0)
+        new_timeseries = await sync_to_async(parse_waterml, thread_sensitive=False)(waterml_file)
+    return await sync_to_async(store_timeseries, thread_sensitive=False)(series_key, new_timeseries)
+
+
+def store_timeseries(series_key, new_timeseries):
+    """
+    Appends downloaded time series values to the time series store.
+
+    Returns the updated series. If the series is evicted by another request
+    before it can be read back, the downloaded values are returned instead.
+    """
+
+    checked = time.time()
+    timeseries_store.append(
+        series_key,
+        new_timeseries["times"],
+        new_timeseries["values"],
+        new_timeseries["no_data_value"],
+        new_timeseries["unit_name"],
+        checked
+    )
+
+    timeseries = timeseries_store.read(series_key)
+    if timeseries is None:
+        times = new_timeseries["times"]
+        timeseries = dict(
+            new_timeseries,
+            length=int(times.size),
+            last_time=int(times[-1]) if times.size else None,
+            checked=checked
+        )
+    return timeseries
+
+
+def get_timeseries_list(layer_code, series_codes):
+    """
+    Gets time series data for several sites and variables.
+
+    Series are loaded concurrently on a shared, bounded worker pool, and
+    requests for a series that is already being downloaded wait for that
+    download. Returns a list of (timeseries, error) pairs in request order.
+    """
+
+    futures = [
+        metrics.submit(timeseries_executor, get_timeseries, layer_code, site_code, variable_code)
+        for site_code, variable_code in series_codes
+    ]
+    results = []
+    for future in futures:
+        try:
+            results.append((future.result(), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+def fetch_timeseries(network_id, database_id, site_code, variable_code, start_time=None):
+    """
+    Downloads time series data for a site and variable from HydroServer.
+
+    Streams the WaterML response into columnar arrays of epoch millisecond
+    times and float values. If a start time is given, only values after it
+    are requested.
+    """
+
+    request_url, params = get_timeseries_request(network_id, database_id, site_code, variable_code, start_time)
+    with upstream.get(request_url, params=params, stream=True) as response:
+        response.raw.decode_content = True
+        return parse_waterml(response.raw)
+
+
+def get_timeseries_request(network_id, database_id, site_code, variable_code, start_time=None):
+    """
+    Gets the HydroServer URL and parameters for a time series values request.
+
+    If a start time is given, only values after it are requested.
+    """
+
+    request_url = f"{hydroserver_url}/wof/{network_id}/{database_id}/values/"
+    params = {
+        "site_code": site_code,
+        "variable_code": variable_code
+    }
+    if start_time is not None:
+        params["start_date"] = datetime.fromtimestamp((start_time + 1) / 1000, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    return request_url, params
+
+
+def get_resource_list(search_value, start, length):
+    """
+    Gets a window of the HydroShare resource list.
+
+    Fetches only the upstream pages that overlap the requested rows. Pages
+    are cached per search value and page size, and the page following the
+    window is prefetched in the background. Returns the total number of
+    matching resources and a list of [type, title, id] rows.
+    """
+
+    first_page = start // length + 1
+    last_page = (start + length - 1) // length + 1
+
+    records = 0
+    data = []
+    for page in range(first_page, last_page + 1):
+        resource_page = get_resource_page(search_value, length, page)
+        records = resource_page["count"] if page == first_page else records
+        data.extend(resource_page["results"])
+    offset = start - (first_page - 1) * length
+    data = data[offset:offset + length]
+
+    if last_page * length < records:
+        prefetch_resource_page(search_value, length, last_page + 1)
+
+    return records, data
+
+
+def get_resource_page(search_value, count, page):
+    """
+    Gets a cached page of the HydroShare resource list.
+
+    Pages past the end of the list and failed requests are returned as
+    empty pages and are not cached.
+    """
+
+    resource_page = resource_page_cache.get((search_value, count, page))
+    if resource_page is not None:
+        return resource_page
+
+    request_url = f"{hydroshare_url}/hsapi/resource"
+    params = {
+        "page": page,
+        "count": count
+    }
+    if search_value:
+        params["full_text_search"] = search_value
+    response = upstream.get(request_url, params=params)
+    if not response.ok:
+        return {"count": 0, "results": []}
+    results = json.loads(response.content)
+    resource_page = {
+        "count": results.get("count", 0),
+        "results": [[i["resource_type"], i["resource_title"], i["resource_id"]] for i in results.get("results", [])]
+    }
+    resource_page_cache.set((search_value, count, page), resource_page)
+
+    return resource_page
+
+
+def prefetch_resource_page(search_value, count, page):
+    """
+    Loads a page of the HydroShare resource list in the background.
+    """
+
+    page_key = (search_value, count, page)
+    with prefetching_pages_lock:
+        if page_key in prefetching_pages:
+            return
+        prefetching_pages.add(page_key)
+
+    def prefetch():
+        try:
+            get_resource_page(search_value, count, page)
+        finally:
+            with prefetching_pages_lock:
+                prefetching_pages.discard(page_key)
+
+    background_executor.submit(prefetch)
+
+
+def save_workspace_snapshot(workspace_path, layers):
+    """
+    Saves a snapshot of a user's workspace.
+
+    layers are the workspace layers in display order with their metadata
+    and settings. Each layer's lastUpdated is the last updated date of its
+    resource when the client loaded the layer's metadata. If a resource's
+    layers were loaded at different dates, or a date is missing, no date is
+    saved for it, so its layers are discovered again when they are restored.
+    """
+
+    if max_layers and len(layers) > int(max_layers):
+        raise ValueError(f"Workspaces are limited to {max_layers} layers.")
+    resource_versions = {}
+    for layer in layers:
+        layer["resourceId"] = get_layer_resource_id(layer["layerCode"])
+        resource_version = resource_versions.setdefault(layer["resourceId"], layer.get("lastUpdated"))
+        if resource_version != layer.get("lastUpdated"):
+            resource_versions[layer["resourceId"]] = None
+    write_workspace_snapshot(
+        os.path.join(workspace_path, workspace_snapshot_name),
+        build_workspace_snapshot(layers, resource_versions)
+    )
+
+
+def restore_workspace_snapshot(workspace_path):
+    """
+    Restores a user's workspace from its snapshot.
+
+    The last updated dates of the snapshot's resources are checked
+    concurrently. Layers of unchanged resources are restored from the
+    snapshot without discovery. Resources that changed are discovered
+    again, and their layers get the new metadata with the saved settings.
+    Layers are only dropped if their resource was discovered and no longer
+    has them; if a resource's date can not be read or a layer fails to
+    load, the saved layer is restored as it is. Each layer's lastUpdated
+    is set to the date its metadata belongs to. Returns the layers in
+    display order and a list of layers that could not be loaded.
+    """
+
+    snapshot = read_workspace_snapshot(os.path.join(workspace_path, workspace_snapshot_name))
+    if snapshot is None:
+        return [], []
+
+    layer_errors = []
+    resource_layers = {}
+    resource_errors = {}
+    with ThreadPoolExecutor(max_workers=discovery_workers) as executor:
+        date_futures = [
+            (resource_id, saved_date, metrics.submit(executor, get_resource_date, resource_id))
+            for resource_id, saved_date in snapshot["resources"].items()
+        ]
+        for resource_id, saved_date, date_future in date_futures:
+            try:
+                date_last_updated = date_future.result()
+            except Exception as e:
+                layer_errors.append({
+                    "layerCode": f"HS-{resource_id}",
+                    "error": f"Unable to load resource: {e}"
+                })
+                continue
+            set_resource_version(resource_id, date_last_updated)
+            if date_last_updated != saved_date:
+                layer_list, layer_load_errors = get_resource_layers(resource_id, date_last_updated)
+                resource_layers[resource_id] = (date_last_updated, {layer["layerCode"]: layer for layer in layer_list})
+                resource_errors[resource_id] = {i["layerCode"] for i in layer_load_errors}
+                layer_errors.extend(layer_load_errors)
+
+    layer_list = []
+    for saved_layer in snapshot["layers"]:
+        resource_id = saved_layer["resourceId"]
+        saved_date = snapshot["resources"].get(resource_id)
+        date_last_updated, layers = resource_layers.get(resource_id, (saved_date, None))
+        if layers is not None and saved_layer["layerCode"] in layers:
+            layer = merge_snapshot_layer(saved_layer, layers[saved_layer["layerCode"]])
+            layer_list.append(dict(layer, lastUpdated=date_last_updated))
+        elif layers is None or saved_layer["layerCode"] in resource_errors[resource_id]:
+            layer_list.append(dict(saved_layer, layerVisible=saved_layer.get("layerVisible", True), lastUpdated=saved_date))
+        else:
+            layer_errors.append({
+                "layerCode": saved_layer["layerCode"],
+                "error": "Layer is no longer part of its resource."
+            })
+
+    return layer_list, layer_errors
+
+
+def record_resource_view(resource_id):
+    """
+    Counts a view of a resource.
+
+    View counts decide which resources are pre-warmed. With a shared cache,
+    each resource's count is a separate key in the shared backend that is
+    incremented atomically, so views made at the same time in different
+    worker processes are all counted. Without one, counts are kept in this
+    worker process. Up to viewed_resource_limit resources are counted.
+    """
+
+    shared = resource_view_cache.get_shared()
+    if shared is None:
+        with resource_views_lock:
+            resource_views[resource_id] = resource_views.get(resource_id, 0) + 1
+            if len(resource_views) > viewed_resource_limit:
+                del resource_views[min((i for i in resource_views if i != resource_id), key=resource_views.get)]
+        return
+    view_key = resource_view_cache.get_key(resource_id)
+    if shared.add(view_key, 1, resource_view_cache.ttl):
+        add_viewed_resource(shared, resource_id)
+        return
+    try:
+        shared.incr(view_key)
+    except ValueError:
+        pass
+
+
+def add_viewed_resource(shared, resource_id):
+    """
+    Adds a resource to the list of viewed resources in the shared cache.
+
+    Only called on a resource's first counted view. Once the list is full,
+    the least viewed other resource is dropped from it.
+    """
+
+    list_key = resource_view_cache.get_key("resources")
+    resource_ids = [i for i in shared.get(list_key) or [] if i != resource_id] + [resource_id]
+    if len(resource_ids) > viewed_resource_limit:
+        view_counts = get_view_counts(shared, resource_ids[:-1])
+        resource_ids.remove(min(view_counts, key=view_counts.get))
+    shared.set(list_key, resource_ids, resource_view_cache.ttl)
+
+
+def get_view_counts(shared, resource_ids):
+    """
+    Gets the view counts of resources from the shared cache.
+    """
+
+    view_counts = shared.get_many([resource_view_cache.get_key(i) for i in resource_ids])
+    return {i: view_counts.get(resource_view_cache.get_key(i), 0) for i in resource_ids}
+
+
+def get_viewed_resources(count):
+    """
+    Gets the IDs of the most viewed resources.
+    """
+
+    shared = resource_view_cache.get_shared()
+    if shared is None:
+        with resource_views_lock:
+            view_counts = dict(resource_views)
+    else:
+        view_counts = get_view_counts(shared, shared.get(resource_view_cache.get_key("resources")) or [])
+    return sorted(view_counts, key=view_counts.get, reverse=True)[:count]
+
+
+def get_recent_resources(count):
+    """
+    Gets the IDs of the most recently updated resources.
+
+    Lists resources updated in the last recent_resource_days days from
+    HydroShare, newest first.
+    """
+
+    request_url = f"{hydroshare_url}/hsapi/resource"
+    params = {
+        "page": 1,
+        "count": 100,
+        "from_date": (datetime.now(timezone.utc) - timedelta(days=recent_resource_days)).date().isoformat()
+    }
+    response = upstream.get(request_url, params=params)
+    response.raise_for_status()
+    results = json.loads(response.content).get("results", [])
+    results.sort(key=lambda i: i.get("date_last_updated") or "", reverse=True)
+    return [i["resource_id"] for i in results[:count]]
+
+
+def warm_resource(resource_id):
+    """
+    Loads a resource's layer metadata into the caches.
+
+    Fills the layer cache, including raster statistics, and the feature
+    count and field statistics caches of the resource's vector layers.
+    Returns the number of layers and a list of layers that failed to load.
+    """
+
+    date_last_updated = get_resource_date(resource_id)
+    set_resource_version(resource_id, date_last_updated)
+    layer_list, layer_errors = get_resource_layers(resource_id, date_last_updated)
+
+    for layer in layer_list:
+        if layer["layerType"] not in ("point", "line", "polygon"):
+            continue
+        try:
+            get_feature_count(layer["layerCode"])
+            get_layer_field_stats(layer["layerCode"])
+        except Exception as e:
+            layer_errors.append({
+                "layerCode": layer["layerCode"],
+                "error": f"Unable to load layer statistics: {e}"
+            })
+
+    return len(layer_list), layer_errors
+
+
+def prewarm_resources(resource_count=None, max_requests=None, rate=None):
+    """
+    Loads the metadata of popular and recently updated resources into the
+    caches.
+
+    Warms the resource_count most viewed and resource_count most recently
+    updated resources one at a time. All upstream requests, including those
+    of discovery worker threads, share a request budget of max_requests
+    concurrent requests and rate requests per second, so live requests keep
+    most of the upstream capacity. Pre-warming runs as background work, so
+    live requests for the same data load it themselves instead of waiting
+    for the rate limited requests. Returns a list of warmed resources and
+    a list of errors.
+    """
+
+    resource_count = resource_count or prewarm_resource_count
+    budget = upstream.RequestBudget(max_requests or prewarm_concurrency, rate or prewarm_rate)
+    budget_token = upstream.request_budget.set(budget)
+    background_token = background_work.set(True)
+    warmed_resources = []
+    prewarm_errors = []
+    try:
+        resource_ids = get_viewed_resources(resource_count)
+        try:
+            resource_ids += get_recent_resources(resource_count)
+        except Exception as e:
+            prewarm_errors.append({"resourceId": None, "error": f"Unable to list recent resources: {e}"})
+
+        for resource_id in dict.fromkeys(resource_ids):
+            try:
+                layer_count, layer_errors = warm_resource(resource_id)
+            except Exception as e:
+                prewarm_errors.append({"resourceId": resource_id, "error": f"Unable to load resource: {e}"})
+                continue
+            warmed_resources.append({"resourceId": resource_id, "layerCount": layer_count})
+            prewarm_errors.extend({"resourceId": resource_id, **i} for i in layer_errors)
+    finally:
+        background_work.reset(background_token)
+        upstream.request_budget.reset(budget_token)
+
+    return warmed_resources, prewarm_errors
+
+
+def start_prewarmer():
+    """
+    Starts pre-warming the caches periodically in a background thread.
+
+    Does nothing unless the prewarm interval is set or the thread is already
+    running in this worker. The first run starts at a random time within the
+    interval, so workers started together do not pre-warm at the same time.
+    """
+
+    if not prewarm_interval:
+        return
+    with prewarmer_lock:
+        if prewarmer_started.is_set():
+            return
+        prewarmer_started.set()
+
+    def prewarm():
+        time.sleep(random.uniform(0, prewarm_interval))
+        while True:
+            try:
+                prewarm_resources()
+            except Exception:
+                pass
+            time.sleep(prewarm_interval)
+
+    threading.Thread(target=prewarm, name="hydroshare-data-viewer-prewarm", daemon=True).start()
 
 
 def get_layers(resource_id):
@@ -18,94 +937,117 @@ def get_layers(resource_id):
     Get list of layers for a resource.
 
     This function takes a resource ID and retrieves a list of vector, raster,
-    and timeseries layers associated with the resource.
+    and timeseries layers associated with the resource. Capabilities requests
+    and per-layer lookups run concurrently in a bounded worker pool. Layers are
+    returned in capabilities order, and layers that fail to load are returned
+    in a separate error list instead of failing the whole request.
     """
 
     layer_list = []
+    layer_errors = []
 
-    # Get Vector Layers
+    capability_requests = []
     if geoserver_url != "None" and include_feature:
-        request_url = f"{geoserver_url}/wfs/"
-        params = {
-            "service": "WFS",
-            "version": "1.3.0",
-            "request": "getCapabilities",
-            "namespace": "HS-" + resource_id
-        }
-        response = requests.get(request_url, params=params)
-        wfs_capabilities = etree.fromstring(response.content)
-        wfs_layer_list = list(wfs_capabilities.iter("{http://www.opengis.net/wfs}FeatureType"))
-        for wfs_layer in wfs_layer_list:
-            wfs_layer_code = wfs_layer.find("{http://www.opengis.net/wfs}Name").text
-            request_url = f"{geoserver_url}/rest/layers/{wfs_layer_code}.json"
-            response = requests.get(request_url)
-            layer_type = json.loads(response.content)["layer"]["defaultStyle"]["name"]
-            layer_fields = get_layer_fields(layer_type, wfs_layer_code, resource_id)
-            layer_list.append({
-                "layerCode": wfs_layer_code,
-                "layerName": ":".join(wfs_layer_code.split(":")[1:]),
-                "resourceId": resource_id,
-                "layerCoverage": get_layer_coverage(layer_type, wfs_layer),
-                "layerType": layer_type,
-                "layerFields": layer_fields,
-                "layerSymbology": get_layer_symbology(layer_type, layer_fields),
-                "layerVisible": True,
-                "layerOrder": 0
-            })
-
-    # Get Raster Layers
+        capability_requests.append(("vector", "HS-" + resource_id))
     if geoserver_url != "None" and include_raster:
+        capability_requests.append(("raster", "HS-" + resource_id))
+    if hydroserver_url != "None" and geoserver_url != "None" and include_timeseries:
+        capability_requests.append(("timeseries", "TS-" + resource_id))
+
+    with ThreadPoolExecutor(max_workers=discovery_workers) as executor:
+
+        # Get Capabilities
+        capability_futures = [
+            (layer_class, namespace, metrics.submit(executor, get_capabilities, layer_class, namespace))
+            for layer_class, namespace in capability_requests
+        ]
+
+        # Get Layer Metadata
+        layer_futures = []
+        for layer_class, namespace, capability_future in capability_futures:
+            try:
+                capability_layers = capability_future.result()
+            except Exception as e:
+                layer_errors.append({
+                    "layerCode": namespace,
+                    "error": f"Unable to load {layer_class} layers: {e}"
+                })
+                continue
+            for layer_code, layer_response in capability_layers:
+                if layer_class == "vector":
+                    type_future = metrics.submit(executor, get_layer_type, layer_code)
+                else:
+                    type_future = None
+                fields_future = metrics.submit(executor, get_layer_fields, layer_class, layer_code, resource_id)
+                layer_futures.append((layer_class, layer_code, layer_response, type_future, fields_future))
+
+        for layer_class, layer_code, layer_response, type_future, fields_future in layer_futures:
+            try:
+                layer_type = type_future.result() if type_future else layer_class
+                layer_fields = fields_future.result()
+                layer = {
+                    "layerCode": layer_code,
+                    "layerName": ":".join(layer_code.split(":")[1:]),
+                    "resourceId": resource_id,
+                    "layerCoverage": get_layer_coverage(layer_type, layer_response),
+                    "layerType": layer_type,
+                    "layerFields": layer_fields,
+                    "layerSymbology": get_layer_symbology(layer_type, layer_fields),
+                    "layerVisible": True
+                }
+            except Exception as e:
+                layer_errors.append({
+                    "layerCode": layer_code,
+                    "error": f"Unable to load layer: {e}"
+                })
+                continue
+            if layer_class == "vector":
+                layer["layerOrder"] = 0
+            layer_list.append(layer)
+
+    return layer_list, layer_errors
+
+
+def get_capabilities(layer_class, namespace):
+    """
+    Gets capabilities for a layer namespace.
+
+    Returns a list of (layer code, capabilities element) pairs for the
+    vector, raster, or timeseries layers published under a namespace.
+    """
+
+    if layer_class == "raster":
         request_url = f"{geoserver_url}/wcs/"
         params = {
             "service": "WCS",
             "version": "1.1.1",
             "request": "getCapabilities",
-            "namespace": "HS-" + resource_id
+            "namespace": namespace
         }
-        response = requests.get(request_url, params=params)
-        wcs_capabilities = etree.fromstring(response.content)
-        wcs_layer_list = list(wcs_capabilities.iter("{http://www.opengis.net/wcs/1.1.1}CoverageSummary"))
-        for wcs_layer in wcs_layer_list:
-            wcs_layer_code = wcs_layer.find("{http://www.opengis.net/wcs/1.1.1}Identifier").text
-            layer_fields = get_layer_fields("raster", wcs_layer_code, resource_id)
-            layer_list.append({
-                "layerCode": wcs_layer_code,
-                "layerName": ":".join(wcs_layer_code.split(":")[1:]),
-                "resourceId": resource_id,
-                "layerCoverage": get_layer_coverage("raster", wcs_layer),
-                "layerType": "raster",
-                "layerFields": layer_fields,
-                "layerSymbology": get_layer_symbology("raster", layer_fields),
-                "layerVisible": True
-            })
-
-    # Get Time Series Layers
-    if hydroserver_url != "None" and geoserver_url != "None" and include_timeseries:
+        response = upstream.get(request_url, params=params)
+        return parse_wcs_capabilities(response.content)
+    else:
         request_url = f"{geoserver_url}/wfs/"
         params = {
             "service": "WFS",
             "version": "1.3.0",
             "request": "getCapabilities",
-            "namespace": "TS-" + resource_id
+            "namespace": namespace
         }
-        response = requests.get(request_url, params=params)
-        wfs_capabilities = etree.fromstring(response.content)
-        wfs_layer_list = list(wfs_capabilities.iter("{http://www.opengis.net/wfs}FeatureType"))
-        for wfs_layer in wfs_layer_list:
-            wfs_layer_code = wfs_layer.find("{http://www.opengis.net/wfs}Name").text
-            layer_fields = get_layer_fields("timeseries", wfs_layer_code, resource_id)
-            layer_list.append({
-                "layerCode": wfs_layer_code,
-                "layerName": ":".join(wfs_layer_code.split(":")[1:]),
-                "resourceId": resource_id,
-                "layerCoverage": get_layer_coverage("timeseries", wfs_layer),
-                "layerType": "timeseries",
-                "layerFields": layer_fields,
-                "layerSymbology": get_layer_symbology("timeseries", layer_fields),
-                "layerVisible": True
-            })
+        response = upstream.get(request_url, params=params)
+        return parse_wfs_capabilities(response.content)
 
-    return layer_list
+
+def get_layer_type(layer_code):
+    """
+    Gets the geometry type of a vector layer.
+
+    Reads the name of the layer's default style from the GeoServer REST API.
+    """
+
+    request_url = f"{geoserver_url}/rest/layers/{layer_code}.json"
+    response = upstream.get(request_url)
+    return json.loads(response.content)["layer"]["defaultStyle"]["name"]
 
 
 def get_layer_fields(layer_type, layer_code, resource_id):
@@ -123,12 +1065,7 @@ def get_layer_fields(layer_type, layer_code, resource_id):
         }]
     else:
         request_url = f"{geoserver_url}/wfs/?service=WFS&request=describeFeatureType&version=1.1.0&typename={layer_code}"
-        response = next(etree.fromstring(requests.get(request_url).content).iter("{http://www.w3.org/2001/XMLSchema}sequence"))
-        return [{
-            "fieldName": i.get("name"),
-            "fieldType": "numerical" if i.get("type") in ("xsd:long", "xsd:int", "xsd:double", "xsd:float") else "categorical",
-            "fieldStats": None
-        } for i in list(response.iter("{http://www.w3.org/2001/XMLSchema}element"))[1:]]
+        return parse_feature_type_fields(upstream.get(request_url).content)
 
 
 def get_field_stats(layer_type, layer_code, resource_id, field_name, field_type):
@@ -136,56 +1073,409 @@ def get_field_stats(layer_type, layer_code, resource_id, field_name, field_type)
     Gets statistics for a field.
 
     Determines field statistics for vector layers and coverage
-    statistics for raster layers.
+    statistics for raster layers. Returns None for fields without numeric
+    statistics, such as categorical fields.
     """
 
     if layer_type == "raster":
-        request_url = f"{geoserver_url}/rest/workspaces/{'HS-' + resource_id}/styles/{':'.join(layer_code.split(':')[1:])}.sld"
-        response = requests.get(request_url)
-        root = etree.fromstring(response.content)
-        layer_raster_stats = list(root.iter("{http://www.opengis.net/sld}ColorMapEntry"))
-        if len(layer_raster_stats) == 3:
-            return {
-                "min": float(layer_raster_stats[1].attrib["quantity"]),
-                "max": float(layer_raster_stats[2].attrib["quantity"]),
-                "ndv": float(layer_raster_stats[0].attrib["quantity"])
-            }
-        else:
-            return {
-                "min": float(layer_raster_stats[0].attrib["quantity"]),
-                "max": float(layer_raster_stats[1].attrib["quantity"]),
-            }
+        return get_raster_stats(layer_code)
     else:
-        request_url = f"{geoserver_url}/wfs?service=WFS&version=1.1.0&request=GetFeature&typename={layer_code}&maxFeatures=1&sortBy={field_name}+D&propertyName={field_name}"
-        response = requests.get(request_url)
-        max_value = str(response.content).split(f"{layer_code.split(':')[0]}:{field_name}")[1][1:-2]
-        request_url = f"{geoserver_url}/wfs?service=WFS&version=1.1.0&request=GetFeature&typename={layer_code}&maxFeatures=1&sortBy={field_name}+A&propertyName={field_name}"
-        response = requests.get(request_url)
-        min_value = str(response.content).split(f"{layer_code.split(':')[0]}:{field_name}")[1][1:-2]
-        return {
-            "min": float(min_value),
-            "max": float(max_value)
-        }
+        return get_layer_field_stats(layer_code).get(field_name)
 
 
-def get_layer_coverage(layer_type, layer_response):
+def get_field_classes(layer_code, field_name, field_type, method, class_count):
     """
-    Gets coverage for a layer.
+    Gets classes for a layer field.
 
-    Determines the bounding box for vector and
-    raster layers.
+    Returns equal interval, quantile, or natural breaks (Jenks) class breaks
+    for numeric fields, and the most common values with their counts for
+    categorical fields. Results are cached per layer, field, method, class
+    count, and resource version.
     """
 
-    if layer_type == "raster":
-        ns = "{http://www.opengis.net/ows/1.1}"
-    else:
-        ns = "{http://www.opengis.net/ows}"
-    return {
-        "maxX": float(next(layer_response.iter(f"{ns}UpperCorner")).text.split(" ")[0]),
-        "maxY": float(next(layer_response.iter(f"{ns}UpperCorner")).text.split(" ")[1]),
-        "minX": float(next(layer_response.iter(f"{ns}LowerCorner")).text.split(" ")[0]),
-        "minY": float(next(layer_response.iter(f"{ns}LowerCorner")).text.split(" ")[1])
+    if field_type != "numerical":
+        method, class_count = "categories", None
+    resource_version = get_current_resource_version(get_layer_resource_id(layer_code))
+    if resource_version is None:
+        return fetch_field_classes(layer_code, field_name, field_type, method, class_count)
+    return field_classes_cache.get_or_set(
+        (layer_code, field_name, method, class_count, resource_version),
+        lambda: fetch_field_classes(layer_code, field_name, field_type, method, class_count)
+    )
+
+
+def fetch_field_classes(layer_code, field_name, field_type, method, class_count):
+    """
+    Computes classes for a layer field.
+
+    Streams the field's values with WFS in a single pass, keeping a bounded
+    summary of the field, then computes the classes from the summary. If a
+    categorical field has too many values to count them all, the most
+    common values are counted exactly in a second pass.
+    """
+
+    field_classifier = FieldClassifier(field_name, field_type)
+    for features in get_layer_feature_pages(layer_code, [field_name]):
+        field_classifier.update(features)
+    if field_classifier.truncated:
+        field_classifier.recount(get_layer_feature_pages(layer_code, [field_name]))
+    return field_classifier.result(method, class_count)
+
+
+def get_raster_stats(layer_code):
+    """
+    Gets statistics for a raster layer's values.
+
+    Statistics are cached per layer and resource version. Concurrent
+    requests for the same layer share a single coverage download.
+    """
+
+    resource_version = get_current_resource_version(get_layer_resource_id(layer_code))
+    if resource_version is None:
+        return fetch_raster_stats(layer_code)
+    return field_stats_cache.get_or_set(
+        ("raster", layer_code, resource_version),
+        lambda: fetch_raster_stats(layer_code)
+    )
+
+
+def fetch_raster_stats(layer_code):
+    """
+    Computes statistics for a raster layer's values.
+
+    Reads the coverage's native extent and grid size with WCS
+    DescribeCoverage, then streams the coverage as an ASCII grid resampled
+    to at most raster_stats_size cells on each side. Returns min, max,
+    mean, standard deviation, 2nd and 98th percentiles, and a histogram of
+    the values, with no data cells masked.
+    """
+
+    wcs = "{http://www.opengis.net/wcs}"
+    gml = "{http://www.opengis.net/gml}"
+    request_url = f"{geoserver_url}/wcs"
+    request_params = {
+        "service": "WCS",
+        "version": "1.0.0",
+        "request": "DescribeCoverage",
+        "coverage": layer_code
+    }
+    response = upstream.get(request_url, params=request_params)
+    coverage = etree.fromstring(response.content)
+
+    grid = next(coverage.iter(f"{gml}RectifiedGrid"))
+    crs = grid.get("srsName")
+    envelope = next(
+        (i for i in coverage.iter(f"{gml}Envelope") if i.get("srsName") == crs),
+        next(coverage.iter(f"{wcs}lonLatEnvelope"))
+    )
+    if envelope.tag == f"{wcs}lonLatEnvelope":
+        crs = "EPSG:4326"
+    lower, upper = [[float(j) for j in i.text.split()] for i in envelope.iter(f"{gml}pos")]
+    grid_low = [int(i) for i in next(grid.iter(f"{gml}low")).text.split()]
+    grid_high = [int(i) for i in next(grid.iter(f"{gml}high")).text.split()]
+    width, height = grid_high[0] - grid_low[0] + 1, grid_high[1] - grid_low[1] + 1
+    scale = min(1, raster_stats_size / max(width, height))
+    null_value = next(coverage.iter(f"{wcs}singleValue"), None)
+
+    request_params = {
+        "service": "WCS",
+        "version": "1.0.0",
+        "request": "GetCoverage",
+        "coverage": layer_code,
+        "crs": crs,
+        "bbox": f"{lower[0]},{lower[1]},{upper[0]},{upper[1]}",
+        "width": max(1, round(width * scale)),
+        "height": max(1, round(height * scale)),
+        "format": "ArcGrid"
     }
+    response = upstream.get(request_url, params=request_params, stream=True)
+    response.raise_for_status()
+    values, no_data_value = parse_ascii_grid(response.iter_lines(chunk_size=65536))
+    if no_data_value is None and null_value is not None:
+        no_data_value = float(null_value.text)
+
+    return get_raster_statistics(values, no_data_value)
+
+
+def get_layer_field_stats(layer_code):
+    """
+    Gets statistics for all numeric fields of a vector layer.
+
+    Statistics are cached per layer and resource version. Concurrent
+    requests for the same layer share a single pass over its features.
+    """
+
+    resource_version = get_current_resource_version(get_layer_resource_id(layer_code))
+    if resource_version is None:
+        return fetch_layer_field_stats(layer_code)
+    return field_stats_cache.get_or_set(
+        (layer_code, resource_version),
+        lambda: fetch_layer_field_stats(layer_code)
+    )
+
+
+def fetch_layer_field_stats(layer_code):
+    """
+    Computes statistics for all numeric fields of a vector layer.
+
+    Pages through the layer's numeric attributes with WFS and computes min,
+    max, count, null count, and mean for every field in a single pass.
+    """
+
+    layer_fields = get_layer_fields("vector", layer_code, get_layer_resource_id(layer_code))
+    field_names = [i["fieldName"] for i in layer_fields if i["fieldType"] == "numerical"]
+    field_statistics = FieldStatistics(field_names)
+
+    start = 0
+    while field_names:
+        request_url = f"{geoserver_url}/wfs/"
+        request_params = {
+            "service": "WFS",
+            "version": "1.3.0",
+            "request": "GetFeature",
+            "typeName": layer_code,
+            "propertyName": ",".join(field_names),
+            "outputFormat": "application/json",
+            "startIndex": start,
+            "count": stats_page_size
+        }
+        response = upstream.get(request_url, params=request_params)
+        features = json.loads(response.content)["features"]
+        field_statistics.update(features)
+        if len(features) < stats_page_size:
+            break
+        start += stats_page_size
+
+    return field_statistics.result()
+
+
+def get_layer_feature_pages(layer_code, property_names=None):
+    """
+    Gets all features of a layer, one page at a time.
+
+    Yields pages of GeoJSON features from WFS in layer order. The next page
+    is requested in the background while the current page is being used,
+    and only these two pages are held in memory.
+    """
+
+    def fetch_page(start):
+        request_url = f"{geoserver_url}/wfs/"
+        request_params = {
+            "service": "WFS",
+            "version": "1.3.0",
+            "request": "GetFeature",
+            "typeName": layer_code,
+            "outputFormat": "application/json",
+            "startIndex": start,
+            "count": export_page_size
+        }
+        if property_names is not None:
+            request_params["propertyName"] = ",".join(property_names)
+        response = upstream.get(request_url, params=request_params)
+        return json.loads(response.content)["features"]
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        start = 0
+        next_page = metrics.submit(executor, fetch_page, start)
+        while next_page is not None:
+            features = next_page.result()
+            if len(features) == export_page_size:
+                start += export_page_size
+                next_page = metrics.submit(executor, fetch_page, start)
+            else:
+                next_page = None
+            yield features
+
+
+def register_style(style_name, sld_body):
+    """
+    Creates a global GeoServer style from an SLD document.
+
+    Style names are content hashes, so a style that already exists (e.g.
+    registered by another worker) already has this content.
+    """
+
+    request_url = f"{geoserver_url}/rest/styles"
+    response = upstream.request(
+        "POST",
+        request_url,
+        params={"name": style_name},
+        data=sld_body.encode("utf-8"),
+        headers={"Content-Type": "application/vnd.ogc.sld+xml"},
+        auth=(geoserver_username, geoserver_password)
+    )
+    if not response.ok and not upstream.get(f"{request_url}/{style_name}.sld", auth=(geoserver_username, geoserver_password)).ok:
+        response.raise_for_status()
+
+
+def delete_style(style_name):
+    """
+    Deletes a global GeoServer style.
+    """
+
+    upstream.request(
+        "DELETE",
+        f"{geoserver_url}/rest/styles/{style_name}",
+        params={"purge": "true"},
+        auth=(geoserver_username, geoserver_password)
+    )
+
+
+def record_style_use(style_name):
+    """
+    Records in the shared cache that a style is in use.
+
+    Usage is only kept in the shared backend, which every worker reads, and
+    expires after style_max_idle seconds. Returns False if the style had
+    not been used within that time and may have been deleted. Without a
+    shared cache, styles are never deleted and True is returned.
+    """
+
+    shared = style_usage_cache.get_shared()
+    if shared is None:
+        return True
+    usage_key = style_usage_cache.get_key(style_name)
+    recently_used = shared.get(usage_key) is not None
+    shared.set(usage_key, time.time(), style_max_idle)
+    return recently_used
+
+
+def collect_styles():
+    """
+    Deletes app styles that no worker has used recently from GeoServer.
+
+    Lists the styles on GeoServer, so styles registered before a restart
+    are collected too, and deletes the app's styles without a usage record
+    in the shared cache. Without a shared cache no worker can tell whether
+    another one still uses a style, so nothing is deleted.
+    """
+
+    shared = style_usage_cache.get_shared()
+    if shared is None:
+        return
+    response = upstream.get(f"{geoserver_url}/rest/styles.json", auth=(geoserver_username, geoserver_password))
+    response.raise_for_status()
+    styles = json.loads(response.content)["styles"] or {}
+    for style in styles.get("style", []):
+        style_name = style["name"]
+        if style_name.startswith(style_name_prefix) and shared.get(style_usage_cache.get_key(style_name)) is None:
+            delete_style(style_name)
+
+
+if geoserver_username:
+    style_registry = StyleRegistry(
+        max_styles=app.get_custom_setting("style_cache_size") or 500,
+        collect_interval=style_collect_interval,
+        register=register_style,
+        collect=lambda: background_executor.submit(collect_styles)
+    )
+else:
+    style_registry = None
+
+
+def get_layer_style(layer_code, layer_type, symbology, field_stats=None, highlight=False):
+    """
+    Gets a WMS style for a layer's symbology.
+
+    Builds the layer's SLD and registers it with GeoServer under a name
+    derived from its content, so map requests only pass the style name.
+    Returns the style name, or the SLD document itself if styles can not
+    be registered, along with a style key used by composite map requests.
+    """
+
+    sld_body = build_layer_style(layer_code, layer_type, symbology, field_stats, highlight)
+    style_name = get_style_name(sld_body)
+    if style_registry is None:
+        style_body_cache.set(style_name, sld_body)
+        return {"styleName": None, "styleKey": style_name, "sldBody": sld_body}
+    style_registry.use(style_name, sld_body, registered=record_style_use(style_name))
+    return {"styleName": style_name, "styleKey": style_name, "sldBody": None}
+
+
+def get_tile_bbox(z, x, y):
+    """
+    Gets the EPSG:3857 bounding box of a tile in the XYZ tile grid.
+    """
+
+    tile_extent = 2 * tile_grid_extent / 2 ** z
+    min_x = -tile_grid_extent + x * tile_extent
+    max_y = tile_grid_extent - y * tile_extent
+    return min_x, max_y - tile_extent, min_x + tile_extent, max_y
+
+
+def get_layer_tile(layer_code, style_name, resource_version, z, x, y):
+    """
+    Gets a map tile for a layer and registered style.
+
+    Tiles are served from the app workspace tile cache and rendered by
+    GeoServer WMS on a miss. A layer's cached tiles are dropped when its
+    resource's last updated date changes. If resource_version is None, the
+    tile is rendered without using the tile cache. Concurrent requests for
+    the same missing tile share one GeoServer request. Returns PNG data, or
+    None if GeoServer did not return an image.
+    """
+
+    if resource_version is not None:
+        tile_cache.check_version(layer_code, str(resource_version))
+        data = tile_cache.get(layer_code, style_name, z, x, y)
+        if data is not None:
+            return data
+
+    def fetch_tile():
+        request_url = f"{geoserver_url}/wms"
+        request_params = {
+            "service": "WMS",
+            "version": "1.1.1",
+            "request": "GetMap",
+            "layers": layer_code,
+            "styles": style_name,
+            "srs": "EPSG:3857",
+            "bbox": ",".join(str(i) for i in get_tile_bbox(z, x, y)),
+            "width": tile_size,
+            "height": tile_size,
+            "format": "image/png",
+            "transparent": "true"
+        }
+        response = upstream.get(request_url, params=request_params)
+        if not response.ok or not response.headers.get("Content-Type", "").startswith("image/png"):
+            return None
+        if resource_version is not None:
+            tile_cache.set(layer_code, style_name, z, x, y, response.content)
+        return response.content
+
+    return tile_requests.do((layer_code, style_name, resource_version, z, x, y), fetch_tile)
+
+
+def get_composite_map(layer_codes, style_keys, map_params):
+    """
+    Renders several layers as one map image.
+
+    Layers are drawn in list order with a single WMS GetMap request, using
+    the styles returned by get_layer_style. Unregistered styles are merged
+    into one SLD document. Their SLD is kept in the Shared Cache, or in the
+    app workspace if there is none, so any worker process can render a
+    style built by another. Returns the GeoServer response, or None if a
+    style is no longer known.
+    """
+
+    request_url = f"{geoserver_url}/wms"
+    request_params = dict(map_params, service="WMS", request="GetMap", layers=",".join(layer_codes))
+    if style_registry is not None:
+        request_params["styles"] = ",".join(style_keys)
+        return upstream.get(request_url, params=request_params)
+
+    style_root = None
+    for style_key in style_keys:
+        sld_body = style_body_cache.get(style_key)
+        if sld_body is None:
+            return None
+        sld_root = etree.fromstring(sld_body.encode("utf-8"))
+        if style_root is None:
+            style_root = sld_root
+        else:
+            style_root.extend(list(sld_root.iter("{http://www.opengis.net/sld}NamedLayer")))
+    request_params["sld_body"] = etree.tostring(style_root, encoding="unicode")
+    return upstream.request("POST", request_url, data=request_params)
 
 
 def get_layer_symbology(layer_type, layer_fields):